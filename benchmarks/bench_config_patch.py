@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import json
+import sys
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+# Бенчмарк патча config.xml: синтетические пары YAML/config.xml на 10/1k/10k папок,
+# время парсинга/патча/сериализации и пиковая память (tracemalloc) для WSL и Amvera веток.
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT / "scripts"))
+
+
+def load_module(name: str, path: Path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    assert spec.loader is not None
+    spec.loader.exec_module(module)
+    return module
+
+
+wsl_configure = load_module("wsl_configure", PROJECT_ROOT / "scripts" / "configure_syncthing.py")
+amvera_configure = load_module("amvera_configure", PROJECT_ROOT / "docker" / "configure_syncthing.py")
+
+LOCAL_ID = "LOCALAA-AAAAAAA-AAAAAAA-AAAAAAA-AAAAAAA-AAAAAAA-AAAAAAA-AAAAAAA"
+
+CONFIG_TEMPLATE = """<configuration version="37">
+    <device id="{local_id}" name="local" compression="metadata" introducer="false" skipIntroductionRemovals="false" introducedBy="">
+        <address>dynamic</address>
+    </device>
+{folders}
+{devices}
+    <gui enabled="true" tls="false" debugging="false">
+        <address>127.0.0.1:8384</address>
+        <apikey>bench</apikey>
+    </gui>
+    <options>
+        <startBrowser>true</startBrowser>
+    </options>
+    <defaults>
+        <folder id="" label="" path="~" type="sendreceive" rescanIntervalS="3600" fsWatcherEnabled="true" fsWatcherDelayS="10" ignorePerms="false" autoNormalize="true">
+            <filesystemType>basic</filesystemType>
+            <minDiskFree unit="%">1</minDiskFree>
+            <versioning>
+                <cleanupIntervalS>3600</cleanupIntervalS>
+                <fsPath></fsPath>
+                <fsType>basic</fsType>
+            </versioning>
+            <copiers>0</copiers>
+            <pullerMaxPendingKiB>0</pullerMaxPendingKiB>
+            <hashers>0</hashers>
+            <order>random</order>
+        </folder>
+        <device id="" compression="metadata" introducer="false" skipIntroductionRemovals="false" introducedBy="">
+            <address>dynamic</address>
+            <paused>false</paused>
+        </device>
+    </defaults>
+</configuration>
+"""
+
+
+def device_id(prefix: str, idx: int) -> str:
+    # Синтетический ID в алфавите base32 (A-Z2-7), чтобы проходил parse_device_id_list.
+    alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZ234567"
+    digits = []
+    n = idx
+    for _ in range(7):
+        digits.append(alphabet[n % 32])
+        n //= 32
+    return f"{prefix}-{''.join(digits)}-AAAAAAA-AAAAAAA"
+
+
+def build_pair(n_folders: int, n_devices: int) -> tuple[str, dict, list[str]]:
+    # Половина папок/устройств уже есть в config.xml (обновление), половина — новые.
+    # Плюс n_devices // 4 "чужих" устройств, которые должен вычистить allowlist.
+    remote_ids = [device_id("PEERAAA", i) for i in range(n_devices)]
+    stale_ids = [device_id("STALEAA", i) for i in range(n_devices // 4)]
+    existing_devices = remote_ids[: n_devices // 2] + stale_ids
+    devices_xml = "\n".join(
+        f'    <device id="{did}" name="d{i}" compression="metadata"><address>dynamic</address></device>'
+        for i, did in enumerate(existing_devices)
+    )
+    folders_xml = "\n".join(
+        f'    <folder id="f{i}" label="f{i}" path="/data/sync/f{i}" type="sendreceive">'
+        f'<device id="{LOCAL_ID}" introducedBy=""></device></folder>'
+        for i in range(n_folders // 2)
+    )
+    xml = CONFIG_TEMPLATE.format(local_id=LOCAL_ID, folders=folders_xml, devices=devices_xml)
+
+    presets = [None, {"preset": "small-files-low-latency"}, {"preset": "bulk-throughput"}]
+    folders = []
+    for i in range(n_folders):
+        item = {
+            "id": f"f{i}",
+            "label": f"folder {i}",
+            "type": "sendreceive",
+            "ignore_perms": True,
+            "paths": {"wsl_a": f"/tmp/bench/a/f{i}", "wsl_b": f"/tmp/bench/b/f{i}", "amvera": f"/data/sync/f{i}"},
+        }
+        preset = presets[i % len(presets)]
+        if preset:
+            item["performance"] = preset
+        folders.append(item)
+    cfg = {
+        "nodes": {
+            "wsl_a": {"device_id": LOCAL_ID},
+            "wsl_b": {"device_id": remote_ids[0]},
+            "amvera": {"device_id": remote_ids[1] if n_devices > 1 else remote_ids[0], "performance": {"hashers": 1}},
+        },
+        "defaults": {"performance": {"max_concurrent_writes": 2}},
+        "folders": folders,
+    }
+    return xml, cfg, remote_ids
+
+
+def patch_once(xml: str, cfg: dict, remote_ids: list[str], node: str) -> tuple[list[float], int]:
+    t0 = time.perf_counter()
+    root = ET.fromstring(xml)
+    t1 = time.perf_counter()
+    if node == "amvera":
+        amvera_configure.patch_config(
+            root,
+            cfg,
+            remote_ids=remote_ids,
+            versioning_type="simple",
+            versioning_keep=3,
+            versioning_cleanout_days=30,
+            create_dirs=False,
+        )
+    else:
+        wsl_configure.patch_config(root, cfg, node, create_dirs=False)
+    t2 = time.perf_counter()
+    ET.indent(root, space="    ")
+    out = ET.tostring(root, encoding="utf-8")
+    t3 = time.perf_counter()
+    return [t1 - t0, t2 - t1, t3 - t2], len(out)
+
+
+def run_case(xml: str, cfg: dict, remote_ids: list[str], node: str, repeat: int) -> dict:
+    # Время меряем без tracemalloc (он замедляет аллокации в разы), память — отдельным прогоном.
+    timings = [patch_once(xml, cfg, remote_ids, node) for _ in range(max(1, repeat))]
+    (parse_s, patch_s, serialize_s), out_bytes = min(timings, key=lambda t: t[0][1])
+    tracemalloc.start()
+    patch_once(xml, cfg, remote_ids, node)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "parse_s": round(parse_s, 6),
+        "patch_s": round(patch_s, 6),
+        "serialize_s": round(serialize_s, 6),
+        "peak_mib": round(peak / (1024 * 1024), 2),
+        "output_bytes": out_bytes,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Scaling benchmark for the config.xml patcher.")
+    parser.add_argument("--sizes", default="10,1000,10000", help="Количество папок через запятую")
+    parser.add_argument(
+        "--devices",
+        type=int,
+        default=0,
+        help="Удалённых устройств, каждое шарится во все папки (0 = max(3, folders/1000))",
+    )
+    parser.add_argument("--node", choices=["wsl_a", "amvera", "both"], default="both")
+    parser.add_argument("--repeat", type=int, default=3, help="Повторов на размер (берётся лучший patch_s)")
+    parser.add_argument("--json", dest="json_out", default="", help="Записать результаты в JSON файл")
+    args = parser.parse_args()
+
+    nodes = ["wsl_a", "amvera"] if args.node == "both" else [args.node]
+    results = []
+    print(f"{'node':<7} {'folders':>8} {'devices':>8} {'parse_s':>9} {'patch_s':>9} {'write_s':>9} {'peak_MiB':>9}")
+    for raw in args.sizes.split(","):
+        n_folders = int(raw)
+        n_devices = args.devices or max(3, n_folders // 1000)
+        xml, cfg, remote_ids = build_pair(n_folders, n_devices)
+        for node in nodes:
+            best = run_case(xml, cfg, remote_ids, node, args.repeat)
+            best.update({"node": node, "folders": n_folders, "devices": n_devices})
+            results.append(best)
+            print(
+                f"{node:<7} {n_folders:>8} {n_devices:>8} {best['parse_s']:>9.4f} {best['patch_s']:>9.4f} "
+                f"{best['serialize_s']:>9.4f} {best['peak_mib']:>9.2f}"
+            )
+
+    if args.json_out:
+        Path(args.json_out).write_text(json.dumps(results, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Бенчмарк синхронизации поверх топологии scripts/local_test_up.sh:
+# 3 native ноды (n1/n2/n3, GUI 18384-18386, listen 23001-23003) + docker сервер (22010).
+# Генерирует синтетическое дерево на source ноде, меряет time-to-converge на всех участниках,
+# байты/сек (REST /rest/system/connections) и CPU каждой ноды, пишет JSON для сравнения.
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT / "scripts"))
+
+from st_api import SyncthingAPI, SyncthingAPIError  # noqa: E402
+
+BASE = Path("/tmp/syncthing-local-test")
+SERVER_NAME = "amvera_srv_test"
+FOLDER_ID = "test-sync"
+NODES = ("n1", "n2", "n3")
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+WORKLOADS = ("tiny-files", "large-files", "deep-tree")
+
+
+# --- генераторы синтетических деревьев ---------------------------------------------------
+
+
+def write_random_file(path: Path, size: int, rng: random.Random) -> None:
+    # Случайные данные: одинаковые блоки Syncthing переиспользует, и цифры были бы нечестными.
+    path.parent.mkdir(parents=True, exist_ok=True)
+    chunk = 1024 * 1024
+    with path.open("wb") as f:
+        left = size
+        while left > 0:
+            n = min(chunk, left)
+            f.write(rng.randbytes(n))
+            left -= n
+
+
+def gen_tiny_files(root: Path, rng: random.Random, *, count: int) -> tuple[int, int]:
+    # Как codex-sessions: YYYY/MM/DD/rollout-*.jsonl по 0.2-2 KiB.
+    total = 0
+    for i in range(count):
+        day = 1 + i % 28
+        path = root / "2026" / f"{1 + i % 12:02d}" / f"{day:02d}" / f"rollout-{i:06d}.jsonl"
+        size = rng.randint(200, 2048)
+        write_random_file(path, size, rng)
+        total += size
+    return count, total
+
+
+def gen_large_files(root: Path, rng: random.Random, *, count: int, size_mb: int) -> tuple[int, int]:
+    size = size_mb * 1024 * 1024
+    for i in range(count):
+        write_random_file(root / f"blob-{i}.bin", size, rng)
+    return count, count * size
+
+
+def gen_deep_tree(root: Path, rng: random.Random, *, packages: int, depth: int) -> tuple[int, int]:
+    # Форма node_modules (pkg/lib/.../index.js + package.json), но без имени `node_modules`,
+    # иначе dev-профиль .stignore на сервере его проигнорирует и мерить будет нечего.
+    files = 0
+    total = 0
+    for p in range(packages):
+        pkg = root / "deps" / f"pkg-{p:04d}"
+        cur = pkg
+        for d in range(depth):
+            cur = cur / f"lib{d}"
+            for name in ("index.js", "util.js", "README.md"):
+                size = rng.randint(100, 4096)
+                write_random_file(cur / name, size, rng)
+                files += 1
+                total += size
+        size = rng.randint(200, 800)
+        write_random_file(pkg / "package.json", size, rng)
+        files += 1
+        total += size
+    return files, total
+
+
+# --- метрики нод ------------------------------------------------------------------------
+
+
+def process_tree_cpu_seconds(pid: int) -> float:
+    # utime+stime процесса и всех потомков (syncthing в контейнере живёт под monitor-процессом).
+    children: dict[int, list[int]] = {}
+    stats: dict[int, float] = {}
+    for entry in os.scandir("/proc"):
+        if not entry.name.isdigit():
+            continue
+        try:
+            raw = Path(entry.path, "stat").read_text()
+        except OSError:
+            continue
+        fields = raw[raw.rindex(")") + 2 :].split()
+        ppid = int(fields[1])
+        children.setdefault(ppid, []).append(int(entry.name))
+        stats[int(entry.name)] = (int(fields[11]) + int(fields[12])) / CLK_TCK
+    total = 0.0
+    stack = [pid]
+    while stack:
+        cur = stack.pop()
+        total += stats.get(cur, 0.0)
+        stack.extend(children.get(cur, []))
+    return total
+
+
+def server_pid() -> int:
+    try:
+        out = subprocess.run(
+            ["docker", "inspect", "-f", "{{.State.Pid}}", SERVER_NAME],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 0
+    return int(out or 0)
+
+
+class Node:
+    def __init__(self, name: str, sync_dir: Path, pid: int, api: SyncthingAPI | None) -> None:
+        self.name = name
+        self.sync_dir = sync_dir
+        self.pid = pid
+        self.api = api
+
+    def cpu_seconds(self) -> float:
+        return process_tree_cpu_seconds(self.pid) if self.pid else 0.0
+
+    def traffic(self) -> tuple[int, int]:
+        if self.api is None:
+            return 0, 0
+        total = (self.api.get("/rest/system/connections") or {}).get("total") or {}
+        return int(total.get("inBytesTotal") or 0), int(total.get("outBytesTotal") or 0)
+
+    def version(self) -> str:
+        if self.api is None:
+            return ""
+        try:
+            return str((self.api.get("/rest/system/version") or {}).get("version") or "")
+        except (OSError, SyncthingAPIError):
+            return ""
+
+
+def discover_nodes(base: Path) -> list[Node]:
+    nodes: list[Node] = []
+    for name in NODES:
+        home = base / name / "home"
+        pid_file = base / name / "pid"
+        if not (home / "config.xml").exists() or not pid_file.exists():
+            raise SystemExit(f"ERROR: нода {name} не найдена в {base}; сначала ./scripts/local_test_up.sh")
+        api = SyncthingAPI.from_config_xml(home / "config.xml")
+        if not api.ping():
+            raise SystemExit(f"ERROR: REST API ноды {name} ({api.base_url}) не отвечает")
+        nodes.append(Node(name, base / name / "sync" / FOLDER_ID, int(pid_file.read_text().strip() or 0), api))
+    # Сервер: GUI внутри контейнера не проброшен, поэтому только файлы + CPU по PID контейнера.
+    nodes.append(Node("server", base / "server-data" / "sync" / FOLDER_ID, server_pid(), None))
+    return nodes
+
+
+def tree_summary(root: Path) -> tuple[int, int]:
+    files = 0
+    total = 0
+    stack = [root]
+    while stack:
+        cur = stack.pop()
+        try:
+            it = os.scandir(cur)
+        except FileNotFoundError:
+            continue
+        with it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(Path(entry.path))
+                elif entry.is_file(follow_symlinks=False):
+                    files += 1
+                    total += entry.stat(follow_symlinks=False).st_size
+    return files, total
+
+
+def wait_converged(nodes: list[Node], sub: str, expect: tuple[int, int] | None, *, timeout: float, poll: float) -> dict:
+    # expect=None — ждём, пока поддерево исчезнет (удаление тоже должно сойтись).
+    t0 = time.perf_counter()
+    arrived: dict[str, float] = {}
+    while True:
+        for node in nodes:
+            if node.name in arrived:
+                continue
+            target = node.sync_dir / sub
+            done = not target.exists() if expect is None else tree_summary(target) == expect
+            if done:
+                arrived[node.name] = round(time.perf_counter() - t0, 3)
+        if len(arrived) == len(nodes):
+            return {"converged": True, "seconds": max(arrived.values()), "per_node_s": arrived}
+        if time.perf_counter() - t0 > timeout:
+            return {"converged": False, "seconds": round(time.perf_counter() - t0, 3), "per_node_s": arrived}
+        time.sleep(poll)
+
+
+def run_workload(nodes: list[Node], source: Node, workload: str, args: argparse.Namespace) -> dict:
+    rng = random.Random(args.seed)
+    sub = f"bench-{workload}-{int(time.time())}"
+    root = source.sync_dir / sub
+    print(f"== {workload}: generating in {root}", file=sys.stderr)
+
+    t_gen = time.perf_counter()
+    if workload == "tiny-files":
+        files, total = gen_tiny_files(root, rng, count=args.tiny_count)
+    elif workload == "large-files":
+        files, total = gen_large_files(root, rng, count=args.large_count, size_mb=args.large_size_mb)
+    else:
+        files, total = gen_deep_tree(root, rng, packages=args.deep_packages, depth=args.deep_depth)
+    gen_s = time.perf_counter() - t_gen
+
+    cpu_before = {n.name: n.cpu_seconds() for n in nodes}
+    traffic_before = {n.name: n.traffic() for n in nodes}
+    assert source.api is not None
+    source.api.post("/rest/db/scan", folder=FOLDER_ID, sub=sub)
+    result = wait_converged(nodes, sub, (files, total), timeout=args.timeout, poll=args.poll)
+    cpu_after = {n.name: n.cpu_seconds() for n in nodes}
+    traffic_after = {n.name: n.traffic() for n in nodes}
+
+    seconds = result["seconds"] or 1e-9
+    per_node = {}
+    for n in nodes:
+        in_b = traffic_after[n.name][0] - traffic_before[n.name][0]
+        out_b = traffic_after[n.name][1] - traffic_before[n.name][1]
+        cpu = cpu_after[n.name] - cpu_before[n.name]
+        per_node[n.name] = {
+            "arrived_s": result["per_node_s"].get(n.name),
+            "cpu_s": round(cpu, 3),
+            "cpu_pct": round(100.0 * cpu / seconds, 1),
+            "in_bytes": in_b if n.api else None,
+            "out_bytes": out_b if n.api else None,
+        }
+
+    cleanup = None
+    if not args.keep:
+        shutil.rmtree(root)
+        source.api.post("/rest/db/scan", folder=FOLDER_ID, sub=sub)
+        cleanup = wait_converged(nodes, sub, None, timeout=args.timeout, poll=args.poll)
+
+    replicas = len(nodes) - 1
+    return {
+        "workload": workload,
+        "files": files,
+        "bytes": total,
+        "generate_s": round(gen_s, 3),
+        "converged": result["converged"],
+        "converge_s": result["seconds"],
+        # Каждая нода кроме source должна получить `bytes`: эффективная скорость репликации.
+        "replicated_bytes_per_s": round(total * replicas / seconds, 1),
+        "nodes": per_node,
+        "cleanup_s": cleanup["seconds"] if cleanup else None,
+    }
+
+
+def compare(paths: list[str]) -> int:
+    runs = [json.loads(Path(p).read_text(encoding="utf-8")) for p in paths]
+    print(f"{'run':<28} {'workload':<12} {'converge_s':>10} {'MB/s':>9} {'cpu_s(sum)':>10}")
+    for path, run in zip(paths, runs):
+        label = run.get("meta", {}).get("label") or Path(path).stem
+        for w in run.get("results") or []:
+            cpu = sum((n.get("cpu_s") or 0) for n in (w.get("nodes") or {}).values())
+            mbps = (w.get("replicated_bytes_per_s") or 0) / (1024 * 1024)
+            print(f"{label[:28]:<28} {w['workload']:<12} {w['converge_s']:>10.2f} {mbps:>9.2f} {cpu:>10.2f}")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Sync throughput/latency benchmark on the local_test_up.sh topology.")
+    parser.add_argument("--base", default=str(BASE), help="Каталог локального теста")
+    parser.add_argument("--source", default="n1", choices=NODES, help="Нода, на которой создаются файлы")
+    parser.add_argument("--workloads", default=",".join(WORKLOADS), help=f"Через запятую: {', '.join(WORKLOADS)}")
+    parser.add_argument("--label", default="", help="Метка прогона (пресет/версия) для сравнения")
+    parser.add_argument("--out", default="", help="JSON с результатами (по умолчанию <base>/bench-<ts>.json)")
+    parser.add_argument("--tiny-count", type=int, default=5000)
+    parser.add_argument("--large-count", type=int, default=2)
+    parser.add_argument("--large-size-mb", type=int, default=2048)
+    parser.add_argument("--deep-packages", type=int, default=300)
+    parser.add_argument("--deep-depth", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=1800.0, help="Таймаут сходимости на workload, сек")
+    parser.add_argument("--poll", type=float, default=0.5)
+    parser.add_argument("--keep", action="store_true", help="Не удалять сгенерированные деревья")
+    parser.add_argument("--compare", nargs="+", metavar="JSON", help="Сравнить ранее сохранённые результаты")
+    args = parser.parse_args()
+
+    if args.compare:
+        return compare(args.compare)
+
+    workloads = [w.strip() for w in args.workloads.split(",") if w.strip()]
+    unknown = [w for w in workloads if w not in WORKLOADS]
+    if unknown:
+        parser.error(f"неизвестные workloads: {', '.join(unknown)}")
+
+    base = Path(args.base)
+    nodes = discover_nodes(base)
+    source = next(n for n in nodes if n.name == args.source)
+
+    results = [run_workload(nodes, source, w, args) for w in workloads]
+    ts = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    report = {
+        "meta": {
+            "label": args.label,
+            "timestamp": ts,
+            "host": platform.node(),
+            "source": args.source,
+            "versions": {n.name: n.version() for n in nodes if n.api},
+        },
+        "results": results,
+    }
+    out = Path(args.out) if args.out else base / f"bench-{ts}.json"
+    out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+    for r in results:
+        status = "OK" if r["converged"] else "TIMEOUT"
+        mbps = r["replicated_bytes_per_s"] / (1024 * 1024)
+        print(f"{status} {r['workload']}: {r['files']} files, {r['bytes']} bytes, converge {r['converge_s']}s, {mbps:.2f} MB/s")
+    print(f"Results: {out}")
+    return 0 if all(r["converged"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -2,15 +2,84 @@
 from __future__ import annotations
 
 import argparse
-import copy
+import hashlib
+import io
+import json
 import os
 import re
 import sys
+import time
 import xml.etree.ElementTree as ET
+from contextlib import contextmanager
 from pathlib import Path
 
 import yaml
 
+# Общий патчер лежит в scripts/ (в контейнере: /app/scripts).
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+
+from config_patch import (  # noqa: E402
+    ConfigPatcher,
+    apply_versioning,
+    folder_type_for,
+    node_role,
+    peer_links,
+    priority_layer,
+    resolve_connection,
+    resolve_performance,
+    shared_folders,
+)
+from compress_probe import describe_compression, describe_sample, estimate_compression, plan_compression  # noqa: E402
+from config_reload import ReloadRejected, reload_config, watch_inputs  # noqa: E402
+from copy_probe import CACHE_NAME, CopyCaps, describe_caps, probe_copy_caps  # noqa: E402
+from fs_probe import (  # noqa: E402
+    WatchPlan,
+    apply_watch_plan,
+    describe_plan,
+    plan_watchers,
+    probe_folder,
+    read_inotify_limit,
+    read_mounts,
+)
+from shards import (  # noqa: E402
+    apply_shard_ignores,
+    describe_candidates,
+    expand_shards,
+    glob_candidates,
+    stale_shards,
+)
+from st_api import SyncthingAPI, SyncthingAPIError  # noqa: E402
+from st_ignore import CANARY_DIR  # noqa: E402
+
+VERSIONS_ROOT = Path("/data/syncthing/versions")
+FINGERPRINT_NAME = ".configure-fingerprint.json"
+
+# Переменные окружения, влияющие на результат (входят в fingerprint).
+FINGERPRINT_ENV = (
+    "STIGNORE_PROFILE",
+    "FORCE_STIGNORE",
+    "FORCE_STIGNORE_SYNC",
+    "AMVERA_ALLOWED_DEVICE_IDS",
+    "ST_VERSIONING_TYPE",
+    "ST_VERSIONING_KEEP",
+    "ST_VERSIONING_CLEANOUT_DAYS",
+    "STGUIADDRESS",
+    "WATCH_PROBE_BUDGET_S",
+    "COPY_PROBE_MIB",
+    "COMPRESS_PROBE_MIB",
+    "CONFIGURE_REPROBE_HOURS",
+)
+# Код, от которого зависит результат патча (scripts/): правка любого файла — применяем заново.
+FINGERPRINT_SCRIPTS = (
+    "config_patch.py",
+    "shards.py",
+    "fs_probe.py",
+    "st_ignore.py",
+    "copy_probe.py",
+    "compress_probe.py",
+    "config_reload.py",
+)
+
 
 def load_yaml(path: Path) -> dict:
     with path.open("r", encoding="utf-8") as f:
@@ -55,167 +124,369 @@ def parse_device_id_list(value: str) -> list[str]:
     return result
 
 
-def enforce_allowed_devices(root: ET.Element, *, local_id: str, allowed_remote_ids: set[str]) -> int:
-    removed = 0
-    for dev in list(root.findall("device")):
-        did = (dev.get("id") or "").strip()
-        if not did:
-            continue
-        if did == local_id:
-            continue
-        if did not in allowed_remote_ids:
-            root.remove(dev)
-            removed += 1
-    return removed
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    try:
+        with path.open("rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+    except FileNotFoundError:
+        return ""
+    return h.hexdigest()
+
+
+def host_probe_summary() -> str:
+    # Дешёвая часть адаптивных решений (watcher/рескан, copyRangeMethod): лимит inotify и ядро хоста.
+    # Рост числа директорий и сжимаемость данных так не увидеть — их пересчитывает срок CONFIGURE_REPROBE_HOURS.
+    return f"inotify={read_inotify_limit()}\0kernel={os.uname().release}"
+
+
+def compute_fingerprint(inputs: list[Path], config_xml: Path, node: str) -> str:
+    # YAML + шаблоны + код патчера + env + нода + хост + текущий config.xml. Если совпадает с прошлым
+    # запуском — результат патча заведомо тот же, и config.xml трогать не нужно.
+    h = hashlib.sha256()
+    scripts_dir = Path(__file__).resolve().parents[1] / "scripts"
+    for path in [*inputs, Path(__file__).resolve(), *(scripts_dir / name for name in FINGERPRINT_SCRIPTS)]:
+        h.update(f"{path}\0{file_sha256(path)}\0".encode("utf-8"))
+    h.update(f"node={node}\0{host_probe_summary()}\0".encode("utf-8"))
+    for key in FINGERPRINT_ENV:
+        h.update(f"{key}={os.environ.get(key, '')}\0".encode("utf-8"))
+    h.update(f"config.xml\0{file_sha256(config_xml)}".encode("utf-8"))
+    return h.hexdigest()
+
+
+def read_fingerprint(path: Path) -> dict:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def write_bytes_atomic(path: Path, data: bytes) -> None:
+    tmp = path.with_name(f".{path.name}.tmp-{os.getpid()}")
+    with tmp.open("wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    try:
+        os.chmod(tmp, path.stat().st_mode & 0o777)
+    except FileNotFoundError:
+        pass
+    os.replace(tmp, path)
 
 
-def find_or_add_device(root: ET.Element, template: ET.Element, *, device_id: str, name: str, addresses: list[str]) -> None:
-    for dev in root.findall("device"):
-        if dev.get("id") == device_id:
-            return
+def write_config_if_changed(tree: ET.ElementTree, config_xml: Path) -> bool:
+    buf = io.BytesIO()
+    tree.write(buf, encoding="utf-8")
+    data = buf.getvalue()
+    try:
+        if config_xml.read_bytes() == data:
+            return False
+    except FileNotFoundError:
+        pass
+    write_bytes_atomic(config_xml, data)
+    return True
 
-    new_dev = copy.deepcopy(template)
-    new_dev.set("id", device_id)
-    new_dev.set("name", name)
 
-    # Replace <address> entries
-    for addr in list(new_dev.findall("address")):
-        new_dev.remove(addr)
-    for addr in addresses:
-        addr_el = ET.Element("address")
-        addr_el.text = addr
-        new_dev.append(addr_el)
+@contextmanager
+def timed(timings: dict[str, float], phase: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[phase] = timings.get(phase, 0.0) + (time.perf_counter() - t0)
+
 
-    root.append(new_dev)
+def log_timings(timings: dict[str, float], t_start: float, outcome: str) -> None:
+    phases = " ".join(f"{name}={value * 1000:.1f}ms" for name, value in timings.items())
+    total = (time.perf_counter() - t_start) * 1000
+    print(f"[configure] {outcome}; timings: {phases} total={total:.1f}ms")
 
 
-def find_or_add_folder(
+# Применяет папки/устройства к дереву config.xml; возвращает число удалённых (не из allowlist) устройств.
+def patch_config(
     root: ET.Element,
-    template: ET.Element,
+    cfg: dict,
     *,
-    folder_id: str,
-    label: str,
-    path: str,
-    folder_type: str,
-    ignore_perms: bool,
-    device_ids: list[str],
+    remote_ids: list[str],
     versioning_type: str,
-    versioning_path: str,
     versioning_keep: int,
     versioning_cleanout_days: int,
-) -> None:
-    existing = None
-    for f in root.findall("folder"):
-        if f.get("id") == folder_id:
-            existing = f
-            break
-
-    folder = existing or copy.deepcopy(template)
-    folder.set("id", folder_id)
-    folder.set("label", label)
-    folder.set("path", path)
-    folder.set("type", folder_type)
-    folder.set("ignorePerms", "true" if ignore_perms else "false")
-
-    # Devices in folder
-    for dev in list(folder.findall("device")):
-        folder.remove(dev)
-    for did in device_ids:
-        dev_el = ET.Element("device")
-        dev_el.set("id", did)
-        dev_el.set("introducedBy", "")
-        enc_el = ET.Element("encryptionPassword")
-        enc_el.text = ""
-        dev_el.append(enc_el)
-        folder.append(dev_el)
-
-    # Versioning (Amvera as backup node)
-    ver = folder.find("versioning")
-    if ver is None:
-        ver = ET.SubElement(folder, "versioning")
-    if versioning_type:
-        ver.set("type", versioning_type)
-    else:
-        ver.attrib.pop("type", None)
-
-    # Ensure elements exist
-    cleanup = ver.find("cleanupIntervalS")
-    if cleanup is None:
-        cleanup = ET.SubElement(ver, "cleanupIntervalS")
-        cleanup.text = "3600"
-
-    fs_path = ver.find("fsPath")
-    if fs_path is None:
-        fs_path = ET.SubElement(ver, "fsPath")
-    fs_path.text = versioning_path or ""
-
-    fs_type = ver.find("fsType")
-    if fs_type is None:
-        fs_type = ET.SubElement(ver, "fsType")
-        fs_type.text = "basic"
-
-    # Params
-    for p in list(ver.findall("param")):
-        ver.remove(p)
-    if versioning_type == "simple":
-        cleanout = ET.SubElement(ver, "param")
-        cleanout.set("key", "cleanoutDays")
-        cleanout.set("val", str(versioning_cleanout_days))
-        keep = ET.SubElement(ver, "param")
-        keep.set("key", "keep")
-        keep.set("val", str(versioning_keep))
-
-    if existing is None:
-        root.append(folder)
+    versions_root: Path = VERSIONS_ROOT,
+    create_dirs: bool = True,
+    node: str = "amvera",
+    watch_plans: dict[str, WatchPlan] | None = None,
+    copy_caps: dict[str, CopyCaps] | None = None,
+    compression: dict[str, str] | None = None,
+) -> int:
+    patcher = ConfigPatcher(root)
+    # Local device id (from generated config.xml)
+    local_id = patcher.local_id
+    if not local_id:
+        raise ValueError("Не удалось определить local device id")
+    if patcher.defaults_device is None or patcher.defaults_folder is None:
+        raise ValueError("defaults templates not found in config.xml")
+
+    removed = patcher.enforce_allowed_devices(set(remote_ids))
+
+    # Политика подключения: defaults.connection -> nodes.<peer>.connection -> nodes.<node>.links.<peer>;
+    # peer узнаётся по device_id из nodes.* (иначе — только defaults.connection).
+    nodes = cfg.get("nodes") or {}
+    node_by_id = {
+        str(n.get("device_id") or "").strip().upper(): name
+        for name, n in nodes.items()
+        if isinstance(n, dict) and name != node
+    }
+    defaults_conn = (cfg.get("defaults") or {}).get("connection")
+    links = (nodes.get(node) or {}).get("links") or {}
+    role = node_role(node, nodes.get(node))
+
+    for idx, did in enumerate(remote_ids, start=1):
+        peer = node_by_id.get(did)
+        name = peer or f"peer_{idx}"
+        try:
+            connection = resolve_connection(
+                defaults_conn,
+                (nodes.get(peer) or {}).get("connection") if peer else None,
+                links.get(peer) if peer else None,
+            )
+        except ValueError as e:
+            raise ValueError(f"{node} -> {peer or name}: {e}") from e
+        # compression по оценке сжимаемости папок — если в YAML не задан явно.
+        if peer and (compression or {}).get(peer) and not connection.get("compression"):
+            connection = {**connection, "compression": compression[peer]}
+        patcher.ensure_device(device_id=did, name=name, addresses=["dynamic"], connection=connection)
+
+    defaults_perf = (cfg.get("defaults") or {}).get("performance")
+    node_perf = (nodes.get(node) or {}).get("performance")
+    folder_device_ids = [local_id, *remote_ids]
+
+    for item in cfg.get("folders") or []:
+        if not isinstance(item, dict):
+            continue
+        folder_id = str(item.get("id") or "").strip()
+        if not folder_id:
+            continue
+        label = str(item.get("label") or folder_id)
+        folder_type = folder_type_for(item, role)
+        ignore_perms = bool(item.get("ignore_perms", True))
+        paths = item.get("paths") or {}
+        if not isinstance(paths, dict):
+            continue
+        folder_path = paths.get(node)
+        if not folder_path:
+            continue
+
+        versions_dir = versions_root / folder_id
+        if create_dirs:
+            ensure_dir(Path(folder_path))
+            ensure_dir(versions_dir)
+        # Адаптивный watcher/рескан и способ копирования блоков — нижние слои, пресеты и явные ключи их переопределяют.
+        plan = (watch_plans or {}).get(folder_id)
+        caps = (copy_caps or {}).get(folder_id)
+        performance = resolve_performance(
+            caps.layer() if caps else None,
+            plan.layer() if plan else None,
+            defaults_perf,
+            priority_layer(item),
+            item.get("performance"),
+            node_perf,
+        )
+        if plan:
+            performance = apply_watch_plan(performance, plan)
+
+        folder = patcher.ensure_folder(
+            folder_id=folder_id,
+            label=label,
+            path=folder_path,
+            folder_type=folder_type,
+            ignore_perms=ignore_perms,
+            device_ids=folder_device_ids,
+            performance=performance,
+        )
+        # Versioning (контейнер — backup-нода: версии в /data/syncthing/versions)
+        apply_versioning(
+            folder,
+            versioning_type=versioning_type,
+            versioning_path=str(versions_dir),
+            versioning_keep=versioning_keep,
+            versioning_cleanout_days=versioning_cleanout_days,
+        )
+    # Шарды, которых больше нет (директорию удалили или убрали из shard.dirs): их содержимое снова в родителе.
+    patcher.remove_folders(stale_shards(cfg, list(patcher.folders)))
+    return removed
+
+
+def plan_folder_watchers(roots: dict[str, Path], budget_s: float) -> dict[str, WatchPlan]:
+    # Число директорий каждой папки против fs.inotify.max_user_watches хоста -> watcher/рескан по папкам.
+    mounts = read_mounts()
+    probes = {folder_id: probe_folder(path, mounts, budget_s=budget_s) for folder_id, path in roots.items()}
+    plans, warnings = plan_watchers(probes, read_inotify_limit())
+    for folder_id, plan in plans.items():
+        print(f"[configure] watch {describe_plan(folder_id, probes[folder_id], plan)}")
+    for warning in warnings:
+        print(f"[configure] WARN: {warning}", file=sys.stderr)
+    return plans
+
+
+def plan_copy_methods(roots: dict[str, Path], cache_path: Path, size_mib: float) -> dict[str, CopyCaps]:
+    # copyRangeMethod по замеру ФС корня (кеш по устройству/монтированию и ядру — в $STHOMEDIR).
+    caps, warnings = probe_copy_caps(roots, cache_path, size_mib=size_mib)
+    for folder_id, found in caps.items():
+        print(f"[configure] copy {describe_caps(folder_id, found)}")
+    for warning in warnings:
+        print(f"[configure] WARN: {warning}", file=sys.stderr)
+    return caps
+
+
+def plan_device_compression(cfg: dict, node: str, roots: dict[str, Path], size_mib: float) -> dict[str, str]:
+    # Link type to each peer (connection.link / mode) and compressibility of shared folders -> device compression.
+    links = peer_links(cfg, node)
+    shared = {peer: shared_folders(cfg, node, peer) for peer in links}
+    needed = {folder_id for peer, link in links.items() if link != "lan" for folder_id in shared[peer]}
+    samples = estimate_compression({f: roots[f] for f in sorted(needed) if f in roots}, size_mib)
+    for folder_id, sample in samples.items():
+        print(f"[configure] compress {describe_sample(folder_id, sample)}")
+        if sample.errors:
+            print(f"[configure] WARN: {folder_id}: {len(sample.errors)} unreadable file(s): {sample.errors[0]}", file=sys.stderr)
+    plans = plan_compression(links, shared, samples)
+    for peer, plan in plans.items():
+        print(f"[configure] compress {describe_compression(peer, plan)}")
+    return {peer: plan.compression for peer, plan in plans.items()}
 
 
 def main() -> int:
     parser = argparse.ArgumentParser(description="Configure Syncthing (Amvera node) from sync-folders.yaml and env vars.")
     parser.add_argument("--config", required=True, help="Path to sync-folders.yaml inside container")
     parser.add_argument("--home", required=True, help="Syncthing home directory (STHOMEDIR)")
-    parser.add_argument("--node", required=True, choices=["amvera"], help="Only amvera supported in container")
+    parser.add_argument("--node", default="amvera", help="Имя ноды контейнера в sync-folders.yaml (nodes.<node>)")
+    parser.add_argument("--templates", default="/app/templates/stignore", help="Directory with .stignore templates")
+    parser.add_argument("--force", action="store_true", help="Ignore the stored fingerprint and re-apply everything")
+    parser.add_argument(
+        "--live",
+        action="store_true",
+        help="Apply to the running Syncthing via REST API (changed objects only, no restart)",
+    )
+    parser.add_argument(
+        "--watch",
+        type=float,
+        default=0.0,
+        metavar="SECONDS",
+        help="Poll --config every SECONDS and apply changes like --live",
+    )
     args = parser.parse_args()
 
+    if args.watch > 0:
+        print(f"[reload] watching {args.config} every {args.watch:g}s", file=sys.stderr)
+        try:
+            return watch_inputs([Path(args.config)], args.watch, lambda: configure(args, live=True), prefix="[reload]")
+        except KeyboardInterrupt:
+            return 0
+    try:
+        return configure(args, live=args.live)
+    except (OSError, SyncthingAPIError, ReloadRejected) as e:
+        print(f"[configure] REST API: {e}", file=sys.stderr)
+        return 1
+
+
+def configure(args: argparse.Namespace, *, live: bool) -> int:
+    # live: вместо перезаписи config.xml (действует после рестарта) — diff с /rest/config и PATCH/PUT/DELETE.
+    t_start = time.perf_counter()
+    timings: dict[str, float] = {}
+
     config_path = Path(args.config)
     home_dir = Path(args.home)
     config_xml = home_dir / "config.xml"
+    fingerprint_path = home_dir / FINGERPRINT_NAME
 
-    cfg = load_yaml(config_path)
-
-    # Install ignore files into each configured folder root
-    templates_dir = Path("/app/templates/stignore")
-    stignore_template = read_text(templates_dir / ".stignore")
+    templates_dir = Path(args.templates)
     profile = os.environ.get("STIGNORE_PROFILE", "dev").strip() or "dev"
     sync_template_name = ".stignore_sync.dev" if profile == "dev" else ".stignore_sync.minimal"
-    stignore_sync_template = read_text(templates_dir / sync_template_name)
     force_ignores = os.environ.get("FORCE_STIGNORE", "").strip() == "1"
     force_ignores_sync = os.environ.get("FORCE_STIGNORE_SYNC", "").strip() == "1"
 
-    folders = cfg.get("folders") or []
-    for item in folders:
-        if not isinstance(item, dict):
-            continue
-        paths = item.get("paths") or {}
-        if not isinstance(paths, dict):
-            continue
-        folder_path = paths.get("amvera")
-        if not folder_path:
-            continue
-        root_path = Path(folder_path)
-        ensure_dir(root_path)
-        write_text_if_missing(root_path / ".stignore", stignore_template, force=force_ignores)
-        write_text_if_missing(
-            root_path / ".stignore_sync",
-            stignore_sync_template,
-            force=force_ignores_sync,
+    # Fast path: входы не менялись и корни папок на месте — ничего не парсим и не пишем.
+    inputs = [config_path, templates_dir / ".stignore", templates_dir / sync_template_name]
+    reprobe_s = float(os.environ.get("CONFIGURE_REPROBE_HOURS", "24").strip() or "0") * 3600
+    with timed(timings, "fingerprint"):
+        fingerprint = compute_fingerprint(inputs, config_xml, args.node)
+        previous = read_fingerprint(fingerprint_path)
+        probed_at = previous.get("probed_at")
+        unchanged = (
+            not live
+            and not args.force
+            and not force_ignores
+            and not force_ignores_sync
+            and config_xml.exists()
+            and previous.get("fingerprint") == fingerprint
+            # Замеры папок (директории, сжимаемость) устаревают: раз в reprobe_s применяем заново.
+            and (reprobe_s <= 0 or (isinstance(probed_at, (int, float)) and time.time() - probed_at < reprobe_s))
+            and all(
+                (Path(r) / ".stignore").exists() and (Path(r) / CANARY_DIR).is_dir()
+                for r in previous.get("folder_roots") or []
+            )
         )
+    if unchanged:
+        log_timings(timings, t_start, "inputs unchanged, skip")
+        return 0
+
+    with timed(timings, "load"):
+        try:
+            cfg = load_yaml(config_path)
+        except (ValueError, yaml.YAMLError) as e:
+            print(f"[configure] {config_path}: {e}", file=sys.stderr)
+            return 1
+        stignore_template = read_text(templates_dir / ".stignore")
+        stignore_sync_template = read_text(templates_dir / sync_template_name)
+    if not isinstance((cfg.get("nodes") or {}).get(args.node), dict):
+        # Старые SYNC_CONFIG без nodes.<node>: роль и политики по умолчанию, контейнер всё равно должен стартовать.
+        print(f"[configure] WARN: нет nodes.{args.node} в {config_path} — роль по умолчанию", file=sys.stderr)
+    try:
+        cfg = expand_shards(cfg)
+    except ValueError as e:
+        print(f"[configure] {e}", file=sys.stderr)
+        return 1
+    for folder_id, names in glob_candidates(cfg, args.node).items():
+        print(f"[configure] shard {describe_candidates(folder_id, names)}")
+
+    # Install ignore files into each configured folder root
+    folders = cfg.get("folders") or []
+    folder_roots: list[str] = []
+    folder_ids: dict[str, Path] = {}
+    with timed(timings, "stignore"):
+        for item in folders:
+            if not isinstance(item, dict):
+                continue
+            paths = item.get("paths") or {}
+            if not isinstance(paths, dict):
+                continue
+            folder_path = paths.get(args.node)
+            if not folder_path:
+                continue
+            root_path = Path(folder_path)
+            folder_roots.append(str(root_path))
+            if item.get("id"):
+                folder_ids[str(item["id"]).strip()] = root_path
+            ensure_dir(root_path)
+            ensure_dir(root_path / CANARY_DIR)
+            write_text_if_missing(root_path / ".stignore", stignore_template, force=force_ignores)
+            write_text_if_missing(
+                root_path / ".stignore_sync",
+                stignore_sync_template,
+                force=force_ignores_sync,
+            )
+            if "shard_dirs" in item:
+                # Родитель игнорирует шарды — они синхронизируются отдельными папками.
+                apply_shard_ignores(root_path / ".stignore", item["shard_dirs"])
 
     if not config_xml.exists():
         print(f"[configure] skip: нет {config_xml}", file=sys.stderr)
         return 0
 
-    tree = ET.parse(config_xml)
-    root = tree.getroot()
+    with timed(timings, "parse"):
+        tree = ET.parse(config_xml)
+        root = tree.getroot()
 
     # Make GUI local-only + disable browser
     gui = root.find("gui")
@@ -237,79 +508,78 @@ def main() -> int:
         print(f"[configure] {e}", file=sys.stderr)
         return 1
 
-    if not allowed_ids:
+    if allowed_ids:
+        remote_ids = allowed_ids
+
+        versioning_type = os.environ.get("ST_VERSIONING_TYPE", "simple").strip()
+        versioning_keep = int(os.environ.get("ST_VERSIONING_KEEP", "10").strip() or "10")
+        versioning_cleanout_days = int(os.environ.get("ST_VERSIONING_CLEANOUT_DAYS", "30").strip() or "30")
+        watch_budget_s = float(os.environ.get("WATCH_PROBE_BUDGET_S", "2").strip() or "0")
+        copy_probe_mib = float(os.environ.get("COPY_PROBE_MIB", "8").strip() or "0")
+        compress_probe_mib = float(os.environ.get("COMPRESS_PROBE_MIB", "16").strip() or "0")
+
+        watch_plans = None
+        if watch_budget_s > 0:
+            with timed(timings, "watch"):
+                watch_plans = plan_folder_watchers(folder_ids, watch_budget_s)
+        copy_caps = None
+        if copy_probe_mib > 0:
+            with timed(timings, "copy"):
+                copy_caps = plan_copy_methods(folder_ids, home_dir / CACHE_NAME, copy_probe_mib)
+
+        try:
+            compression = None
+            if compress_probe_mib > 0:
+                with timed(timings, "compress"):
+                    compression = plan_device_compression(cfg, args.node, folder_ids, compress_probe_mib)
+            with timed(timings, "patch"):
+                removed = patch_config(
+                    root,
+                    cfg,
+                    remote_ids=remote_ids,
+                    node=args.node,
+                    versioning_type=versioning_type,
+                    versioning_keep=versioning_keep,
+                    versioning_cleanout_days=versioning_cleanout_days,
+                    watch_plans=watch_plans,
+                    copy_caps=copy_caps,
+                    compression=compression,
+                )
+        except ValueError as e:
+            print(f"[configure] {e}", file=sys.stderr)
+            return 1
+        if removed:
+            print(f"[configure] AMVERA_ALLOWED_DEVICE_IDS: removed {removed} device(s) from config.xml", file=sys.stderr)
+        ET.indent(tree, space="    ")
+    else:
         print(
             "[configure] AMVERA_ALLOWED_DEVICE_IDS не задан — папки/шары в конфиг не добавляю (только .stignore).",
             file=sys.stderr,
         )
-        tree.write(config_xml, encoding="utf-8")
-        return 0
-
-    remote_ids = allowed_ids
-
-    # Local device id (from generated config.xml)
-    local_device = root.find("device")
-    local_id = local_device.get("id") if local_device is not None else ""
-    if not local_id:
-        print("[configure] Не удалось определить local device id", file=sys.stderr)
-        return 1
-
-    defaults_device = root.find("defaults/device")
-    defaults_folder = root.find("defaults/folder")
-    if defaults_device is None or defaults_folder is None:
-        print("[configure] defaults templates not found in config.xml", file=sys.stderr)
-        return 1
-
-    removed = enforce_allowed_devices(root, local_id=local_id, allowed_remote_ids=set(remote_ids))
-    if removed:
-        print(f"[configure] AMVERA_ALLOWED_DEVICE_IDS: removed {removed} device(s) from config.xml", file=sys.stderr)
-
-    for idx, did in enumerate(remote_ids, start=1):
-        name = f"peer_{idx}"
-        find_or_add_device(root, defaults_device, device_id=did, name=name, addresses=["dynamic"])
 
-    versioning_type = os.environ.get("ST_VERSIONING_TYPE", "simple").strip()
-    versioning_keep = int(os.environ.get("ST_VERSIONING_KEEP", "10").strip() or "10")
-    versioning_cleanout_days = int(os.environ.get("ST_VERSIONING_CLEANOUT_DAYS", "30").strip() or "30")
-
-    for item in folders:
-        if not isinstance(item, dict):
-            continue
-        folder_id = str(item.get("id") or "").strip()
-        if not folder_id:
-            continue
-        label = str(item.get("label") or folder_id)
-        folder_type = str(item.get("type") or "sendreceive")
-        ignore_perms = bool(item.get("ignore_perms", True))
-        paths = item.get("paths") or {}
-        if not isinstance(paths, dict):
-            continue
-        folder_path = paths.get("amvera")
-        if not folder_path:
-            continue
-
-        ensure_dir(Path(folder_path))
-
-        versions_dir = Path("/data/syncthing/versions") / folder_id
-        ensure_dir(versions_dir)
+    if live:
+        # config.xml перепишет сам Syncthing; fingerprint не обновляем — при следующем старте патч повторится офлайн.
+        with timed(timings, "live"):
+            api = SyncthingAPI.from_config_xml(config_xml)
+            try:
+                changes = reload_config(api, root)
+            finally:
+                api.close()
+        for change in changes:
+            print(f"[configure] live {change}")
+        log_timings(timings, t_start, f"live: {len(changes)} change(s) via REST API")
+        return 0
 
-        find_or_add_folder(
-            root,
-            defaults_folder,
-            folder_id=folder_id,
-            label=label,
-            path=folder_path,
-            folder_type=folder_type,
-            ignore_perms=ignore_perms,
-            device_ids=[local_id, *remote_ids],
-            versioning_type=versioning_type,
-            versioning_path=str(versions_dir),
-            versioning_keep=versioning_keep,
-            versioning_cleanout_days=versioning_cleanout_days,
-        )
+    with timed(timings, "write"):
+        written = write_config_if_changed(tree, config_xml)
+        fingerprint_data = {
+            "fingerprint": compute_fingerprint(inputs, config_xml, args.node),
+            "probed_at": int(time.time()),
+            "folder_roots": folder_roots,
+        }
+        write_bytes_atomic(fingerprint_path, json.dumps(fingerprint_data, indent=2).encode("utf-8"))
 
-    ET.indent(tree, space="    ")
-    tree.write(config_xml, encoding="utf-8")
+    log_timings(timings, t_start, "config.xml updated" if written else "config.xml unchanged")
     return 0
 
 
@@ -0,0 +1,617 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import html
+import json
+import mimetypes
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+import yaml
+
+from snapshot_export import RateLimiter, SnapshotBusy, SnapshotExport, UnknownBase, folder_roots, history
+from versions_compress import lookup, lookup_dir, open_manifest, open_reader
+from versions_index import search
+
+# HTTP file browser для /data/syncthing/versions (порт 80 в Amvera). Заменяет `python3 -m http.server`:
+# - пул потоков: медленный клиент не блокирует остальных;
+# - отдача файлов через sendfile (zero-copy) + HTTP Range (докачка);
+# - листинги директорий кешируются и инвалидируются по mtime директории;
+# - `?zip=1` на директории — потоковый zip всего дерева (без временных файлов);
+# - `/api/versions?folder=&prefix=&from=&to=&limit=` — поиск версий по индексу versions_index.py (JSON);
+# - версии, сжатые versions_compress.py (манифест), отдаются распакованными на лету под исходными именами
+#   (Range — пропуском распакованных байт, zip — распакованное содержимое);
+# - `/snapshots/` (JSON: папки и история) и `/snapshots/<folder>.tar[?full=1]` — потоковый инкрементальный
+#   снапшот папки Syncthing по folder id из --config (paths.<--node>, snapshot_export.py), `&base=<id>` — инкремент от снапшота, который есть у клиента;
+#   только с --snapshots, при SNAPSHOT_TOKEN — по токену;
+# - `/healthz` — для проверки живости; при --disabled остальное отдаёт 404 (заглушка).
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK = 1024 * 1024
+DISABLED_TEXT = b"File browser is disabled (FILE_BROWSER_ENABLED=0).\n"
+SEARCH_MAX_LIMIT = 1000
+TIME_FORMATS = ("%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y%m%d-%H%M%S")
+
+
+def parse_range(header: str | None, size: int) -> tuple[int, int, bool] | None:
+    # -> (start, end, частичный ответ) или None — диапазон не удовлетворим (416).
+    start, end = 0, size - 1
+    if not header or size <= 0:
+        return start, end, False
+    m = RANGE_RE.match(header.strip())
+    # Несколько диапазонов не поддерживаем — по RFC можно ответить целиком (200).
+    if not m or not (m.group(1) or m.group(2)):
+        return start, end, False
+    if m.group(1):
+        start = int(m.group(1))
+        end = int(m.group(2)) if m.group(2) else size - 1
+    else:
+        start = max(0, size - int(m.group(2)))
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        return None
+    return start, end, True
+
+
+def parse_time(value: str, *, end: bool = False) -> int:
+    # unix time | YYYY-MM-DD (для `to` — конец дня) | YYYY-MM-DDTHH:MM[:SS] | YYYYMMDD-HHMMSS; локальное время, как у меток версий.
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    try:
+        day = time.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        pass
+    else:
+        return int(time.mktime(day)) + (86399 if end else 0)
+    for fmt in TIME_FORMATS:
+        try:
+            return int(time.mktime(time.strptime(value, fmt)))
+        except ValueError:
+            continue
+    raise ValueError(f"bad time: {value!r}")
+
+
+class ListingCache:
+    # LRU: path -> (mtime_ns директории, отрендеренный HTML). Версии пишутся один раз и не меняются,
+    # поэтому mtime директории (меняется при добавлении/удалении записей) достаточно для инвалидации.
+    def __init__(self, max_entries: int = 256) -> None:
+        self.max_entries = max_entries
+        self._items: OrderedDict[str, tuple[int, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, mtime_ns: int) -> bytes | None:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[0] != mtime_ns:
+                return None
+            self._items.move_to_end(key)
+            return item[1]
+
+    def put(self, key: str, mtime_ns: int, body: bytes) -> None:
+        with self._lock:
+            self._items[key] = (mtime_ns, body)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+
+class PooledHTTPServer(HTTPServer):
+    # Как ThreadingHTTPServer, но с ограниченным пулом вместо потока на каждое соединение.
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: tuple[str, int], handler, *, workers: int) -> None:
+        super().__init__(address, handler)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="file-server")
+
+    def process_request(self, request, client_address) -> None:
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class _SocketStream:
+    # Минимальный file-like для zipfile в режиме потоковой записи (без seek/tell).
+    def __init__(self, wfile) -> None:
+        self.wfile = wfile
+
+    def write(self, data: bytes) -> int:
+        self.wfile.write(data)
+        return len(data)
+
+    def flush(self) -> None:
+        self.wfile.flush()
+
+
+class FileBrowserHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "versions-file-server"
+    # Пул фиксированный: простаивающее keep-alive соединение держит поток. Ждём следующий запрос keep_alive_s,
+    # а чтение/запись внутри запроса — timeout (медленный клиент при скачивании), затем соединение закрывается,
+    # иначе несколько вкладок браузера занимают весь пул и /healthz (liveness Amvera) не отвечает.
+    timeout = 30
+    keep_alive_s = 5.0
+
+    root: Path = Path("/data/syncthing/versions")
+    enabled: bool = True
+    access_log: bool = False
+    listing_cache = ListingCache()
+    index_path: Path | None = None
+    manifest_path: Path | None = None
+    snapshots: bool = False
+    sync_config: Path = Path("/app/sync-folders.yaml")
+    node: str = "amvera"
+    snapshot_state: Path = Path("/data/syncthing/snapshots")
+    snapshot_token: str = ""
+    snapshot_limiter = RateLimiter(0)
+    _local = threading.local()
+
+    def handle_one_request(self) -> None:
+        self.connection.settimeout(self.keep_alive_s)
+        super().handle_one_request()
+
+    def parse_request(self) -> bool:
+        # Строка запроса прочитана — дальше обычный timeout.
+        self.connection.settimeout(self.timeout)
+        return super().parse_request()
+
+    def log_message(self, format: str, *args) -> None:  # noqa: A002
+        if self.access_log:
+            super().log_message(format, *args)
+
+    # --- helpers ---
+
+    def send_text(self, status: int, text: bytes, *, content_type: str = "text/plain; charset=utf-8") -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(text)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(text)
+
+    def resolve(self, url_path: str) -> Path | None:
+        rel = unquote(url_path).lstrip("/")
+        target = (self.root / rel).resolve()
+        root = self.root.resolve()
+        if target != root and root not in target.parents:
+            return None
+        return target
+
+    # --- routes ---
+
+    def do_HEAD(self) -> None:
+        self.do_GET()
+
+    def do_GET(self) -> None:
+        parts = urlsplit(self.path)
+        if parts.path == "/healthz":
+            self.send_text(HTTPStatus.OK, b"ok\n")
+            return
+        if not self.enabled:
+            self.send_text(HTTPStatus.NOT_FOUND, DISABLED_TEXT)
+            return
+        if parts.path == "/api/versions":
+            self.send_search(parse_qs(parts.query))
+            return
+        if self.snapshots and (parts.path == "/snapshots" or parts.path.startswith("/snapshots/")):
+            self.send_snapshot(parts.path[len("/snapshots"):].strip("/"), parse_qs(parts.query))
+            return
+
+        target = self.resolve(parts.path)
+        if target is None:
+            self.send_text(HTTPStatus.FORBIDDEN, b"Forbidden\n")
+            return
+        try:
+            st = target.stat()
+        except FileNotFoundError:
+            self.send_text(HTTPStatus.NOT_FOUND, b"Not found\n")
+            return
+
+        query = parse_qs(parts.query)
+        if target.is_dir():
+            if not parts.path.endswith("/"):
+                self.send_response(HTTPStatus.MOVED_PERMANENTLY)
+                self.send_header("Location", parts.path + "/")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if query.get("zip", ["0"])[0] == "1":
+                self.send_zip(target)
+            else:
+                self.send_listing(parts.path, target, st.st_mtime_ns)
+            return
+        stored = self.compressed(target, st)
+        if stored:
+            self.send_decompressed(target, st, *stored)
+            return
+        self.send_file(target, st)
+
+    def manifest_db(self) -> sqlite3.Connection | None:
+        # Манифест сжатых версий (пишет versions_compress.py), соединение на поток пула, только чтение.
+        db = getattr(self._local, "manifest", None)
+        if db is None and self.manifest_path is not None and self.manifest_path.exists():
+            db = open_manifest(self.manifest_path, readonly=True)
+            self._local.manifest = db
+        return db
+
+    def compressed(self, path: Path, st: os.stat_result) -> tuple[str, int] | None:
+        db = self.manifest_db()
+        if db is None:
+            return None
+        try:
+            return lookup(db, path.relative_to(self.root.resolve()).as_posix(), path, st)
+        except sqlite3.Error:
+            return None
+
+    def index_db(self) -> sqlite3.Connection | None:
+        # Соединение на поток пула, только чтение (пишет versions_index.py).
+        db = getattr(self._local, "db", None)
+        if db is None and self.index_path is not None and self.index_path.exists():
+            db = sqlite3.connect(f"file:{self.index_path}?mode=ro", uri=True, check_same_thread=False)
+            self._local.db = db
+        return db
+
+    def send_search(self, query: dict[str, list[str]]) -> None:
+        def arg(name: str) -> str:
+            return (query.get(name) or [""])[0]
+
+        db = self.index_db()
+        if db is None:
+            self.send_text(HTTPStatus.SERVICE_UNAVAILABLE, b"Versions index is not built yet\n")
+            return
+        folder = arg("folder").strip("/")
+        prefix = arg("prefix").lstrip("/")
+        if folder:
+            prefix = f"{folder}/{prefix}"
+        try:
+            since = parse_time(arg("from")) if arg("from") else None
+            until = parse_time(arg("to"), end=True) if arg("to") else None
+            limit = min(SEARCH_MAX_LIMIT, max(1, int(arg("limit") or 200)))
+        except ValueError as e:
+            self.send_text(HTTPStatus.BAD_REQUEST, f"{e}\n".encode("utf-8"))
+            return
+        t0 = time.perf_counter()
+        try:
+            rows = search(db, prefix=prefix, since=since, until=until, limit=limit)
+        except sqlite3.Error as e:
+            self.send_text(HTTPStatus.SERVICE_UNAVAILABLE, f"index: {e}\n".encode("utf-8"))
+            return
+        manifest = self.manifest_db()
+        for row in rows:
+            row["url"] = "/" + quote(row["file"])
+            if manifest is not None:
+                # Размер в индексе — на диске; для сжатой версии отдаём исходный (его и скачают).
+                path = self.root / row["file"]
+                try:
+                    stored = lookup(manifest, row["file"], path, path.stat())
+                except (OSError, sqlite3.Error):
+                    stored = None
+                if stored:
+                    row["stored_size"], row["size"] = row["size"], stored[1]
+            row["version_time"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row["version"]))
+        body = {"count": len(rows), "elapsed_ms": round((time.perf_counter() - t0) * 1000, 2), "versions": rows}
+        self.send_text(HTTPStatus.OK, json.dumps(body, ensure_ascii=False).encode("utf-8"), content_type="application/json")
+
+    def send_snapshot(self, name: str, query: dict[str, list[str]]) -> None:
+        token = (query.get("token") or [""])[0] or self.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+        if self.snapshot_token and token != self.snapshot_token:
+            self.send_text(HTTPStatus.UNAUTHORIZED, b"Snapshot token required\n")
+            return
+        # YAML читается на каждый запрос: подхватывает горячие правки SYNC_CONFIG.
+        try:
+            folders = folder_roots(self.sync_config, self.node)
+        except (OSError, ValueError, yaml.YAMLError) as e:
+            self.send_text(HTTPStatus.INTERNAL_SERVER_ERROR, f"{self.sync_config}: {e}\n".encode("utf-8"))
+            return
+        if not name:
+            body = {
+                folder: {"path": str(root), "snapshots": history(self.snapshot_state, folder)}
+                for folder, (root, _) in sorted(folders.items())
+            }
+            self.send_text(HTTPStatus.OK, json.dumps(body, indent=2).encode("utf-8"), content_type="application/json")
+            return
+        folder = name.removesuffix(".tar")
+        if not name.endswith(".tar") or folder not in folders or not folders[folder][0].is_dir():
+            self.send_text(HTTPStatus.NOT_FOUND, b"Not found\n")
+            return
+        # ?base=<id> — последний снапшот, который у клиента есть: сервер не знает, дошёл ли прошлый tar.
+        raw_base = (query.get("base") or [""])[0]
+        if raw_base and not raw_base.isdigit():
+            self.send_text(HTTPStatus.BAD_REQUEST, b"base: snapshot id expected\n")
+            return
+        try:
+            export = SnapshotExport(
+                folders[folder][0],
+                self.snapshot_state,
+                name=folder,
+                full=(query.get("full") or ["0"])[0] == "1",
+                limiter=self.snapshot_limiter,
+                base=int(raw_base) if raw_base else None,
+                skip=folders[folder][1],
+            )
+        except SnapshotBusy as e:
+            self.send_text(HTTPStatus.CONFLICT, f"{e}\n".encode("utf-8"))
+            return
+        try:
+            try:
+                export.prepare()
+            except UnknownBase as e:
+                self.send_text(HTTPStatus.CONFLICT, f"{e}\n".encode("utf-8"))
+                return
+            kind = f"inc{export.base}" if export.base else "full"
+            filename = f"{folder}-{export.snapshot_id}-{kind}.tar"
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", "application/x-tar")
+            self.send_header("Content-Disposition", f"attachment; filename*=UTF-8''{quote(filename)}")
+            self.send_header("X-Snapshot-Id", str(export.snapshot_id))
+            self.send_header("X-Snapshot-Base", str(export.base or ""))
+            # Размер заранее неизвестен: отдаём до закрытия соединения (как zip).
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            if self.command == "HEAD":
+                return
+            try:
+                stats = export.write(_SocketStream(self.wfile))
+            except (BrokenPipeError, ConnectionResetError):
+                # Клиент оборвал выгрузку: снапшот помечен aborted, манифест не сдвинулся.
+                print(f"[file-browser] snapshot {filename}: aborted by client", file=sys.stderr)
+                return
+            print(
+                f"[file-browser] snapshot {filename}: files={stats['files']} bytes={stats['bytes']} "
+                f"deleted={stats['deleted']}",
+                file=sys.stderr,
+            )
+        finally:
+            export.close()
+
+    def send_listing(self, url_path: str, directory: Path, mtime_ns: int) -> None:
+        body = self.listing_cache.get(str(directory), mtime_ns)
+        if body is None:
+            sizes: dict[str, tuple[str, int, int]] = {}
+            db = self.manifest_db()
+            if db is not None:
+                rel_dir = directory.relative_to(self.root.resolve()).as_posix()
+                try:
+                    sizes = lookup_dir(db, "" if rel_dir == "." else rel_dir)
+                except sqlite3.Error:
+                    pass
+            body = render_listing(url_path, directory, sizes)
+            self.listing_cache.put(str(directory), mtime_ns, body)
+        self.send_text(HTTPStatus.OK, body, content_type="text/html; charset=utf-8")
+
+    def send_range_headers(self, path: Path, st: os.stat_result, size: int) -> tuple[int, int] | None:
+        # Заголовки ответа на файл (с учётом Range) -> (start, length) тела или None, если тело не нужно.
+        parsed = parse_range(self.headers.get("Range"), size)
+        if parsed is None:
+            self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return None
+        start, end, partial = parsed
+        length = max(0, end - start + 1)
+        self.send_response(HTTPStatus.PARTIAL_CONTENT if partial else HTTPStatus.OK)
+        ctype = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(length))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Last-Modified", self.date_time_string(int(st.st_mtime)))
+        if partial:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+        if self.command == "HEAD" or length == 0:
+            return None
+        return start, length
+
+    def send_file(self, path: Path, st: os.stat_result) -> None:
+        try:
+            f = path.open("rb")
+        except OSError:
+            self.send_text(HTTPStatus.FORBIDDEN, b"Forbidden\n")
+            return
+        with f:
+            body = self.send_range_headers(path, st, st.st_size)
+            if body is None:
+                return
+            start, length = body
+            # socket.sendfile использует os.sendfile (zero-copy), если доступен.
+            self.wfile.flush()
+            self.connection.sendfile(f, offset=start, count=length)
+
+    def send_decompressed(self, path: Path, st: os.stat_result, codec: str, size: int) -> None:
+        # sendfile тут невозможен: распаковываем в пуле потоков; Range — пропуск распакованных байт до start.
+        try:
+            f = path.open("rb")
+        except OSError:
+            self.send_text(HTTPStatus.FORBIDDEN, b"Forbidden\n")
+            return
+        with f, open_reader(codec, f) as reader:
+            body = self.send_range_headers(path, st, size)
+            if body is None:
+                return
+            start, length = body
+            while start > 0:
+                skipped = len(reader.read(min(CHUNK, start)))
+                if not skipped:
+                    self.close_connection = True
+                    return
+                start -= skipped
+            while length > 0:
+                chunk = reader.read(min(CHUNK, length))
+                if not chunk:
+                    # Файл короче манифеста: обрываем соединение, а не отдаём мусор после Content-Length.
+                    self.close_connection = True
+                    return
+                self.wfile.write(chunk)
+                length -= len(chunk)
+
+    def send_zip(self, directory: Path) -> None:
+        name = (directory.name or "versions") + ".zip"
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "application/zip")
+        self.send_header("Content-Disposition", f"attachment; filename*=UTF-8''{quote(name)}")
+        # Размер заранее неизвестен: отдаём до закрытия соединения.
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        if self.command == "HEAD":
+            return
+        # ZIP_STORED: версии часто уже сжаты, а CPU в контейнере мало.
+        with zipfile.ZipFile(_SocketStream(self.wfile), "w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+            for path in iter_files(directory):
+                arcname = str(path.relative_to(directory))
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue
+                stored = self.compressed(path, st)
+                if not stored:
+                    zf.write(path, arcname=arcname)
+                    continue
+                info = zipfile.ZipInfo.from_file(path, arcname)
+                with path.open("rb") as f, open_reader(stored[0], f) as reader, zf.open(info, "w", force_zip64=True) as out:
+                    while chunk := reader.read(CHUNK):
+                        out.write(chunk)
+
+
+def iter_files(directory: Path):
+    stack = [directory]
+    while stack:
+        cur = stack.pop()
+        try:
+            entries = sorted(os.scandir(cur), key=lambda e: e.name)
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(Path(entry.path))
+            elif entry.is_file(follow_symlinks=False):
+                yield Path(entry.path)
+
+
+def render_listing(url_path: str, directory: Path, compressed: dict[str, tuple[str, int, int]]) -> bytes:
+    # compressed: имя -> (кодек, исходный размер, размер на диске) из манифеста versions_compress.py.
+    rows = []
+    try:
+        entries = sorted(os.scandir(directory), key=lambda e: (not e.is_dir(), e.name.lower()))
+    except OSError:
+        entries = []
+    for entry in entries:
+        try:
+            st = entry.stat()
+        except OSError:
+            continue
+        is_dir = entry.is_dir()
+        name = entry.name + ("/" if is_dir else "")
+        size = "-" if is_dir else str(st.st_size)
+        stored = None if is_dir else compressed.get(entry.name)
+        if stored and stored[2] == st.st_size:
+            size = f"{stored[1]} ({stored[0]}, {st.st_size} on disk)"
+        mtime = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(st.st_mtime))
+        rows.append(
+            f'<tr><td><a href="{quote(name)}">{html.escape(name)}</a></td>'
+            f"<td>{size}</td><td>{mtime}</td></tr>"
+        )
+    title = html.escape(unquote(url_path))
+    parts = [
+        "<!DOCTYPE html>",
+        f"<html><head><meta charset='utf-8'><title>{title}</title></head><body>",
+        f"<h1>{title}</h1>",
+        '<p><a href="../">../</a> | <a href="?zip=1">download as zip</a></p>',
+        "<table><tr><th>Name</th><th>Size</th><th>Modified (UTC)</th></tr>",
+        *rows,
+        "</table></body></html>",
+    ]
+    return "\n".join(parts).encode("utf-8")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Versions file browser (Amvera, port 80).")
+    parser.add_argument("--root", default=os.environ.get("FILE_BROWSER_ROOT", "/data/syncthing/versions"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("FILE_BROWSER_PORT", "80")))
+    parser.add_argument("--bind", default="0.0.0.0")
+    parser.add_argument("--workers", type=int, default=16, help="Размер пула потоков")
+    parser.add_argument(
+        "--keep-alive-s", type=float, default=FileBrowserHandler.keep_alive_s, help="Простой keep-alive соединения, с"
+    )
+    parser.add_argument("--disabled", action="store_true", help="Заглушка: только /healthz, остальное 404")
+    parser.add_argument("--access-log", action="store_true")
+    parser.add_argument(
+        "--index",
+        default=os.environ.get("VERSIONS_INDEX_PATH", "/data/syncthing/versions-index.sqlite"),
+        help="SQLite индекс версий (docker/versions_index.py) для /api/versions",
+    )
+    parser.add_argument(
+        "--manifest",
+        default=os.environ.get("VERSIONS_COMPRESS_MANIFEST", "/data/syncthing/versions-compress.sqlite"),
+        help="Манифест сжатых версий (docker/versions_compress.py): такие версии отдаются распакованными",
+    )
+    parser.add_argument("--snapshots", action="store_true", help="Включить /snapshots/ (snapshot_export.py)")
+    parser.add_argument(
+        "--config", default=os.environ.get("SYNC_CONFIG", "/app/sync-folders.yaml"), help="Папки для /snapshots/"
+    )
+    parser.add_argument("--node", default="amvera", help="Чьи paths.<node> выгружаются в /snapshots/")
+    parser.add_argument(
+        "--snapshot-state",
+        default=os.environ.get("SNAPSHOT_STATE_DIR", "/data/syncthing/snapshots"),
+        help="Манифесты снапшотов (SQLite на папку)",
+    )
+    parser.add_argument(
+        "--snapshot-max-read-mib-s",
+        type=float,
+        default=float(os.environ.get("SNAPSHOT_MAX_READ_MIB_S", "20") or 0),
+        help="Общий лимит чтения снапшотов с диска, MiB/s (0 — без лимита)",
+    )
+    args = parser.parse_args()
+
+    FileBrowserHandler.root = Path(args.root)
+    FileBrowserHandler.enabled = not args.disabled
+    FileBrowserHandler.access_log = args.access_log
+    FileBrowserHandler.keep_alive_s = args.keep_alive_s
+    FileBrowserHandler.index_path = Path(args.index)
+    FileBrowserHandler.manifest_path = Path(args.manifest)
+    FileBrowserHandler.snapshots = args.snapshots
+    FileBrowserHandler.sync_config = Path(args.config)
+    FileBrowserHandler.node = args.node
+    FileBrowserHandler.snapshot_state = Path(args.snapshot_state)
+    FileBrowserHandler.snapshot_token = os.environ.get("SNAPSHOT_TOKEN", "").strip()
+    FileBrowserHandler.snapshot_limiter = RateLimiter(args.snapshot_max_read_mib_s)
+
+    server = PooledHTTPServer((args.bind, args.port), FileBrowserHandler, workers=args.workers)
+    mode = "disabled (stub)" if args.disabled else f"serving {args.root}"
+    print(f"[file-browser] {mode} on :{args.port} ({args.workers} workers)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,617 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import fcntl
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import yaml
+
+# st_ignore/shards лежат в scripts/ (в контейнере: /app/scripts).
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+
+from shards import expand_shards  # noqa: E402
+from st_ignore import CANARY_DIR  # noqa: E402
+
+# Снапшоты папок Amvera потоковым tar — off-box копия backup-ноды. Единица снапшота — папка Syncthing по folder id
+# из sync-folders.yaml (корень — paths.<node>, шарды — отдельными папками, родитель их не включает).
+# SQLite на папку (<folder id>.sqlite) в --state-dir: манифест каждого завершённого снапшота — path -> (size, mtime_ns, sha256).
+# Инкремент строится на base, выбранном клиентом (`--base` / `?base=`; по умолчанию — последний завершённый):
+# только файлы с другим size/mtime относительно манифеста base (при том же размере сначала сверяется sha256 —
+# touch без изменений не выгружается) и список удалённых путей. Сервер не знает, дошёл ли tar до клиента
+# (обрыв после последних байт в буфере прокси, случайный GET), поэтому клиент указывает последний снапшот, который
+# у него действительно есть; манифесты последних MANIFESTS_KEPT снапшотов хранятся, более старый base — UnknownBase.
+# Манифест нового снапшота записывается одной транзакцией только после того, как tar дописан до конца.
+# Формат tar: первая запись `.snapshot/<id>.json` (id, base, удалённые пути), затем файлы, последняя запись
+# `.snapshot/<id>.sha256` (формат sha256sum) — --restore применяет цепочку по порядку, проверяя base и хеши.
+# Чтение ограничено --max-read-mib-s (общий лимит на процесс), чтобы не отнимать диск у хешера Syncthing.
+# Выгружаются обычные файлы (без симлинков и пустых директорий), служебные .stfolder/.stversions/.stcanary — нет.
+
+META_DIR = ".snapshot"
+STATE_NAME = ".snapshot-state.json"
+SKIP_NAMES = {".stfolder", ".stversions", CANARY_DIR}
+CHUNK = 1024 * 1024
+
+MANIFESTS_KEPT = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS manifest (
+    snapshot INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    PRIMARY KEY (snapshot, path)
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    base INTEGER,
+    created INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    files INTEGER NOT NULL DEFAULT 0,
+    bytes INTEGER NOT NULL DEFAULT 0,
+    deleted INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+class SnapshotBusy(Exception):
+    pass
+
+
+class UnknownBase(Exception):
+    pass
+
+
+class RateLimiter:
+    # Token bucket на прочитанные байты; один экземпляр на процесс (file_server отдаёт несколько папок сразу).
+    def __init__(self, mib_s: float) -> None:
+        self.rate = mib_s * 2**20
+        self.allowance = self.rate
+        self.last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, n: int) -> None:
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self.allowance = min(self.rate, self.allowance + (now - self.last) * self.rate) - n
+            self.last = now
+            wait = -self.allowance / self.rate if self.allowance < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+
+
+class _TarSource(io.RawIOBase):
+    # Файл для tarfile.addfile: считает sha256, соблюдает лимит чтения; если файл укоротился во время чтения
+    # (Syncthing его переписывает), добивает нулями до заявленного размера и помечает запись как неполную.
+    def __init__(self, f, size: int, limiter: RateLimiter) -> None:
+        self.f = f
+        self.left = size
+        self.limiter = limiter
+        self.sha = hashlib.sha256()
+        self.short = False
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, n: int = -1) -> bytes:
+        n = self.left if n is None or n < 0 else min(n, self.left)
+        if n <= 0:
+            return b""
+        self.limiter.consume(n)
+        data = b"" if self.short else self.f.read(n)
+        if len(data) < n:
+            self.short = True
+            data += b"\0" * (n - len(data))
+        self.sha.update(data)
+        self.left -= n
+        return data
+
+
+def hash_file(path: Path, limiter: RateLimiter) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        while True:
+            limiter.consume(CHUNK)
+            chunk = f.read(CHUNK)
+            if not chunk:
+                return h.hexdigest()
+            h.update(chunk)
+
+
+def folder_roots(config: Path, node: str) -> dict[str, tuple[Path, list[str]]]:
+    # folder id -> (корень на ноде, шарды верхнего уровня, которые родитель не выгружает).
+    with config.open("r", encoding="utf-8") as f:
+        cfg = expand_shards(yaml.safe_load(f) or {})
+    roots: dict[str, tuple[Path, list[str]]] = {}
+    for item in cfg.get("folders") or []:
+        if not isinstance(item, dict):
+            continue
+        folder_id = str(item.get("id") or "").strip()
+        path = (item.get("paths") or {}).get(node) if isinstance(item.get("paths"), dict) else None
+        # id — имя файла манифеста и часть URL: только безопасные имена.
+        if path and re.fullmatch(r"[A-Za-z0-9][A-Za-z0-9._-]*", folder_id):
+            roots[folder_id] = (Path(str(path)), list(item.get("shard_dirs") or []))
+    return roots
+
+
+def walk(root: Path, skip: list[str] | tuple[str, ...] = ()) -> dict[str, os.stat_result]:
+    files: dict[str, os.stat_result] = {}
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        try:
+            it = os.scandir(root / rel_dir if rel_dir else root)
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                if entry.name in SKIP_NAMES or entry.name.startswith((".syncthing.", "~syncthing~")):
+                    continue
+                if not rel_dir and entry.name in skip:
+                    continue
+                rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(rel)
+                    elif entry.is_file(follow_symlinks=False):
+                        files[rel] = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+    return files
+
+
+def safe_member(name: str) -> str | None:
+    # Путь из tar -> относительный путь внутри цели восстановления (или None для абсолютных/с `..`).
+    parts = [p for p in name.replace("\\", "/").split("/") if p not in ("", ".")]
+    if not parts or name.startswith("/") or ".." in parts:
+        return None
+    return "/".join(parts)
+
+
+class SnapshotExport:
+    # prepare() — обход, план и id снапшота (под flock папки); write() — tar в поток и фиксация манифеста.
+    def __init__(
+        self,
+        root: Path,
+        state_dir: Path,
+        *,
+        name: str,
+        full: bool,
+        limiter: RateLimiter,
+        base: int | None = None,
+        skip: list[str] | tuple[str, ...] = (),
+    ) -> None:
+        self.root = root
+        self.skip = skip
+        self.name = name
+        self.full = full
+        self.requested_base = base
+        self.limiter = limiter
+        state_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = open(state_dir / f"{name}.lock", "w")
+        try:
+            fcntl.flock(self._lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock.close()
+            raise SnapshotBusy(f"{name}: снапшот уже выгружается") from None
+        self.db = sqlite3.connect(state_dir / f"{name}.sqlite", check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        self.snapshot_id = 0
+        self.base: int | None = None
+        self.known: dict[str, tuple[int, int, str]] = {}
+        self.files: dict[str, os.stat_result] = {}
+        self.changed: list[str] = []
+        self.deleted: list[str] = []
+        self.stats = {"files": 0, "bytes": 0, "deleted": 0, "unchanged": 0, "incomplete": 0}
+
+    def close(self) -> None:
+        self.db.close()
+        self._lock.close()
+
+    def _kept(self) -> set[int]:
+        # Завершённые снапшоты, чьи манифесты хранятся (пустая папка — пустой манифест, он тоже годится как base).
+        rows = self.db.execute(
+            "SELECT id FROM snapshots WHERE state = 'done' ORDER BY id DESC LIMIT ?", (MANIFESTS_KEPT,)
+        )
+        return {r[0] for r in rows}
+
+    def prepare(self) -> None:
+        if self.full:
+            self.base = None
+        elif self.requested_base is not None:
+            if self.requested_base not in self._kept():
+                raise UnknownBase(
+                    f"{self.name}: нет манифеста снапшота {self.requested_base} "
+                    f"(хранятся последние {MANIFESTS_KEPT} завершённых) — нужен полный снапшот"
+                )
+            self.base = self.requested_base
+        else:
+            row = self.db.execute("SELECT MAX(id) FROM snapshots WHERE state = 'done'").fetchone()
+            self.base = row[0]
+        self.known = (
+            {}
+            if self.base is None
+            else {
+                p: (size, mtime_ns, sha)
+                for p, size, mtime_ns, sha in self.db.execute(
+                    "SELECT path, size, mtime_ns, sha256 FROM manifest WHERE snapshot = ?", (self.base,)
+                )
+            }
+        )
+        self.files = walk(self.root, self.skip)
+        self.changed = sorted(
+            rel
+            for rel, st in self.files.items()
+            if self.known.get(rel) is None or self.known[rel][:2] != (st.st_size, st.st_mtime_ns)
+        )
+        self.deleted = sorted(set(self.known) - set(self.files))
+        cur = self.db.execute(
+            "INSERT INTO snapshots (base, created, state) VALUES (?, ?, 'open')", (self.base, int(time.time()))
+        )
+        self.snapshot_id = cur.lastrowid
+        self.db.commit()
+
+    def _add_bytes(self, tar: tarfile.TarFile, name: str, data: bytes) -> None:
+        info = tarfile.TarInfo(f"{META_DIR}/{self.snapshot_id}{name}")
+        info.size = len(data)
+        info.mtime = int(time.time())
+        tar.addfile(info, io.BytesIO(data))
+
+    def write(self, out) -> dict:
+        pending: list[tuple[str, int, int, str]] = []
+        hashes: list[str] = []
+        try:
+            with tarfile.open(fileobj=out, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+                meta = {
+                    "snapshot": self.snapshot_id,
+                    "base": self.base,
+                    "folder": self.name,
+                    "created": int(time.time()),
+                    "deleted": self.deleted,
+                }
+                self._add_bytes(tar, ".json", json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+                for rel in self.changed:
+                    self._add_file(tar, rel, pending, hashes)
+                self._add_bytes(tar, ".sha256", "".join(hashes).encode("utf-8"))
+        except BaseException:
+            self.db.execute("UPDATE snapshots SET state = 'aborted' WHERE id = ?", (self.snapshot_id,))
+            self.db.commit()
+            raise
+        # tar дописан: одной транзакцией пишем манифест снапшота (манифест base + изменения) и закрываем снапшот.
+        sid = self.snapshot_id
+        with self.db:
+            if self.base is not None:
+                self.db.execute(
+                    "INSERT INTO manifest SELECT ?, path, size, mtime_ns, sha256 FROM manifest WHERE snapshot = ?",
+                    (sid, self.base),
+                )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO manifest VALUES (?, ?, ?, ?, ?)", [(sid, *row) for row in pending]
+            )
+            self.db.executemany(
+                "DELETE FROM manifest WHERE snapshot = ? AND path = ?", [(sid, p) for p in self.deleted]
+            )
+            self.stats["deleted"] = len(self.deleted)
+            self.db.execute(
+                "UPDATE snapshots SET state = 'done', files = ?, bytes = ?, deleted = ? WHERE id = ?",
+                (self.stats["files"], self.stats["bytes"], self.stats["deleted"], sid),
+            )
+            kept = self._kept()
+            self.db.execute(
+                f"DELETE FROM manifest WHERE snapshot NOT IN ({', '.join('?' * len(kept))})", tuple(kept)
+            )
+        return self.stats
+
+    def _add_file(self, tar: tarfile.TarFile, rel: str, pending: list, hashes: list) -> None:
+        path = self.root / rel
+        old = self.known.get(rel)
+        try:
+            st = path.stat()
+            # Тот же размер, другой mtime: возможно touch — сверяем хеш, прежде чем выгружать заново.
+            if old and old[0] == st.st_size and old[2]:
+                digest = hash_file(path, self.limiter)
+                if digest == old[2]:
+                    pending.append((rel, st.st_size, st.st_mtime_ns, digest))
+                    self.stats["unchanged"] += 1
+                    return
+            f = path.open("rb")
+        except OSError:
+            # Файл исчез между обходом и выгрузкой: в манифесте остаётся прежним (попадёт в следующий снапшот).
+            return
+        with f:
+            info = tarfile.TarInfo(rel)
+            info.size = st.st_size
+            info.mtime = st.st_mtime
+            info.mode = st.st_mode & 0o7777
+            source = _TarSource(f, st.st_size, self.limiter)
+            tar.addfile(info, source)
+        try:
+            after = path.stat()
+        except OSError:
+            after = None
+        if source.short or after is None or (after.st_size, after.st_mtime_ns) != (st.st_size, st.st_mtime_ns):
+            # Файл меняли во время чтения: в tar он есть, но в манифест — с mtime -1, чтобы выгрузить снова.
+            pending.append((rel, st.st_size, -1, ""))
+            self.stats["incomplete"] += 1
+        else:
+            digest = source.sha.hexdigest()
+            pending.append((rel, st.st_size, st.st_mtime_ns, digest))
+            hashes.append(f"{digest}  {rel}\n")
+        self.stats["files"] += 1
+        self.stats["bytes"] += st.st_size
+
+
+def history(state_dir: Path, name: str) -> list[dict]:
+    # can_base — снапшот годится как ?base= (завершён и его манифест ещё хранится).
+    path = state_dir / f"{name}.sqlite"
+    if not path.exists():
+        return []
+    db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = db.execute("SELECT id, base, created, state, files, bytes, deleted FROM snapshots ORDER BY id").fetchall()
+        kept = {
+            r[0]
+            for r in db.execute(
+                "SELECT id FROM snapshots WHERE state = 'done' ORDER BY id DESC LIMIT ?", (MANIFESTS_KEPT,)
+            )
+        }
+    except sqlite3.Error:
+        rows, kept = [], set()
+    db.close()
+    keys = ("id", "base", "created", "state", "files", "bytes", "deleted")
+    return [{**dict(zip(keys, row)), "can_base": row[0] in kept} for row in rows]
+
+
+def prune_empty_dirs(target: Path, rel: str) -> None:
+    parent = (target / rel).parent
+    while parent != target:
+        try:
+            parent.rmdir()
+        except OSError:
+            return
+        parent = parent.parent
+
+
+def restore(target: Path, archives: list[str]) -> list[int]:
+    # Применяет цепочку снапшотов по порядку; -> применённые id. Состояние цепочки — target/.snapshot-state.json.
+    target.mkdir(parents=True, exist_ok=True)
+    state_path = target / STATE_NAME
+    state = json.loads(state_path.read_text(encoding="utf-8")) if state_path.exists() else None
+    applied: list[int] = []
+    for archive in archives:
+        meta: dict | None = None
+        expected: dict[str, str] = {}
+        stream = sys.stdin.buffer if archive == "-" else open(archive, "rb")
+        with stream, tarfile.open(fileobj=stream, mode="r|*") as tar:
+            for member in tar:
+                rel = safe_member(member.name)
+                if rel is None:
+                    raise ValueError(f"{archive}: небезопасный путь {member.name!r}")
+                if meta is None:
+                    if not rel.startswith(f"{META_DIR}/") or not rel.endswith(".json"):
+                        raise ValueError(f"{archive}: не снапшот (первая запись {rel!r})")
+                    meta = json.loads(tar.extractfile(member).read().decode("utf-8"))
+                    have = state["snapshot"] if state else None
+                    if meta["base"] is None and have is not None:
+                        raise ValueError(f"{archive}: полный снапшот {meta['snapshot']} — восстанавливай в пустую директорию")
+                    if meta["base"] is not None and meta["base"] != have:
+                        raise ValueError(
+                            f"{archive}: снапшот {meta['snapshot']} строится на {meta['base']}, а применён {have}"
+                        )
+                    # Удаления — до распаковки: путь мог смениться с файла на директорию и обратно.
+                    for path in meta["deleted"]:
+                        victim = target / path
+                        if victim.is_file() or victim.is_symlink():
+                            victim.unlink()
+                            prune_empty_dirs(target, path)
+                    continue
+                if rel.startswith(f"{META_DIR}/"):
+                    if rel.endswith(".sha256"):
+                        for line in tar.extractfile(member).read().decode("utf-8").splitlines():
+                            digest, _, path = line.partition("  ")
+                            expected[path] = digest
+                    continue
+                if not member.isfile():
+                    continue
+                dest = target / rel
+                if dest.is_dir():
+                    shutil.rmtree(dest)
+                tar.extract(member, target, filter="data")
+        if meta is None:
+            raise ValueError(f"{archive}: пустой архив")
+        for path, digest in expected.items():
+            actual = hashlib.sha256((target / path).read_bytes()).hexdigest()
+            if actual != digest:
+                raise ValueError(f"{archive}: {path}: sha256 не совпал после распаковки")
+        state = {"snapshot": meta["snapshot"], "folder": meta["folder"], "applied": int(time.time())}
+        state_path.write_text(json.dumps(state), encoding="utf-8")
+        applied.append(meta["snapshot"])
+    return applied
+
+
+def tree_digest(root: Path) -> dict[str, str]:
+    return {
+        rel: hashlib.sha256((root / rel).read_bytes()).hexdigest()
+        for rel in walk(root)
+        if rel != STATE_NAME
+    }
+
+
+def selftest() -> int:
+    # Локальная проверка цепочки: полный + 2 инкремента (правки, удаления, файл <-> директория, touch).
+    limiter = RateLimiter(0)
+    with tempfile.TemporaryDirectory(prefix="snapshot-selftest-") as tmp:
+        src, state_dir, dst = Path(tmp, "src"), Path(tmp, "state"), Path(tmp, "restore")
+        (src / "a/b").mkdir(parents=True)
+        (src / "a/b/keep.txt").write_text("keep\n")
+        (src / "a/edit.jsonl").write_text('{"n": 1}\n')
+        (src / "gone.bin").write_bytes(os.urandom(100_000))
+        (src / "becomes_dir").write_text("file\n")
+        (src / "dir_becomes_file").mkdir()
+        (src / "dir_becomes_file/x").write_text("x\n")
+        (src / ".stfolder").mkdir()
+
+        def step(n: int, base: int | None = None) -> tuple[Path, dict]:
+            export = SnapshotExport(src, state_dir, name="src", full=False, limiter=limiter, base=base)
+            try:
+                export.prepare()
+                path = Path(tmp, f"{n}.tar")
+                with path.open("wb") as out:
+                    stats = export.write(out)
+            finally:
+                export.close()
+            return path, stats
+
+        chain = [step(1)[0]]
+        (src / "a/edit.jsonl").write_text('{"n": 1}\n{"n": 2}\n')
+        (src / "gone.bin").unlink()
+        (src / "new.txt").write_text("new\n")
+        chain.append(step(2)[0])
+        (src / "becomes_dir").unlink()
+        (src / "becomes_dir").mkdir()
+        (src / "becomes_dir/inner.txt").write_text("inner\n")
+        shutil.rmtree(src / "dir_becomes_file")
+        (src / "dir_becomes_file").write_text("now a file\n")
+        os.utime(src / "a/b/keep.txt", ns=(0, 10**18))
+        path, stats = step(3)
+        chain.append(path)
+        if stats["unchanged"] != 1:
+            print(f"FAIL: touch без изменений выгружен заново: {stats}", file=sys.stderr)
+            return 1
+
+        try:
+            restore(Path(tmp, "broken"), [str(chain[0]), str(chain[2])])
+        except ValueError as e:
+            print(f"OK: разрыв цепочки обнаружен ({e})")
+        else:
+            print("FAIL: цепочка 1 -> 3 применилась без 2", file=sys.stderr)
+            return 1
+
+        # Снапшот 4 «потерялся» у клиента (сервер считает его завершённым): 5 строится на 3, который у клиента есть.
+        (src / "lost.txt").write_text("lost\n")
+        step(4)
+        (src / "new.txt").write_text("new, edited\n")
+        chain.append(step(5, base=3)[0])
+        try:
+            step(6, base=999)
+        except UnknownBase as e:
+            print(f"OK: неизвестный base отклонён ({e})")
+        else:
+            print("FAIL: снапшот на несуществующем base", file=sys.stderr)
+            return 1
+
+        applied = restore(dst, [str(p) for p in chain])
+        want, got = tree_digest(src), tree_digest(dst)
+        if want != got:
+            print(f"FAIL: восстановленное дерево отличается: {sorted(set(want.items()) ^ set(got.items()))}", file=sys.stderr)
+            return 1
+        sizes = ", ".join(f"{p.name} {p.stat().st_size} B" for p in chain)
+        print(f"OK: цепочка {applied} восстановлена, {len(got)} файл(ов) совпадают ({sizes})")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Incremental tar snapshots of Amvera sync folders.")
+    parser.add_argument("--config", default=os.environ.get("SYNC_CONFIG", "/app/sync-folders.yaml"))
+    parser.add_argument("--node", default="amvera", help="Нода, чьи paths.<node> выгружаются")
+    parser.add_argument("--folder", help="Folder id из --config")
+    parser.add_argument(
+        "--state-dir",
+        default=os.environ.get("SNAPSHOT_STATE_DIR", "/data/syncthing/snapshots"),
+        help="Манифесты снапшотов (SQLite на папку)",
+    )
+    parser.add_argument("-o", "--output", default="-", help="Куда писать tar (- — stdout)")
+    parser.add_argument("--full", action="store_true", help="Полный снапшот (начать новую цепочку)")
+    parser.add_argument(
+        "--base", type=int, help="Инкремент относительно этого снапшота (последний, что есть у получателя)"
+    )
+    parser.add_argument(
+        "--max-read-mib-s",
+        type=float,
+        default=float(os.environ.get("SNAPSHOT_MAX_READ_MIB_S", "20") or 0),
+        help="Лимит чтения с диска, MiB/s (0 — без лимита)",
+    )
+    parser.add_argument("--list", action="store_true", help="История снапшотов --folder (JSON)")
+    parser.add_argument("--restore", metavar="DIR", help="Применить цепочку tar (позиционные аргументы) к DIR")
+    parser.add_argument("--selftest", action="store_true", help="Локальная проверка: полный + инкременты -> restore")
+    parser.add_argument("archives", nargs="*", help="Снапшоты для --restore по порядку (- — stdin)")
+    args = parser.parse_args()
+
+    if args.selftest:
+        return selftest()
+    if args.restore:
+        if not args.archives:
+            parser.error("--restore: укажи tar-файлы цепочки")
+        try:
+            applied = restore(Path(args.restore), args.archives)
+        except (OSError, ValueError, tarfile.TarError) as e:
+            print(f"[snapshot] ERROR: {e}", file=sys.stderr)
+            return 1
+        print(f"[snapshot] restored {applied} into {args.restore}", file=sys.stderr)
+        return 0
+    if not args.folder:
+        parser.error("--folder обязателен (или --restore/--selftest)")
+    state_dir = Path(args.state_dir)
+    if args.list:
+        print(json.dumps(history(state_dir, args.folder), indent=2))
+        return 0
+    try:
+        roots = folder_roots(Path(args.config), args.node)
+    except (OSError, ValueError, yaml.YAMLError) as e:
+        print(f"[snapshot] ERROR: {args.config}: {e}", file=sys.stderr)
+        return 1
+    if args.folder not in roots or not roots[args.folder][0].is_dir():
+        print(f"[snapshot] ERROR: нет папки {args.folder} с paths.{args.node} на диске", file=sys.stderr)
+        return 1
+    root, skip = roots[args.folder]
+    try:
+        export = SnapshotExport(
+            root,
+            state_dir,
+            name=args.folder,
+            full=args.full,
+            limiter=RateLimiter(args.max_read_mib_s),
+            base=args.base,
+            skip=skip,
+        )
+    except SnapshotBusy as e:
+        print(f"[snapshot] ERROR: {e}", file=sys.stderr)
+        return 1
+    try:
+        try:
+            export.prepare()
+        except UnknownBase as e:
+            print(f"[snapshot] ERROR: {e}", file=sys.stderr)
+            return 1
+        out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+        with out:
+            stats = export.write(out)
+    finally:
+        export.close()
+    kind = f"incremental on {export.base}" if export.base else "full"
+    print(
+        f"[snapshot] {args.folder} #{export.snapshot_id} ({kind}): files={stats['files']} bytes={stats['bytes']} "
+        f"deleted={stats['deleted']} unchanged={stats['unchanged']} incomplete={stats['incomplete']}",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
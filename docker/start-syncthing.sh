@@ -12,7 +12,8 @@ if [ ! -f "$STHOMEDIR/config.xml" ]; then
   /bin/syncthing generate --home "$STHOMEDIR" --no-default-folder --skip-port-probing
 fi
 
-# Простой HTTP file browser (для ручного скачивания версий из /data/syncthing/versions).
+# HTTP file browser (для ручного скачивания версий из /data/syncthing/versions):
+# пул потоков, sendfile, Range, zip-выгрузка директорий, /healthz.
 root="${FILE_BROWSER_ROOT:-/data/syncthing/versions}"
 port="${FILE_BROWSER_PORT:-80}"
 
@@ -20,32 +21,115 @@ if [ "${FILE_BROWSER_ENABLED:-0}" = "1" ]; then
   mkdir -p "$root" >/dev/null 2>&1 || true
   echo "[file-browser] enabled: serving $root on :$port"
   # NB: без аутентификации. Если нужно ограничить доступ — добавим позже.
-  python3 -m http.server "$port" --directory "$root" &
+  set --
+  if [ "${SNAPSHOT_EXPORT_ENABLED:-0}" = "1" ]; then
+    # /snapshots/: инкрементальные tar-снапшоты папок Syncthing по folder id из $SYNC_CONFIG (snapshot_export.py).
+    [ -n "${SNAPSHOT_TOKEN:-}" ] || echo "[file-browser] WARN: SNAPSHOT_TOKEN is empty, /snapshots/ is public" >&2
+    set -- --snapshots --config "${SYNC_CONFIG:-/app/sync-folders.yaml}"
+  fi
+  python3 /app/docker/file_server.py --root "$root" --port "$port" "$@" &
 else
   # Amvera обычно ожидает, что containerPort будет слушаться.
-  # Чтобы деплой не ломался при FILE_BROWSER_ENABLED=0, поднимаем заглушку.
+  # Чтобы деплой не ломался при FILE_BROWSER_ENABLED=0, поднимаем заглушку (тот же сервер, только /healthz).
   echo "[file-browser] disabled: serving stub on :$port"
-  python3 - <<PY &
-from http.server import BaseHTTPRequestHandler, HTTPServer
+  python3 /app/docker/file_server.py --root "$root" --port "$port" --disabled &
+fi
+
+# Периодические фоновые задачи: schedule <name> <interval_s> <command...>; interval 0/пусто — выключено.
+schedule() {
+  name="$1"
+  interval="$2"
+  shift 2
+  case "$interval" in
+    ''|0)
+      echo "[$name] disabled"
+      return 0
+      ;;
+  esac
+  echo "[$name] every ${interval}s"
+  (
+    while :; do
+      sleep "$interval"
+      nice -n 10 "$@" || echo "[$name] failed (exit $?)" >&2
+    done
+  ) &
+}
+
+# Дедупликация хранилища версий (hardlink одинакового содержимого).
+schedule versions-dedup "${VERSIONS_DEDUP_INTERVAL_S:-0}" \
+  python3 /app/docker/versions_dedup.py --root /data/syncthing/versions
+
+# Сжатие старых версий на месте (имена/mtime те же — keep/cleanoutDays Syncthing не меняются); манифест
+# /data/syncthing/versions-compress.sqlite, по нему file browser отдаёт их распакованными.
+schedule versions-compress "${VERSIONS_COMPRESS_INTERVAL_S:-0}" \
+  python3 /app/docker/versions_compress.py --root /data/syncthing/versions \
+  --min-age-days "${VERSIONS_COMPRESS_MIN_AGE_DAYS:-7}"
+
+# Глобальный бюджет версий (nodes.amvera.persistent_size_gb минус живые данные папок): удаляет наименее ценные версии.
+schedule versions-retention "${VERSIONS_RETENTION_INTERVAL_S:-0}" \
+  python3 /app/docker/versions_retention.py --config "${SYNC_CONFIG:-/app/sync-folders.yaml}" \
+  --root /data/syncthing/versions --config-xml "$STHOMEDIR/config.xml"
+
+# Индекс хранилища версий для поиска (/api/versions на file browser): полный проход по mtime при старте,
+# дальше — по событиям ItemFinished Syncthing и полный проход раз в час.
+if [ "${VERSIONS_INDEX_ENABLED:-0}" = "1" ]; then
+  echo "[versions-index] enabled"
+  nice -n 10 python3 /app/docker/versions_index.py --root /data/syncthing/versions --watch \
+    --config-xml "$STHOMEDIR/config.xml" &
+fi
+
+# Метрики Syncthing (Prometheus text format) на :$METRICS_PORT/metrics. Экспортер берёт API key из config.xml
+# и сам ждёт, пока поднимется REST API (до этого отдаёт syncthing_up 0).
+if [ "${METRICS_ENABLED:-0}" = "1" ]; then
+  echo "[exporter] enabled on :${METRICS_PORT:-9090}"
+  python3 /app/scripts/st_exporter.py --config-xml "$STHOMEDIR/config.xml" --port "${METRICS_PORT:-9090}" &
+fi
 
-class Handler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        self.send_response(404)
-        self.send_header("Content-Type", "text/plain; charset=utf-8")
-        self.end_headers()
-        self.wfile.write(b"File browser is disabled (FILE_BROWSER_ENABLED=0).\\n")
+# Лимиты скорости по расписанию (bandwidth_schedule в sync-folders.yaml) — на лету через REST API.
+if [ "${BANDWIDTH_SCHEDULER_ENABLED:-0}" = "1" ]; then
+  echo "[bandwidth] enabled"
+  python3 /app/scripts/bandwidth_scheduler.py --config "${SYNC_CONFIG:-/app/sync-folders.yaml}" \
+    --node amvera --config-xml "$STHOMEDIR/config.xml" &
+fi
 
-    def log_message(self, format, *args):  # noqa: A002
-        return
+# Пауза bulk-папок (priority: bulk), пока interactive-папки догоняют, и pause_windows — через REST API.
+if [ "${PRIORITY_CONTROLLER_ENABLED:-0}" = "1" ]; then
+  echo "[priority] enabled"
+  python3 /app/scripts/priority_controller.py --config "${SYNC_CONFIG:-/app/sync-folders.yaml}" \
+    --node amvera --config-xml "$STHOMEDIR/config.xml" &
+fi
 
-HTTPServer(("0.0.0.0", int("$port")), Handler).serve_forever()
-PY
+# Канарейка задержки: проба в .stcanary/ каждой папки раз в CANARY_INTERVAL_S и гистограммы доставки проб
+# других нод ($STHOMEDIR/.canary.json; экспортер метрик отдаёт их как syncthing_canary_latency_seconds).
+if [ "${CANARY_ENABLED:-0}" = "1" ]; then
+  echo "[canary] enabled, every ${CANARY_INTERVAL_S:-60}s"
+  python3 /app/scripts/sync_canary.py --config "${SYNC_CONFIG:-/app/sync-folders.yaml}" \
+    --node amvera --config-xml "$STHOMEDIR/config.xml" --interval "${CANARY_INTERVAL_S:-60}" &
 fi
 
 # Настройка папок/игноров/версий на основе sync-folders.yaml и AMVERA_ALLOWED_DEVICE_IDS.
+# Если входы (YAML, шаблоны, env, config.xml) не менялись с прошлого старта — шаг пропускается
+# по fingerprint в $STHOMEDIR/.configure-fingerprint.json. CONFIGURE_FORCE=1 — применить заново.
+configure_force=""
+[ "${CONFIGURE_FORCE:-0}" = "1" ] && configure_force="--force"
 python3 /app/docker/configure_syncthing.py \
   --config "${SYNC_CONFIG:-/app/sync-folders.yaml}" \
   --home "$STHOMEDIR" \
-  --node amvera
+  --node amvera \
+  $configure_force
+
+# Горячее применение правок $SYNC_CONFIG (например, примонтированного с тома): diff с /rest/config запущенного
+# Syncthing, PATCH/PUT/DELETE только изменённых папок/устройств — остальные папки не перезапускаются.
+case "${CONFIG_WATCH_INTERVAL_S:-0}" in
+  ''|0) echo "[reload] disabled" ;;
+  *)
+    echo "[reload] watching ${SYNC_CONFIG:-/app/sync-folders.yaml} every ${CONFIG_WATCH_INTERVAL_S}s"
+    python3 /app/docker/configure_syncthing.py \
+      --config "${SYNC_CONFIG:-/app/sync-folders.yaml}" \
+      --home "$STHOMEDIR" \
+      --node amvera \
+      --watch "$CONFIG_WATCH_INTERVAL_S" &
+    ;;
+esac
 
 exec /bin/syncthing serve --home "$STHOMEDIR" --no-browser
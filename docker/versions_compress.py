@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import fcntl
+import gzip
+import hashlib
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from versions_index import parse_version
+
+try:
+    import zstandard
+except ImportError:  # без py3-zstandard — только gzip
+    zstandard = None
+
+# Сжатие старых версий в хранилище (/data/syncthing/versions): версии старше --min-age-days (по метке
+# `~YYYYMMDD-HHMMSS` в имени) сжимаются на месте — имя, mtime, права и владелец не меняются, поэтому учёт
+# Syncthing (keep — по числу версий с тем же именем без метки, cleanoutDays — по mtime файла) остаётся прежним.
+# Кодек (zstd или gzip) выбирается по замеру на начале файла; если экономия меньше --min-saving-pct, файл
+# отмечается как несжимаемый и больше не проверяется. Сжатие — в пуле процессов, каждый результат проверяется
+# распаковкой (sha256) до подмены.
+# Манифест — SQLite вне хранилища: file -> (кодек, исходный размер, размер на диске). Запись манифеста
+# коммитится до rename временного файла на место версии, а запись считается действительной, только если
+# размер файла равен сжатому и файл начинается с сигнатуры кодека — прерванный прогон (kill, рестарт
+# контейнера) оставляет либо несжатый файл с недействительной записью, либо сжатый с действительной;
+# следующий прогон продолжает с того же места. Hardlink'и (versions_dedup.py) сжимаются один раз на inode.
+# file_server.py отдаёт сжатые версии распакованными на лету под исходными именами.
+# ВНИМАНИЕ: restore такой версии через GUI Syncthing или /rest/folder/restore запишет в живую папку сжатые байты,
+# и они разойдутся по всем нодам. Поэтому в контейнере выключено по умолчанию (VERSIONS_COMPRESS_INTERVAL_S=0):
+# включать, только если версии восстанавливают исключительно через file browser.
+
+CHUNK = 1024 * 1024
+SAMPLE = 1024 * 1024
+TMP_PREFIX = ".vcompress-"
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 9
+# Доля, на которую zstd может проиграть gzip по размеру и всё равно быть выбран (распаковка в разы быстрее).
+ZSTD_TIE = 0.02
+MAGIC = {"gzip": b"\x1f\x8b", "zstd": b"\x28\xb5\x2f\xfd"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS compressed (
+    file TEXT PRIMARY KEY,
+    codec TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    stored_size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    seen INTEGER NOT NULL
+);
+"""
+
+
+def codecs() -> list[str]:
+    return ["zstd", "gzip"] if zstandard is not None else ["gzip"]
+
+
+def compress_bytes(codec: str, data: bytes) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def open_writer(codec: str, dst, size: int):
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(dst, size=size, closefd=False)
+    return gzip.GzipFile(fileobj=dst, mode="wb", compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def open_reader(codec: str, src):
+    # Поток распакованных данных поверх открытого файла (закрытие reader'а файл не закрывает).
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().stream_reader(src, closefd=False)
+    return gzip.GzipFile(fileobj=src, mode="rb")
+
+
+def has_magic(path: str | Path, codec: str) -> bool:
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC[codec])) == MAGIC[codec]
+    except OSError:
+        return False
+
+
+def open_manifest(path: Path, *, readonly: bool = False) -> sqlite3.Connection:
+    if readonly:
+        return sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    db = sqlite3.connect(path, timeout=30)
+    # WAL: file_server читает манифест, пока идёт прогон.
+    db.execute("PRAGMA journal_mode=WAL")
+    db.executescript(SCHEMA)
+    return db
+
+
+def lookup(db: sqlite3.Connection, file: str, path: str | Path, st: os.stat_result) -> tuple[str, int] | None:
+    # -> (кодек, исходный размер), если версия `file` (путь от корня хранилища) сейчас лежит сжатой.
+    row = db.execute("SELECT codec, size, stored_size FROM compressed WHERE file = ?", (file,)).fetchone()
+    if not row or row[0] not in codecs() or st.st_size != row[2]:
+        return None
+    return (row[0], row[1]) if has_magic(path, row[0]) else None
+
+
+def lookup_dir(db: sqlite3.Connection, rel_dir: str) -> dict[str, tuple[str, int, int]]:
+    # -> имя файла -> (кодек, исходный размер, размер на диске) для сжатых записей директории (без проверки файлов).
+    prefix = f"{rel_dir.strip('/')}/" if rel_dir.strip("/") else ""
+    rows = db.execute(
+        "SELECT file, codec, size, stored_size FROM compressed WHERE codec != '' AND file >= ? AND file < ?",
+        (prefix, prefix + "\U0010ffff"),
+    )
+    result: dict[str, tuple[str, int, int]] = {}
+    for file, codec, size, stored in rows:
+        name = file[len(prefix):]
+        if "/" not in name:
+            result[name] = (codec, size, stored)
+    return result
+
+
+def scan(root: Path) -> list[tuple[str, os.stat_result]]:
+    files: list[tuple[str, os.stat_result]] = []
+    stack = [str(root)]
+    while stack:
+        cur = stack.pop()
+        try:
+            it = os.scandir(cur)
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                    continue
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                if entry.name.startswith(TMP_PREFIX):
+                    # Остаток прерванного прогона (под flock других прогонов нет).
+                    try:
+                        os.unlink(entry.path)
+                    except OSError:
+                        pass
+                    continue
+                if entry.name.startswith((".dedup-", ".syncthing.")):
+                    continue
+                try:
+                    files.append((entry.path, entry.stat(follow_symlinks=False)))
+                except OSError:
+                    continue
+    return files
+
+
+def pick_codec(path: str, min_saving: float) -> tuple[str, float]:
+    # -> (кодек или "", доля размера после сжатия на замере начала файла).
+    with open(path, "rb") as f:
+        sample = f.read(SAMPLE)
+    if not sample:
+        return "", 1.0
+    sizes = {codec: len(compress_bytes(codec, sample)) for codec in codecs()}
+    best = min(sizes, key=sizes.get)
+    if "zstd" in sizes and sizes["zstd"] <= sizes[best] * (1 + ZSTD_TIE):
+        best = "zstd"
+    ratio = sizes[best] / len(sample)
+    return (best if ratio <= 1 - min_saving else ""), ratio
+
+
+def compress_one(path: str, tmp: str, min_saving: float, dry_run: bool) -> tuple[str, int, int]:
+    # Рабочий процесс пула: -> (кодек или "" — несжимаемо, исходный размер, размер сжатого в tmp).
+    st = os.stat(path)
+    codec, ratio = pick_codec(path, min_saving)
+    if not codec:
+        return codec, st.st_size, st.st_size
+    if dry_run:
+        return codec, st.st_size, int(st.st_size * ratio)
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as src, open(tmp, "xb") as dst:
+            with open_writer(codec, dst, st.st_size) as w:
+                while chunk := src.read(CHUNK):
+                    digest.update(chunk)
+                    w.write(chunk)
+            dst.flush()
+            os.fsync(dst.fileno())
+        check = hashlib.sha256()
+        with open(tmp, "rb") as f, open_reader(codec, f) as r:
+            while chunk := r.read(CHUNK):
+                check.update(chunk)
+        after = os.stat(path)
+        if check.digest() != digest.digest() or (after.st_size, after.st_mtime_ns) != (st.st_size, st.st_mtime_ns):
+            raise OSError(f"{path}: изменился во время сжатия или не прошёл проверку")
+        stored = os.stat(tmp).st_size
+        if stored > st.st_size * (1 - min_saving):
+            os.unlink(tmp)
+            return "", st.st_size, st.st_size
+        os.chmod(tmp, st.st_mode & 0o7777)
+        try:
+            os.chown(tmp, st.st_uid, st.st_gid)
+        except PermissionError:
+            pass
+        os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    return codec, st.st_size, stored
+
+
+def replace_all(tmp: str, paths: list[str]) -> int:
+    # tmp -> первая версия (rename), остальные ссылки того же inode — hardlink на неё + rename (как в dedup).
+    os.replace(tmp, paths[0])
+    done = 1
+    for path in paths[1:]:
+        link = os.path.join(os.path.dirname(path), f"{TMP_PREFIX}{os.getpid()}-{os.path.basename(path)}")
+        try:
+            os.link(paths[0], link)
+            os.replace(link, path)
+            done += 1
+        except OSError as e:
+            print(f"[versions-compress] WARN: {path}: {e}", file=sys.stderr)
+    return done
+
+
+def run(
+    root: Path,
+    manifest_path: Path,
+    *,
+    min_age_days: float,
+    min_size: int,
+    min_saving: float,
+    workers: int,
+    dry_run: bool,
+) -> dict:
+    t0 = time.perf_counter()
+    run_id = time.time_ns()
+    db = open_manifest(manifest_path)
+    files = scan(root)
+    known = {
+        file: (codec, size, stored, mtime_ns)
+        for file, codec, size, stored, mtime_ns in db.execute(
+            "SELECT file, codec, size, stored_size, mtime_ns FROM compressed"
+        )
+    }
+    cutoff = time.time() - min_age_days * 86400
+    stats = dict.fromkeys(
+        ("aged", "already", "compressed", "incompressible", "failed", "bytes_before", "bytes_after"), 0
+    )
+    stats["files"] = len(files)
+    seen: list[str] = []
+    # Кандидаты по inode: hardlink'и одной версии (dedup) сжимаются один раз.
+    groups: dict[tuple[int, int], list[str]] = {}
+    for path, st in files:
+        parsed = parse_version(os.path.basename(path))
+        if not parsed or parsed[1] > cutoff:
+            continue
+        file = os.path.relpath(path, root)
+        row = known.get(file)
+        # Сжатая версия может стать меньше --min-size: порог — только для ещё не проверенных.
+        if not row and st.st_size < min_size:
+            continue
+        stats["aged"] += 1
+        if row:
+            codec, size, stored, mtime_ns = row
+            # Несжимаемый файл не менялся / сжатый всё ещё на месте — пропускаем.
+            if codec:
+                valid = st.st_size == stored and has_magic(path, codec)
+            else:
+                valid = (st.st_size, st.st_mtime_ns) == (size, mtime_ns)
+            if valid:
+                seen.append(file)
+                stats["already"] += 1
+                continue
+        groups.setdefault((st.st_dev, st.st_ino), []).append(path)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for paths in groups.values():
+            tmp = os.path.join(os.path.dirname(paths[0]), f"{TMP_PREFIX}{os.getpid()}-{os.path.basename(paths[0])}")
+            futures[pool.submit(compress_one, paths[0], tmp, min_saving, dry_run)] = (paths, tmp)
+        for future in as_completed(futures):
+            paths, tmp = futures[future]
+            try:
+                codec, size, stored = future.result()
+            except OSError as e:
+                print(f"[versions-compress] WARN: {e}", file=sys.stderr)
+                stats["failed"] += 1
+                continue
+            rel = [os.path.relpath(p, root) for p in paths]
+            try:
+                mtime_ns = os.stat(paths[0]).st_mtime_ns
+            except OSError as e:
+                # Версию удалили во время прогона (cleanoutDays Syncthing, versions_retention).
+                print(f"[versions-compress] WARN: {paths[0]}: {e.strerror or e}", file=sys.stderr)
+                stats["failed"] += 1
+                try:
+                    os.unlink(tmp)
+                except OSError:
+                    pass
+                continue
+            seen.extend(rel)
+            if not codec:
+                stats["incompressible"] += 1
+                if not dry_run:
+                    db.executemany(
+                        "INSERT OR REPLACE INTO compressed VALUES (?, '', ?, ?, ?, ?)",
+                        [(f, size, size, mtime_ns, run_id) for f in rel],
+                    )
+                    db.commit()
+                continue
+            stats["compressed"] += 1
+            stats["bytes_before"] += size
+            stats["bytes_after"] += stored
+            if dry_run:
+                continue
+            # Сначала манифест, потом rename: запись без сжатого файла недействительна (см. lookup).
+            db.executemany(
+                "INSERT OR REPLACE INTO compressed VALUES (?, ?, ?, ?, ?, ?)",
+                [(f, codec, size, stored, mtime_ns, run_id) for f in rel],
+            )
+            db.commit()
+            try:
+                replace_all(tmp, paths)
+            except OSError as e:
+                print(f"[versions-compress] WARN: {paths[0]}: {e}", file=sys.stderr)
+                stats["failed"] += 1
+                try:
+                    os.unlink(tmp)
+                except OSError:
+                    pass
+
+    if not dry_run:
+        # Прогон дошёл до конца: записи версий, удалённых Syncthing/retention, больше не нужны.
+        db.executemany("UPDATE compressed SET seen = ? WHERE file = ?", [(run_id, f) for f in seen])
+        db.execute("DELETE FROM compressed WHERE seen != ?", (run_id,))
+        db.commit()
+    db.close()
+    stats["seconds"] = round(time.perf_counter() - t0, 3)
+    return stats
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compress aged versions in the Syncthing versions store in place.")
+    parser.add_argument("--root", default="/data/syncthing/versions", help="Корень хранилища версий")
+    parser.add_argument(
+        "--manifest",
+        default=os.environ.get("VERSIONS_COMPRESS_MANIFEST", "/data/syncthing/versions-compress.sqlite"),
+        help="SQLite манифест сжатых версий (вне --root, читает file_server.py)",
+    )
+    parser.add_argument("--min-age-days", type=float, default=7, help="Сжимать версии старше N дней (по метке в имени)")
+    parser.add_argument("--min-size", type=int, default=4096, help="Меньшие файлы не трогаем (экономии почти нет)")
+    parser.add_argument("--min-saving-pct", type=float, default=10, help="Минимальная экономия, %% от размера файла")
+    parser.add_argument("--workers", type=int, default=2, help="Процессов сжатия")
+    parser.add_argument("--dry-run", action="store_true", help="Только оценить по замеру, ничего не сжимать")
+    args = parser.parse_args()
+
+    root = Path(args.root)
+    if not root.is_dir():
+        print(f"[versions-compress] skip: нет {root}", file=sys.stderr)
+        return 0
+    manifest = Path(args.manifest)
+    manifest.parent.mkdir(parents=True, exist_ok=True)
+    # Один прогон за раз: scan() удаляет временные файлы, считая их остатками прерванного прогона.
+    with open(f"{manifest}.lock", "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            print("[versions-compress] skip: уже идёт другой прогон", file=sys.stderr)
+            return 0
+        stats = run(
+            root,
+            manifest,
+            min_age_days=args.min_age_days,
+            min_size=args.min_size,
+            min_saving=args.min_saving_pct / 100,
+            workers=max(1, args.workers),
+            dry_run=args.dry_run,
+        )
+    prefix = "[versions-compress] dry-run" if args.dry_run else "[versions-compress]"
+    print(
+        f"{prefix} codecs={','.join(codecs())} files={stats['files']} aged={stats['aged']} "
+        f"already={stats['already']} compressed={stats['compressed']} ({stats['bytes_before']} -> "
+        f"{stats['bytes_after']} bytes) incompressible={stats['incompressible']} failed={stats['failed']} "
+        f"in {stats['seconds']}s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
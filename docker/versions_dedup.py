@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Дедупликация хранилища версий (/data/syncthing/versions/<folder_id>): одинаковые по содержимому
+# файлы (переносы между папками, откаты правок, копии репозиториев) сводятся в hardlink'и.
+# Хеши хранятся в SQLite по ключу (dev, inode, size, mtime) — повторный прогон хеширует только новое.
+# Syncthing (simple/staggered) удаляет версии по cleanoutDays по mtime файла, а mtime при архивации = время
+# архивации: hardlink'и делят inode и mtime, поэтому линкуются только файлы с одинаковым mtime — иначе более новая
+# версия получила бы mtime старой и удалилась бы раньше срока. Удаление версии снимает одну ссылку.
+
+CHUNK = 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hashes (
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    seen INTEGER NOT NULL,
+    PRIMARY KEY (dev, ino, size, mtime_ns)
+);
+"""
+
+
+class Entry:
+    __slots__ = ("path", "dev", "ino", "size", "mtime_ns", "nlink", "mode", "uid", "gid")
+
+    def __init__(self, path: str, st: os.stat_result) -> None:
+        self.path = path
+        self.dev = st.st_dev
+        self.ino = st.st_ino
+        self.size = st.st_size
+        self.mtime_ns = st.st_mtime_ns
+        self.nlink = st.st_nlink
+        self.mode = st.st_mode
+        self.uid = st.st_uid
+        self.gid = st.st_gid
+
+    @property
+    def key(self) -> tuple[int, int, int, int]:
+        return self.dev, self.ino, self.size, self.mtime_ns
+
+
+def scan(root: Path, min_size: int) -> list[Entry]:
+    entries: list[Entry] = []
+    stack = [str(root)]
+    while stack:
+        cur = stack.pop()
+        try:
+            it = os.scandir(cur)
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    # Временные файлы dedup/Syncthing не трогаем.
+                    if entry.name.startswith((".dedup-", ".vcompress-", ".syncthing.")):
+                        continue
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if st.st_size >= min_size:
+                        entries.append(Entry(entry.path, st))
+    return entries
+
+
+def hash_file(path: str) -> str | None:
+    h = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            while chunk := f.read(CHUNK):
+                h.update(chunk)
+    except OSError:
+        return None
+    return h.hexdigest()
+
+
+def same_content(a: str, b: str) -> bool:
+    try:
+        with open(a, "rb") as fa, open(b, "rb") as fb:
+            while True:
+                ca = fa.read(CHUNK)
+                cb = fb.read(CHUNK)
+                if ca != cb:
+                    return False
+                if not ca:
+                    return True
+    except OSError:
+        return False
+
+
+def relink(canonical: str, target: str) -> bool:
+    # link во временное имя + rename: target всегда существует (атомарная подмена).
+    tmp = os.path.join(os.path.dirname(target), f".dedup-{os.getpid()}-{os.path.basename(target)}")
+    try:
+        os.link(canonical, tmp)
+        os.replace(tmp, target)
+    except OSError as e:
+        print(f"[dedup] WARN: {target}: {e}", file=sys.stderr)
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        return False
+    return True
+
+
+def open_index(path: Path) -> sqlite3.Connection:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.executescript(SCHEMA)
+    return db
+
+
+def run(root: Path, index_path: Path, *, workers: int, min_size: int, dry_run: bool, verify: bool) -> dict:
+    t0 = time.perf_counter()
+    run_id = int(time.time())
+    entries = scan(root, min_size)
+
+    # Хешировать имеет смысл только размеры, у которых есть >= 2 разных inode.
+    by_size: dict[tuple[int, int], set[int]] = {}
+    for e in entries:
+        by_size.setdefault((e.dev, e.size), set()).add(e.ino)
+    candidates = [e for e in entries if len(by_size[(e.dev, e.size)]) > 1]
+
+    db = open_index(index_path)
+    known: dict[tuple[int, int, int, int], str] = {}
+    to_hash: dict[tuple[int, int, int, int], str] = {}
+    for e in candidates:
+        if e.key in known or e.key in to_hash:
+            continue
+        row = db.execute(
+            "SELECT sha256 FROM hashes WHERE dev=? AND ino=? AND size=? AND mtime_ns=?",
+            e.key,
+        ).fetchone()
+        if row:
+            known[e.key] = row[0]
+        else:
+            to_hash[e.key] = e.path
+
+    hashed_bytes = 0
+    if to_hash:
+        keys = list(to_hash)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for key, digest in zip(keys, pool.map(hash_file, (to_hash[k] for k in keys))):
+                if digest is None:
+                    continue
+                known[key] = digest
+                hashed_bytes += key[2]
+    db.executemany(
+        "INSERT OR REPLACE INTO hashes (dev, ino, size, mtime_ns, sha256, seen) VALUES (?, ?, ?, ?, ?, ?)",
+        [(*key, digest, run_id) for key, digest in known.items()],
+    )
+
+    # Группы одинакового содержимого и mtime: (dev, size, mtime_ns, sha256) -> пути.
+    groups: dict[tuple[int, int, int, str], list[Entry]] = {}
+    for e in candidates:
+        digest = known.get(e.key)
+        if digest:
+            groups.setdefault((e.dev, e.size, e.mtime_ns, digest), []).append(e)
+
+    linked = 0
+    reclaimed = 0
+    for (_, size, _, _), members in groups.items():
+        inodes: dict[int, list[Entry]] = {}
+        for e in members:
+            inodes.setdefault(e.ino, []).append(e)
+        if len(inodes) < 2:
+            continue
+        # Канонический inode — с наибольшим числом ссылок (меньше всего перелинковок).
+        canonical_ino = max(inodes, key=lambda ino: (inodes[ino][0].nlink, -ino))
+        canonical = inodes[canonical_ino][0]
+        for ino, paths in inodes.items():
+            if ino == canonical_ino:
+                continue
+            first = paths[0]
+            if (first.mode, first.uid, first.gid) != (canonical.mode, canonical.uid, canonical.gid):
+                continue
+            if verify and not same_content(canonical.path, first.path):
+                continue
+            done = len(paths) if dry_run else sum(relink(canonical.path, e.path) for e in paths)
+            linked += done
+            # Место освобождается, только если у inode не осталось ссылок вне этой группы.
+            if done == len(paths) and first.nlink == len(paths):
+                reclaimed += size
+
+    if not dry_run:
+        db.execute("DELETE FROM hashes WHERE seen != ?", (run_id,))
+    db.commit()
+    db.close()
+
+    return {
+        "files": len(entries),
+        "candidates": len(candidates),
+        "hashed": len(to_hash),
+        "hashed_bytes": hashed_bytes,
+        "linked": linked,
+        "reclaimed_bytes": reclaimed,
+        "seconds": round(time.perf_counter() - t0, 3),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Hardlink-deduplicate the Syncthing versions store.")
+    parser.add_argument("--root", default="/data/syncthing/versions", help="Корень хранилища версий")
+    parser.add_argument(
+        "--index",
+        default="/data/syncthing/versions-dedup.sqlite",
+        help="SQLite индекс хешей (вне --root, чтобы не светился в file browser)",
+    )
+    parser.add_argument("--workers", type=int, default=2, help="Потоков хеширования")
+    parser.add_argument("--min-size", type=int, default=4096, help="Меньшие файлы не трогаем (экономии почти нет)")
+    parser.add_argument("--verify", action="store_true", help="Побайтно сверять перед hardlink")
+    parser.add_argument("--dry-run", action="store_true", help="Только посчитать, ничего не линковать")
+    args = parser.parse_args()
+
+    root = Path(args.root)
+    if not root.is_dir():
+        print(f"[dedup] skip: нет {root}", file=sys.stderr)
+        return 0
+
+    stats = run(
+        root,
+        Path(args.index),
+        workers=max(1, args.workers),
+        min_size=args.min_size,
+        dry_run=args.dry_run,
+        verify=args.verify,
+    )
+    prefix = "[dedup] dry-run" if args.dry_run else "[dedup]"
+    print(
+        f"{prefix} files={stats['files']} candidates={stats['candidates']} hashed={stats['hashed']} "
+        f"({stats['hashed_bytes']} bytes) linked={stats['linked']} reclaimed={stats['reclaimed_bytes']} bytes "
+        f"in {stats['seconds']}s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
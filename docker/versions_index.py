@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+# Общий клиент REST API лежит в scripts/ (в контейнере: /app/scripts).
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+
+from st_api import SyncthingAPI  # noqa: E402
+
+# Индекс хранилища версий (/data/syncthing/versions/<folder_id>/...): файл версии `name~YYYYMMDD-HHMMSS.ext`
+# -> (папка/путь оригинала, время версии, размер, mtime) в SQLite. Поиск по префиксу пути и интервалу времени
+# идёт по индексам (path, version) и (version) — миллисекунды и на миллионах версий (file_server.py /api/versions).
+# Обновление инкрементальное: директория перечитывается, только если сменился её mtime (версии пишутся один раз,
+# добавление/удаление меняет mtime директории). В режиме --watch директории, куда Syncthing только что положил
+# версии (события ItemFinished), перечитываются сразу, а полный проход по mtime идёт раз в --rescan-interval
+# (ловит очистку старых версий по cleanoutDays — на неё событий нет). Индекс же — состояние для versions_retention.py
+# (inode нужен, чтобы не считать дважды hardlink'и после versions_dedup.py).
+
+VERSION_RE = re.compile(r"^(?P<stem>.+)~(?P<tag>\d{8}-\d{6})(?P<ext>\.[^.~]*)?$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS versions (
+    file TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    path TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    ino INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS versions_path ON versions (path, version);
+CREATE INDEX IF NOT EXISTS versions_time ON versions (version);
+CREATE INDEX IF NOT EXISTS versions_dir ON versions (dir);
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    subdirs TEXT NOT NULL
+);
+"""
+
+
+def parse_version(name: str) -> tuple[str, int] | None:
+    # -> (имя оригинала, unix time версии) или None. Метку Syncthing пишет в локальном времени процесса (TZ контейнера).
+    m = VERSION_RE.match(name)
+    if not m:
+        return None
+    try:
+        stamp = int(time.mktime(time.strptime(m["tag"], "%Y%m%d-%H%M%S")))
+    except (ValueError, OverflowError):
+        return None
+    return m["stem"] + (m["ext"] or ""), stamp
+
+
+def open_index(path: Path) -> sqlite3.Connection:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # timeout: индексатор (--watch) и versions_retention.py пишут в один файл.
+    db = sqlite3.connect(path, timeout=30)
+    # WAL: file_server читает индекс, пока индексатор пишет.
+    db.execute("PRAGMA journal_mode=WAL")
+    db.executescript(SCHEMA)
+    return db
+
+
+class VersionsIndex:
+    def __init__(self, root: Path, index_path: Path) -> None:
+        self.root = root
+        self.db = open_index(index_path)
+        self.listed = 0
+        self.visited = 0
+
+    def close(self) -> None:
+        self.db.close()
+
+    def _list(self, rel_dir: str) -> tuple[list[str], list[tuple]]:
+        subdirs: list[str] = []
+        rows: list[tuple] = []
+        prefix = f"{rel_dir}/" if rel_dir else ""
+        with os.scandir(self.root / rel_dir if rel_dir else self.root) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                        continue
+                    # Временные файлы dedup/Syncthing и файлы вне папок (в корне хранилища) не индексируем.
+                    if not rel_dir or entry.name.startswith((".dedup-", ".vcompress-", ".syncthing.")) or not entry.is_file(follow_symlinks=False):
+                        continue
+                    parsed = parse_version(entry.name)
+                    if not parsed:
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                original, stamp = parsed
+                folder = rel_dir.split("/", 1)[0]
+                rows.append(
+                    (prefix + entry.name, rel_dir, folder, prefix + original, stamp, st.st_size, int(st.st_mtime), st.st_ino)
+                )
+        return subdirs, rows
+
+    def _visit(self, rel_dir: str, known: dict[str, tuple[int, str]], *, recurse_all: bool) -> list[str]:
+        # Перечитывает директорию, если сменился mtime; -> поддиректории, в которые нужно спуститься.
+        self.visited += 1
+        path = self.root / rel_dir if rel_dir else self.root
+        try:
+            mtime = path.stat().st_mtime_ns
+        except OSError:
+            self._forget(rel_dir)
+            return []
+        row = known.get(rel_dir)
+        prefix = f"{rel_dir}/" if rel_dir else ""
+        if row and row[0] == mtime:
+            return [prefix + name for name in row[1].split("\n") if name] if recurse_all else []
+        try:
+            subdirs, rows = self._list(rel_dir)
+        except OSError:
+            return []
+        self.listed += 1
+        self.db.execute("DELETE FROM versions WHERE dir = ?", (rel_dir,))
+        self.db.executemany("INSERT OR REPLACE INTO versions VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        self.db.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)", (rel_dir, mtime, "\n".join(subdirs)))
+        old = set(row[1].split("\n")) if row else set()
+        for name in old - set(subdirs):
+            if name:
+                self._forget(prefix + name)
+        known[rel_dir] = (mtime, "\n".join(subdirs))
+        # Новые поддиректории обходим целиком, уже известные — только при полном проходе.
+        return [prefix + name for name in subdirs if recurse_all or name not in old]
+
+    def _forget(self, rel_dir: str) -> None:
+        like = rel_dir.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "/%"
+        self.db.execute("DELETE FROM versions WHERE dir = ? OR dir LIKE ? ESCAPE '\\'", (rel_dir, like))
+        self.db.execute("DELETE FROM dirs WHERE path = ? OR path LIKE ? ESCAPE '\\'", (rel_dir, like))
+
+    def refresh(self, targets: list[str] | None = None) -> None:
+        # targets=None — полный проход (stat каждой директории); иначе только эти директории и их предки.
+        known = {path: (mtime, subdirs) for path, mtime, subdirs in self.db.execute("SELECT * FROM dirs")}
+        if targets is None:
+            pending = [""]
+            while pending:
+                pending.extend(self._visit(pending.pop(), known, recurse_all=True))
+        else:
+            chain: list[str] = []
+            for target in targets:
+                parts = [p for p in target.strip("/").split("/") if p]
+                chain.extend("/".join(parts[:i]) for i in range(len(parts) + 1))
+            for rel_dir in sorted(set(chain), key=lambda p: (p.count("/") if p else -1, p)):
+                pending = self._visit(rel_dir, known, recurse_all=False)
+                while pending:
+                    pending.extend(self._visit(pending.pop(), known, recurse_all=False))
+        self.db.commit()
+
+    def count(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM versions").fetchone()[0]
+
+
+def search(
+    db: sqlite3.Connection,
+    *,
+    prefix: str = "",
+    since: int | None = None,
+    until: int | None = None,
+    limit: int = 200,
+) -> list[dict]:
+    # prefix — по пути оригинала `<folder_id>/<путь в папке>`; since/until — unix time версии (включительно).
+    where: list[str] = []
+    params: list = []
+    if prefix:
+        # Диапазон вместо LIKE: так SQLite использует индекс (path, version).
+        where.append("path >= ? AND path < ?")
+        params += [prefix, prefix + "\U0010ffff"]
+    if since is not None:
+        where.append("version >= ?")
+        params.append(since)
+    if until is not None:
+        where.append("version <= ?")
+        params.append(until)
+    sql = "SELECT file, path, version, size, mtime FROM versions"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY version DESC, path LIMIT ?"
+    params.append(limit)
+    return [
+        {"file": file, "path": path, "version": version, "size": size, "mtime": mtime}
+        for file, path, version, size, mtime in db.execute(sql, params)
+    ]
+
+
+def event_targets(events: list[dict]) -> list[str]:
+    # ItemFinished (update/delete) — Syncthing мог переложить прежнюю версию в <folder>/<dir of item>.
+    targets: set[str] = set()
+    for event in events:
+        data = event.get("data") or {}
+        folder, item = data.get("folder"), data.get("item")
+        if event.get("type") == "ItemFinished" and folder and item and not data.get("error"):
+            parent = item.replace("\\", "/").rpartition("/")[0]
+            targets.add(f"{folder}/{parent}" if parent else folder)
+    return sorted(targets)
+
+
+def watch(index: VersionsIndex, config_xml: Path, *, rescan_interval: float) -> None:
+    api: SyncthingAPI | None = None
+    since = 0
+    last_full = time.monotonic()
+    while True:
+        if time.monotonic() - last_full >= rescan_interval:
+            index.refresh()
+            last_full = time.monotonic()
+        try:
+            if api is None:
+                api = SyncthingAPI.from_config_xml(config_xml, timeout=75)
+            if not since:
+                # Начинаем с текущего события: всё, что было раньше, уже покрыл полный проход.
+                last = api.request("GET", "/rest/events", params={"events": "ItemFinished", "limit": 1, "timeout": 0}) or []
+                since = last[-1]["id"] if last else 0
+            events = api.request("GET", "/rest/events", params={"events": "ItemFinished", "since": since, "timeout": 60}) or []
+        except Exception as e:  # noqa: BLE001 — Syncthing ещё не поднялся/перезапускается: ждём и пробуем снова
+            print(f"[versions-index] WARN: events: {e}", file=sys.stderr)
+            api = None
+            since = 0
+            time.sleep(10)
+            continue
+        if events:
+            since = max(since, *(e.get("id", 0) for e in events))
+            targets = event_targets(events)
+            if targets:
+                index.refresh(targets)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Index the Syncthing versions store for fast search.")
+    parser.add_argument("--root", default="/data/syncthing/versions", help="Корень хранилища версий")
+    parser.add_argument(
+        "--index",
+        default="/data/syncthing/versions-index.sqlite",
+        help="SQLite индекс версий (вне --root, чтобы не светился в file browser)",
+    )
+    parser.add_argument("--watch", action="store_true", help="После прохода следить за событиями Syncthing")
+    parser.add_argument("--config-xml", default=os.path.join(os.environ.get("STHOMEDIR", "/var/syncthing/config"), "config.xml"))
+    parser.add_argument("--rescan-interval", type=float, default=3600, help="Полный проход по mtime в --watch, секунд")
+    parser.add_argument("--search", metavar="PREFIX", help="Найти версии по префиксу `<folder>/<путь>` и выйти")
+    args = parser.parse_args()
+
+    root = Path(args.root)
+    if args.search is not None:
+        db = open_index(Path(args.index))
+        for row in search(db, prefix=args.search):
+            stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row["version"]))
+            print(f"{stamp}  {row['size']:>12}  {row['file']}")
+        db.close()
+        return 0
+    if not root.is_dir():
+        print(f"[versions-index] skip: нет {root}", file=sys.stderr)
+        return 0
+
+    index = VersionsIndex(root, Path(args.index))
+    t0 = time.perf_counter()
+    index.refresh()
+    print(
+        f"[versions-index] versions={index.count()} dirs={index.visited} re-listed={index.listed} "
+        f"in {time.perf_counter() - t0:.3f}s",
+        file=sys.stderr,
+    )
+    try:
+        if args.watch:
+            watch(index, Path(args.config_xml), rescan_interval=args.rescan_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
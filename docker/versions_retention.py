@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+
+import yaml
+
+# Общий клиент REST API лежит в scripts/ (в контейнере: /app/scripts).
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+
+from shards import expand_shards  # noqa: E402
+from st_api import SyncthingAPI  # noqa: E402
+from versions_index import VersionsIndex  # noqa: E402
+
+# Глобальный бюджет хранилища версий на томе Amvera (nodes.amvera.persistent_size_gb).
+# keep/cleanoutDays Syncthing действуют на каждую папку отдельно — одна шумная папка может занять весь том,
+# и тогда встаёт синхронизация всех папок. Здесь:
+#   бюджет версий = size_gb * (1 - reserve_pct%) - живые данные папок (localBytes из /rest/db/status) - БД Syncthing;
+# при превышении удаляются версии с наименьшей ценностью
+#   value = weight папки / ((1 + возраст в днях) * номер версии файла, от новой к старой),
+# т.е. сначала старые и многократно перекрытые версии папок с малым весом; последние min_keep версий каждого файла
+# не трогаются. Состояние — индекс versions_index.py (обновление по mtime директорий, без полного обхода);
+# hardlink'и versions_dedup.py считаются один раз (по inode).
+
+GIB = 1024**3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS retention_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TEMP TABLE IF NOT EXISTS weights (
+    folder TEXT PRIMARY KEY,
+    weight REAL NOT NULL
+);
+"""
+
+EVICTION_ORDER = {
+    "value": "weight / ((1.0 + MAX(0, :now - version) / 86400.0) * rank) ASC, version ASC",
+    "oldest": "version ASC",
+}
+
+
+def human(size: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(size) < 1024 or unit == "GiB":
+            return f"{size:.0f}{unit}" if unit == "B" else f"{size:.2f}{unit}"
+        size /= 1024
+    return f"{size:.2f}GiB"
+
+
+def load_settings(cfg: dict) -> dict:
+    amvera = (cfg.get("nodes") or {}).get("amvera") or {}
+    retention = ((cfg.get("defaults") or {}).get("amvera_versioning") or {}).get("retention") or {}
+    weights = {}
+    for item in cfg.get("folders") or []:
+        if isinstance(item, dict) and item.get("id") and item.get("retention_weight") is not None:
+            weights[str(item["id"])] = float(item["retention_weight"])
+    return {
+        "size_gb": float(amvera.get("persistent_size_gb") or 10),
+        "reserve_pct": float(retention.get("reserve_pct", 10)),
+        "min_keep": max(1, int(retention.get("min_keep", 1))),
+        "weights": weights,
+    }
+
+
+def tree_bytes(root: Path) -> int:
+    total = 0
+    stack = [str(root)]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        total += entry.stat(follow_symlinks=False).st_blocks * 512
+                except OSError:
+                    continue
+    return total
+
+
+def sync_bytes(db, config_xml: Path, sync_root: Path) -> tuple[int, str]:
+    # -> (байт живых данных папок, источник). REST API дешевле обхода; без API — последнее известное значение.
+    try:
+        api = SyncthingAPI.from_config_xml(config_xml)
+        try:
+            folders = api.get("/rest/config/folders") or []
+            total = sum(int((api.get("/rest/db/status", folder=f["id"]) or {}).get("localBytes") or 0) for f in folders)
+        finally:
+            api.close()
+        db.execute("INSERT OR REPLACE INTO retention_meta VALUES ('sync_bytes', ?)", (str(total),))
+        db.commit()
+        return total, "api"
+    except Exception as e:  # noqa: BLE001 — Syncthing недоступен: берём сохранённое значение или считаем обходом
+        print(f"[retention] WARN: REST API: {e}", file=sys.stderr)
+        row = db.execute("SELECT value FROM retention_meta WHERE key = 'sync_bytes'").fetchone()
+        if row:
+            return int(row[0]), "cached"
+        return tree_bytes(sync_root), "walk"
+
+
+def versions_usage(db) -> tuple[int, dict[str, tuple[int, int]]]:
+    # -> (байт на диске с учётом hardlink'ов, folder -> (версий, байт по размерам файлов)).
+    unique = db.execute("SELECT COALESCE(SUM(size), 0) FROM (SELECT MAX(size) AS size FROM versions GROUP BY ino)").fetchone()[0]
+    per_folder = {
+        folder: (count, size)
+        for folder, count, size in db.execute("SELECT folder, COUNT(*), SUM(size) FROM versions GROUP BY folder")
+    }
+    return int(unique), per_folder
+
+
+def plan_eviction(db, over: int, *, min_keep: int, weights: dict[str, float], policy: str, now: int) -> tuple[list, int]:
+    # -> ([(file, folder, size, version)], сколько байт реально освободится).
+    db.execute("DELETE FROM weights")
+    db.executemany("INSERT INTO weights VALUES (?, ?)", weights.items())
+    # Сколько ссылок у inode внутри хранилища: место освобождается, когда удалена последняя.
+    links = dict(db.execute("SELECT ino, COUNT(*) FROM versions GROUP BY ino HAVING COUNT(*) > 1"))
+    sql = f"""
+        WITH ranked AS (
+            SELECT file, folder, size, ino, version,
+                   ROW_NUMBER() OVER (PARTITION BY path ORDER BY version DESC) AS rank
+            FROM versions
+        )
+        SELECT file, ranked.folder, size, ino, version,
+               COALESCE(w.weight, 1.0) AS weight, rank
+        FROM ranked LEFT JOIN weights w ON w.folder = ranked.folder
+        WHERE rank > :min_keep
+        ORDER BY {EVICTION_ORDER[policy]}
+    """
+    plan: list[tuple[str, str, int, int]] = []
+    freed = 0
+    for file, folder, size, ino, version, _weight, _rank in db.execute(sql, {"min_keep": min_keep, "now": now}):
+        if freed >= over:
+            break
+        plan.append((file, folder, size, version))
+        remaining = links.get(ino, 1) - 1
+        links[ino] = remaining
+        if remaining <= 0:
+            freed += size
+    return plan, freed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Enforce a global byte budget on the Syncthing versions store.")
+    parser.add_argument("--config", default=os.environ.get("SYNC_CONFIG", "/app/sync-folders.yaml"))
+    parser.add_argument("--root", default="/data/syncthing/versions", help="Корень хранилища версий")
+    parser.add_argument("--index", default="/data/syncthing/versions-index.sqlite", help="Индекс versions_index.py")
+    parser.add_argument("--config-xml", default=os.path.join(os.environ.get("STHOMEDIR", "/var/syncthing/config"), "config.xml"))
+    parser.add_argument("--sync-root", default="/data/sync", help="Корень данных папок (если REST API недоступен)")
+    parser.add_argument("--policy", choices=sorted(EVICTION_ORDER), default="value", help="Порядок удаления версий")
+    parser.add_argument("--dry-run", action="store_true", help="Только отчёт: бюджет, занятость, что было бы удалено")
+    parser.add_argument("--json", action="store_true", help="Отчёт в JSON")
+    args = parser.parse_args()
+
+    root = Path(args.root)
+    if not root.is_dir():
+        print(f"[retention] skip: нет {root}", file=sys.stderr)
+        return 0
+    with open(args.config, "r", encoding="utf-8") as f:
+        # Шарды папки наследуют её retention_weight.
+        settings = load_settings(expand_shards(yaml.safe_load(f) or {}))
+
+    t0 = time.perf_counter()
+    index = VersionsIndex(root, Path(args.index))
+    db = index.db
+    db.executescript(SCHEMA)
+    try:
+        index.refresh()
+        config_xml = Path(args.config_xml)
+        live, source = sync_bytes(db, config_xml, Path(args.sync_root))
+        db_bytes = tree_bytes(config_xml.parent)
+        capacity = int(settings["size_gb"] * GIB)
+        usable = int(capacity * (1 - settings["reserve_pct"] / 100))
+        budget = max(0, usable - live - db_bytes)
+        used, per_folder = versions_usage(db)
+        over = max(0, used - budget)
+        # Если /data — отдельный том этого размера, фактическая занятость точнее суммы оценок.
+        disk = shutil.disk_usage(root)
+        if disk.total <= capacity * 1.05:
+            over = max(over, disk.used - usable)
+
+        plan, freed = plan_eviction(
+            db,
+            over,
+            min_keep=settings["min_keep"],
+            weights=settings["weights"],
+            policy=args.policy,
+            now=int(time.time()),
+        ) if over else ([], 0)
+
+        removed = 0
+        if not args.dry_run:
+            for file, _folder, _size, _version in plan:
+                try:
+                    (root / file).unlink()
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"[retention] WARN: {file}: {e}", file=sys.stderr)
+                    continue
+                db.execute("DELETE FROM versions WHERE file = ?", (file,))
+                removed += 1
+            db.commit()
+    finally:
+        index.close()
+
+    evicted: dict[str, list[int]] = {}
+    for _file, folder, size, _version in plan:
+        acc = evicted.setdefault(folder, [0, 0])
+        acc[0] += 1
+        acc[1] += size
+    report = {
+        "capacity_bytes": capacity,
+        "usable_bytes": usable,
+        "sync_bytes": live,
+        "sync_bytes_source": source,
+        "syncthing_db_bytes": db_bytes,
+        "disk_used_bytes": disk.used,
+        "versions_budget_bytes": budget,
+        "versions_bytes": used,
+        "over_bytes": over,
+        "evict_files": len(plan),
+        "evict_bytes": freed,
+        "removed_files": removed,
+        "dry_run": args.dry_run,
+        "seconds": round(time.perf_counter() - t0, 3),
+        "folders": {
+            folder: {
+                "versions": count,
+                "bytes": size,
+                "weight": settings["weights"].get(folder, 1.0),
+                "evict_files": evicted.get(folder, [0, 0])[0],
+                "evict_bytes": evicted.get(folder, [0, 0])[1],
+            }
+            for folder, (count, size) in sorted(per_folder.items())
+        },
+    }
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return 0
+
+    prefix = "[retention] dry-run" if args.dry_run else "[retention]"
+    print(
+        f"{prefix} budget={human(budget)} (usable {human(usable)} - sync {human(live)} [{source}] "
+        f"- db {human(db_bytes)}) versions={human(used)} over={human(over)} "
+        f"evict={len(plan)} files/{human(freed)} in {report['seconds']}s"
+    )
+    for folder, info in report["folders"].items():
+        print(
+            f"{prefix}   {folder}: {info['versions']} versions, {human(info['bytes'])}, weight {info['weight']:g}"
+            + (f", evict {info['evict_files']} ({human(info['evict_bytes'])})" if info["evict_files"] else "")
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
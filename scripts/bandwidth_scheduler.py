@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta, tzinfo
+from pathlib import Path
+
+from config_patch import resolve_connection
+from install_stignore import PROJECT_ROOT, load_config
+from st_api import API_UNAVAILABLE, SyncthingAPI, default_config_xml, read_gui_settings
+
+# Лимиты скорости по расписанию (`bandwidth_schedule:` в sync-folders.yaml), применяются на лету через
+# REST API (/rest/config/options и /rest/config/devices/<id>) — без рестарта Syncthing и без рескана.
+# Окна проверяются сверху вниз, первое активное побеждает; вне окон — `default` (глобально) и
+# статические лимиты устройств из `connection:`. PATCH отправляется, только если значение
+# в Syncthing отличается от нужного, поэтому частый опрос не создаёт нагрузки.
+# --simulate прогоняет расписание на симулированных часах против заглушки API (scripts/st_stub.py).
+
+DAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+LIMIT_KEYS = {"max_send_kbps": "maxSendKbps", "max_recv_kbps": "maxRecvKbps"}
+
+
+def parse_minutes(value: object, where: str) -> int:
+    # PyYAML читает 19:00 без кавычек как число 1140 (base-60) — это как раз минуты.
+    if isinstance(value, int) and not isinstance(value, bool):
+        minutes = value
+    elif isinstance(value, str) and ":" in value:
+        hh, _, mm = value.strip().partition(":")
+        try:
+            minutes = int(hh) * 60 + int(mm)
+        except ValueError:
+            raise ValueError(f"{where}: ожидается HH:MM, получено {value!r}") from None
+    else:
+        raise ValueError(f"{where}: ожидается HH:MM, получено {value!r}")
+    if not 0 <= minutes <= 24 * 60:
+        raise ValueError(f"{where}: время вне суток: {value!r}")
+    return minutes
+
+
+def parse_limits(raw: object, where: str) -> dict:
+    # yaml {max_send_kbps, max_recv_kbps} -> {maxSendKbps, maxRecvKbps} (KiB/s, 0 — без лимита).
+    if raw is None:
+        return {}
+    if not isinstance(raw, dict):
+        raise ValueError(f"{where}: ожидается объект")
+    result = {}
+    for key, value in raw.items():
+        if key not in LIMIT_KEYS:
+            raise ValueError(f"{where}: неизвестный ключ {key!r} (есть: {', '.join(LIMIT_KEYS)})")
+        if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+            raise ValueError(f"{where}.{key}: ожидается целое >= 0, получено {value!r}")
+        result[LIMIT_KEYS[key]] = value
+    return result
+
+
+class Window:
+    def __init__(self, raw: dict, idx: int, section: str = "bandwidth_schedule.windows") -> None:
+        where = f"{section}[{idx}]"
+        self.name = str(raw.get("name") or f"window-{idx}")
+        days = raw.get("days") or list(DAYS)
+        if not isinstance(days, list) or any(d not in DAYS for d in days):
+            raise ValueError(f"{where}.days: список из {', '.join(DAYS)}")
+        self.days = {DAYS.index(d) for d in days}
+        self.start = parse_minutes(raw.get("from", "00:00"), f"{where}.from")
+        self.end = parse_minutes(raw.get("to", "24:00"), f"{where}.to")
+        nodes = raw.get("nodes")
+        self.nodes = set(nodes) if nodes else None
+        self.global_limits = parse_limits(raw.get("global"), f"{where}.global")
+        devices = raw.get("devices") or {}
+        if not isinstance(devices, dict):
+            raise ValueError(f"{where}.devices: ожидается объект <node>: {{...}}")
+        self.device_limits = {str(k): parse_limits(v, f"{where}.devices.{k}") for k, v in devices.items()}
+
+    def active(self, now: datetime) -> bool:
+        minute = now.hour * 60 + now.minute
+        day = now.weekday()
+        if self.start < self.end:
+            return day in self.days and self.start <= minute < self.end
+        if self.start == self.end:
+            return day in self.days
+        # Окно через полночь (22:00-06:00): день — тот, в который окно началось.
+        return (day in self.days and minute >= self.start) or ((day - 1) % 7 in self.days and minute < self.end)
+
+
+class Schedule:
+    def __init__(self, cfg: dict, node: str) -> None:
+        raw = cfg.get("bandwidth_schedule") or {}
+        if not isinstance(raw, dict):
+            raise ValueError("bandwidth_schedule должен быть объектом")
+        self.node = node
+        self.tz = load_timezone(raw.get("timezone"))
+        self.default = parse_limits(raw.get("default"), "bandwidth_schedule.default")
+        windows = raw.get("windows") or []
+        if not isinstance(windows, list):
+            raise ValueError("bandwidth_schedule.windows должен быть списком")
+        self.windows = [Window(w, i) for i, w in enumerate(windows) if isinstance(w, dict)]
+        self.windows = [w for w in self.windows if w.nodes is None or node in w.nodes]
+
+        # Базовые (вне окон) лимиты устройств — статическая политика connection: для пары node -> peer.
+        nodes = cfg.get("nodes") or {}
+        defaults_conn = (cfg.get("defaults") or {}).get("connection")
+        links = (nodes.get(node) or {}).get("links") or {}
+        self.peers: dict[str, str] = {}
+        self.baseline: dict[str, dict] = {}
+        for name, peer in nodes.items():
+            if name == node or not isinstance(peer, dict):
+                continue
+            device_id = str(peer.get("device_id") or "").strip()
+            self.peers[name] = "" if device_id.upper() in ("", "REQUIRED") else device_id.upper()
+            conn = resolve_connection(defaults_conn, peer.get("connection"), links.get(name))
+            self.baseline[name] = {xml: conn.get(key, 0) for key, xml in LIMIT_KEYS.items()}
+
+    def active_window(self, now: datetime) -> Window | None:
+        return next((w for w in self.windows if w.active(now)), None)
+
+    def desired(self, now: datetime) -> tuple[str, dict, dict[str, dict]]:
+        # -> (имя окна, глобальные лимиты, {peer: лимиты}) на момент now (в таймзоне расписания).
+        window = self.active_window(now)
+        global_limits = {"maxSendKbps": 0, "maxRecvKbps": 0, **self.default}
+        devices = {name: dict(limits) for name, limits in self.baseline.items()}
+        if window is not None:
+            global_limits.update(window.global_limits)
+            for name, limits in window.device_limits.items():
+                if name in devices:
+                    devices[name].update(limits)
+        return (window.name if window else "default"), global_limits, devices
+
+
+def load_timezone(name: object) -> tzinfo | None:
+    if not name:
+        return None
+    try:
+        from zoneinfo import ZoneInfo
+
+        return ZoneInfo(str(name))
+    except Exception as e:  # noqa: BLE001 — нет tzdata (alpine) и т.п.: работаем по локальному времени
+        print(f"[bandwidth] WARN: timezone {name!r} недоступна ({e}), использую локальное время", file=sys.stderr)
+        return None
+
+
+def apply(api: SyncthingAPI, schedule: Schedule, global_limits: dict, devices: dict[str, dict]) -> list[str]:
+    changes: list[str] = []
+    options = api.get("/rest/config/options") or {}
+    patch = {k: v for k, v in global_limits.items() if options.get(k) != v}
+    if patch:
+        api.patch("/rest/config/options", patch)
+        changes.extend(f"options.{k} {options.get(k)} -> {v}" for k, v in patch.items())
+
+    configured = api.get("/rest/config/devices") or []
+    by_id = {d.get("deviceID", "").upper(): d for d in configured}
+    by_name = {d.get("name"): d for d in configured}
+    for name, limits in devices.items():
+        device = by_id.get(schedule.peers.get(name, "")) or by_name.get(name)
+        if device is None:
+            continue
+        patch = {k: v for k, v in limits.items() if device.get(k) != v}
+        if patch:
+            api.patch(f"/rest/config/devices/{device['deviceID']}", patch)
+            changes.extend(f"{name}.{k} {device.get(k)} -> {v}" for k, v in patch.items())
+    return changes
+
+
+def run_daemon(api: SyncthingAPI, schedule: Schedule, interval: float) -> int:
+    current = None
+    while True:
+        now = datetime.now(schedule.tz)
+        window, global_limits, devices = schedule.desired(now)
+        try:
+            changes = apply(api, schedule, global_limits, devices)
+        except API_UNAVAILABLE as e:
+            print(f"[bandwidth] WARN: {e}", file=sys.stderr)
+            api.close()
+        else:
+            if changes or window != current:
+                print(f"[bandwidth] {now:%a %H:%M} window={window}: {'; '.join(changes) or 'no changes'}")
+                current = window
+        time.sleep(interval)
+
+
+def run_simulation(schedule: Schedule, start: datetime, hours: float, step_min: int) -> int:
+    from st_stub import STUB_API_KEY, StubState, start_stub
+
+    clock = [start]
+    state = StubState(clock=lambda: clock[0].timestamp())
+    stub = start_stub(state)
+    api = SyncthingAPI(stub.base_url, STUB_API_KEY)
+    mismatches = 0
+    try:
+        end = start + timedelta(hours=hours)
+        while clock[0] < end:
+            window, global_limits, devices = schedule.desired(clock[0])
+            changes = apply(api, schedule, global_limits, devices)
+            if changes:
+                print(f"[sim] {clock[0]:%a %Y-%m-%d %H:%M} window={window}: {'; '.join(changes)}")
+            # Проверка: состояние заглушки совпадает с расписанием.
+            options = state.config["options"]
+            for key, value in global_limits.items():
+                if options.get(key) != value:
+                    mismatches += 1
+                    print(f"[sim] MISMATCH {clock[0]:%H:%M} options.{key}={options.get(key)} want {value}")
+            for device in state.config["devices"]:
+                want = devices.get(device.get("name"))
+                for key, value in (want or {}).items():
+                    if device.get(key) != value:
+                        mismatches += 1
+                        print(f"[sim] MISMATCH {clock[0]:%H:%M} {device['name']}.{key}={device.get(key)} want {value}")
+            clock[0] += timedelta(minutes=step_min)
+        patches = sum(1 for method, _ in state.requests if method == "PATCH")
+        traffic = api.get("/rest/system/connections")["connections"]
+        names = {d["deviceID"]: d["name"] for d in state.config["devices"]}
+        print(f"[sim] {hours:g}h, step {step_min}min: {patches} PATCH requests, {mismatches} mismatches")
+        for device_id, conn in traffic.items():
+            print(
+                f"[sim] {names.get(device_id, device_id)}: in {conn['inBytesTotal'] / 2**30:.2f} GiB, "
+                f"out {conn['outBytesTotal'] / 2**30:.2f} GiB"
+            )
+    finally:
+        api.close()
+        stub.shutdown()
+    return 1 if mismatches else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Расписание лимитов скорости Syncthing через REST API.")
+    parser.add_argument("--config", default=str(PROJECT_ROOT / "sync-folders.yaml"), help="Путь до sync-folders.yaml")
+    parser.add_argument("--node", required=True, help="Имя этой ноды в nodes.*")
+    parser.add_argument(
+        "--config-xml",
+        default=str(default_config_xml()),
+        help="config.xml Syncthing (адрес GUI и API key)",
+    )
+    parser.add_argument("--interval", type=float, default=60.0, help="Период проверки расписания, сек")
+    parser.add_argument("--once", action="store_true", help="Применить текущее окно и выйти")
+    parser.add_argument("--simulate", metavar="START", help="Симуляция против заглушки API с момента START (YYYY-MM-DDTHH:MM)")
+    parser.add_argument("--hours", type=float, default=48.0, help="Длительность симуляции")
+    parser.add_argument("--step-min", type=int, default=15, help="Шаг симулированных часов, мин")
+    args = parser.parse_args()
+
+    cfg = load_config(Path(args.config))
+    try:
+        schedule = Schedule(cfg, args.node)
+    except ValueError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 2
+
+    if args.simulate:
+        start = datetime.fromisoformat(args.simulate)
+        if start.tzinfo is None and schedule.tz is not None:
+            start = start.replace(tzinfo=schedule.tz)
+        return run_simulation(schedule, start, args.hours, args.step_min)
+
+    if not schedule.windows and not schedule.default:
+        print(f"[bandwidth] bandwidth_schedule для {args.node} пуст — нечего делать", file=sys.stderr)
+        return 0
+    try:
+        base_url, api_key = read_gui_settings(Path(args.config_xml))
+    except (OSError, ValueError) as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 2
+    api = SyncthingAPI(base_url, api_key)
+    if args.once:
+        now = datetime.now(schedule.tz)
+        window, global_limits, devices = schedule.desired(now)
+        try:
+            changes = apply(api, schedule, global_limits, devices)
+        except API_UNAVAILABLE as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            return 1
+        print(f"[bandwidth] window={window}: {'; '.join(changes) or 'no changes'}")
+        return 0
+    print(f"[bandwidth] {len(schedule.windows)} window(s) for {args.node}, check every {args.interval:g}s", file=sys.stderr)
+    try:
+        return run_daemon(api, schedule, args.interval)
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
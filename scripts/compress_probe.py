@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+# Оценка сжимаемости данных папок -> `compression` устройства (always | metadata | never).
+# Syncthing сжимает блоки LZ4 по настройке устройства-получателя: на relay/WAN сжатие текстовых папок
+# (codex-sessions JSONL) экономит узкий канал, в LAN только тратит CPU. Из каждой папки берётся выборка файлов
+# (начало каждого файла, равномерно по обходу), выборка сжимается zlib level 1 — близко к LZ4 по порядку
+# коэффициента — параллельно в пуле потоков (zlib отпускает GIL), экономия считается по байтам.
+
+SAMPLE_FILES = 64
+SAMPLE_HEAD = 256 * 1024
+ZLIB_LEVEL = 1
+# Служебные директории Syncthing/git — не данные папки.
+SKIP_DIRS = {".stversions", ".stfolder", ".stcanary", ".git"}
+# Минимальная экономия (доля байт) выборки общих папок, при которой блоки сжимаются (`always`) на канале этого типа;
+# иначе `metadata` (индексы сжимаются всегда). В LAN — `never`: канал шире, чем LZ4 на слабом CPU.
+ALWAYS_MIN_SAVING = {"relay": 0.10, "wan": 0.25}
+
+
+@dataclass
+class CompressSample:
+    files: int = 0
+    raw_bytes: int = 0
+    packed_bytes: int = 0
+    errors: list[str] = field(default_factory=list)
+
+    @property
+    def saving(self) -> float:
+        return 1.0 - self.packed_bytes / self.raw_bytes if self.raw_bytes else 0.0
+
+    def add(self, other: CompressSample) -> None:
+        self.files += other.files
+        self.raw_bytes += other.raw_bytes
+        self.packed_bytes += other.packed_bytes
+
+
+@dataclass
+class CompressionPlan:
+    link: str
+    compression: str
+    sample: CompressSample
+    folders: list[str]
+
+
+def pick_files(root: Path, budget_bytes: int, limit: int = SAMPLE_FILES) -> list[Path]:
+    # Обход сверху вниз до 4*limit кандидатов, из них — каждый k-й: выборка не только из первой директории.
+    candidates: list[Path] = []
+    cap = limit * 4
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in SKIP_DIRS and not d.startswith(".syncthing."))
+        for name in sorted(filenames):
+            if name.startswith((".syncthing.", "~syncthing~")) or name.endswith(".tmp"):
+                continue
+            candidates.append(Path(dirpath) / name)
+        if len(candidates) >= cap:
+            break
+    limit = max(1, min(limit, budget_bytes // SAMPLE_HEAD or 1))
+    step = max(1, len(candidates) // limit)
+    return candidates[::step][:limit]
+
+
+def _compress_head(path: Path) -> tuple[int, int]:
+    with path.open("rb") as f:
+        data = f.read(SAMPLE_HEAD)
+    return len(data), len(zlib.compress(data, ZLIB_LEVEL)) if data else 0
+
+
+def estimate_compression(roots: dict[str, Path], size_mib: float = 16.0) -> dict[str, CompressSample]:
+    # -> выборка по folder id. Все файлы всех папок — в одном пуле, чтобы медленная ФС одной папки не ждала другую.
+    budget = max(SAMPLE_HEAD, int(size_mib * 2**20))
+    samples = {folder_id: CompressSample() for folder_id in roots}
+    jobs = [
+        (folder_id, path) for folder_id, root in roots.items() if root.is_dir() for path in pick_files(root, budget)
+    ]
+    with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as pool:
+        futures = [(folder_id, path, pool.submit(_compress_head, path)) for folder_id, path in jobs]
+        for folder_id, path, future in futures:
+            sample = samples[folder_id]
+            try:
+                raw, packed = future.result()
+            except OSError as e:
+                sample.errors.append(f"{path}: {e.strerror or e}")
+                continue
+            if raw:
+                sample.files += 1
+                sample.raw_bytes += raw
+                sample.packed_bytes += packed
+    return samples
+
+
+def decide_compression(link: str, sample: CompressSample) -> str:
+    if link == "lan":
+        return "never"
+    if sample.raw_bytes and sample.saving >= ALWAYS_MIN_SAVING.get(link, 1.0):
+        return "always"
+    return "metadata"
+
+
+def plan_compression(
+    links: dict[str, str], shared: dict[str, list[str]], samples: dict[str, CompressSample]
+) -> dict[str, CompressionPlan]:
+    # links: peer -> тип канала (только peer с объявленным типом); shared: peer -> общие папки.
+    plans: dict[str, CompressionPlan] = {}
+    for peer, link in links.items():
+        folders = [f for f in shared.get(peer) or [] if f in samples]
+        total = CompressSample()
+        for folder_id in folders:
+            total.add(samples[folder_id])
+        plans[peer] = CompressionPlan(link, decide_compression(link, total), total, folders)
+    return plans
+
+
+def describe_sample(folder_id: str, sample: CompressSample) -> str:
+    if not sample.raw_bytes:
+        return f"{folder_id}: нет файлов для оценки"
+    return (
+        f"{folder_id}: {sample.files} файл(ов), {sample.raw_bytes / 2**20:.1f} MiB -> "
+        f"{sample.packed_bytes / 2**20:.1f} MiB (экономия {sample.saving:.0%}, zlib-{ZLIB_LEVEL})"
+    )
+
+
+def describe_compression(peer: str, plan: CompressionPlan) -> str:
+    if plan.link == "lan":
+        reason = "LAN"
+    elif not plan.sample.raw_bytes:
+        reason = f"{plan.link}, нет выборки"
+    else:
+        threshold = ALWAYS_MIN_SAVING.get(plan.link, 1.0)
+        reason = (
+            f"{plan.link}, экономия {plan.sample.saving:.0%} (порог {threshold:.0%}) "
+            f"по {len(plan.folders)} папк(ам), {plan.sample.raw_bytes / 2**20:.1f} MiB"
+        )
+    return f"{peer}: compression={plan.compression} ({reason})"
@@ -0,0 +1,493 @@
+from __future__ import annotations
+
+import copy
+import xml.etree.ElementTree as ET
+from typing import Iterable
+
+# Общий патчер config.xml для scripts/configure_syncthing.py и docker/configure_syncthing.py.
+# <device>/<folder> индексируются по id один раз, поэтому применение N записей из YAML — O(N),
+# а не findall() + линейный поиск на каждую запись.
+
+
+# Пресеты `performance:` (defaults / folders[] / nodes.*). Ключи — snake_case из YAML,
+# в config.xml они попадают под именами Syncthing (см. PERFORMANCE_KEYS).
+PERFORMANCE_PRESETS: dict[str, dict] = {
+    # Мелкие, часто дописываемые файлы (codex-sessions): быстрый watcher, свежие файлы первыми.
+    "small-files-low-latency": {
+        "rescan_interval_s": 3600,
+        "fs_watcher_enabled": True,
+        "fs_watcher_delay_s": 1,
+        "hashers": 1,
+        "copiers": 1,
+        "puller_max_pending_kib": 8192,
+        "max_concurrent_writes": 4,
+        "order": "newestFirst",
+        "block_pull_order": "standard",
+    },
+    # Большие репозитории/бинарники (aihub-reps): реже сканируем, больше данных в полёте.
+    "bulk-throughput": {
+        "rescan_interval_s": 21600,
+        "fs_watcher_enabled": True,
+        "fs_watcher_delay_s": 30,
+        "hashers": 2,
+        "copiers": 2,
+        "puller_max_pending_kib": 65536,
+        "max_concurrent_writes": 16,
+        "order": "random",
+        "block_pull_order": "standard",
+    },
+    # Слабая машина (2 vCPU): папки не должны конкурировать за CPU/диск.
+    "low-cpu": {
+        "rescan_interval_s": 86400,
+        "fs_watcher_enabled": True,
+        "fs_watcher_delay_s": 60,
+        "hashers": 1,
+        "copiers": 1,
+        "puller_max_pending_kib": 16384,
+        "max_concurrent_writes": 2,
+    },
+}
+
+# yaml key -> (имя в config.xml, атрибут или дочерний элемент <folder>, тип)
+PERFORMANCE_KEYS: dict[str, tuple[str, str, type]] = {
+    "rescan_interval_s": ("rescanIntervalS", "attr", int),
+    "fs_watcher_enabled": ("fsWatcherEnabled", "attr", bool),
+    "fs_watcher_delay_s": ("fsWatcherDelayS", "attr", int),
+    "hashers": ("hashers", "elem", int),
+    "copiers": ("copiers", "elem", int),
+    "puller_max_pending_kib": ("pullerMaxPendingKiB", "elem", int),
+    "max_concurrent_writes": ("maxConcurrentWrites", "elem", int),
+    "order": ("order", "elem", str),
+    "block_pull_order": ("blockPullOrder", "elem", str),
+    "copy_range_method": ("copyRangeMethod", "elem", str),
+    "disable_fsync": ("disableFsync", "elem", bool),
+    "weak_hash_threshold_pct": ("weakHashThresholdPct", "elem", int),
+}
+
+# Классы приоритета папок (`folders[].priority`): слой performance между defaults.performance и performance папки
+# (явные ключи/пресет папки его переопределяют). interactive — свежие файлы первыми и мало данных в полёте,
+# bulk — один copier и большие блоки; паузы bulk-папок на время догонки interactive —
+# scripts/priority_controller.py (там же `pause_windows`).
+FOLDER_PRIORITIES: dict[str, dict] = {
+    "interactive": {"order": "newestFirst", "copiers": 2, "puller_max_pending_kib": 8192},
+    "normal": {"order": "smallestFirst", "copiers": 2, "puller_max_pending_kib": 32768},
+    "bulk": {"order": "random", "copiers": 1, "puller_max_pending_kib": 65536},
+}
+
+
+def folder_priority(item: dict) -> str:
+    priority = item.get("priority") or "normal"
+    if priority not in FOLDER_PRIORITIES:
+        raise ValueError(
+            f"folders.{item.get('id')}.priority: {priority!r} (допустимо: {', '.join(FOLDER_PRIORITIES)})"
+        )
+    return priority
+
+
+def priority_layer(item: dict) -> dict:
+    # Без `priority:` слой пустой — папки без класса рендерятся как раньше.
+    return dict(FOLDER_PRIORITIES[folder_priority(item)]) if item.get("priority") else {}
+
+
+PULL_ORDERS = {"random", "alphabetic", "smallestFirst", "largestFirst", "oldestFirst", "newestFirst"}
+BLOCK_PULL_ORDERS = {"standard", "random", "inOrder"}
+COPY_RANGE_METHODS = {"standard", "ioctl", "copy_file_range", "sendfile", "duplicate_extents", "all"}
+
+
+def resolve_performance(*layers: object) -> dict:
+    # Слои применяются по порядку: defaults -> folder -> node. Внутри слоя сначала
+    # раскрывается `preset`, затем явные ключи слоя.
+    result: dict = {}
+    for layer in layers:
+        if not layer:
+            continue
+        if not isinstance(layer, dict):
+            raise ValueError("performance должен быть объектом")
+        preset = layer.get("preset")
+        if preset:
+            if preset not in PERFORMANCE_PRESETS:
+                raise ValueError(f"Неизвестный performance.preset: {preset!r} (есть: {', '.join(PERFORMANCE_PRESETS)})")
+            result.update(PERFORMANCE_PRESETS[preset])
+        for key, value in layer.items():
+            if key == "preset":
+                continue
+            if key not in PERFORMANCE_KEYS:
+                raise ValueError(f"Неизвестный ключ performance: {key!r}")
+            result[key] = value
+    for key, value in result.items():
+        _, _, kind = PERFORMANCE_KEYS[key]
+        if kind is bool:
+            if not isinstance(value, bool):
+                raise ValueError(f"performance.{key}: ожидается true/false, получено {value!r}")
+        elif kind is int:
+            if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+                raise ValueError(f"performance.{key}: ожидается целое >= 0, получено {value!r}")
+    if "order" in result and result["order"] not in PULL_ORDERS:
+        raise ValueError(f"performance.order: {result['order']!r} (допустимо: {', '.join(sorted(PULL_ORDERS))})")
+    if "block_pull_order" in result and result["block_pull_order"] not in BLOCK_PULL_ORDERS:
+        raise ValueError(
+            f"performance.block_pull_order: {result['block_pull_order']!r} "
+            f"(допустимо: {', '.join(sorted(BLOCK_PULL_ORDERS))})"
+        )
+    if "copy_range_method" in result and result["copy_range_method"] not in COPY_RANGE_METHODS:
+        raise ValueError(
+            f"performance.copy_range_method: {result['copy_range_method']!r} "
+            f"(допустимо: {', '.join(sorted(COPY_RANGE_METHODS))})"
+        )
+    return result
+
+
+# Политика подключения к устройству (`defaults.connection`, `nodes.<peer>.connection`,
+# `nodes.<node>.links.<peer>`). Syncthing не умеет “relay-only” флагом на устройство —
+# режим выражается набором адресов устройства:
+# - direct-preferred: явные tcp/quic адреса, затем relay://, затем dynamic (поведение Syncthing по умолчанию);
+# - direct-only: только явные tcp/quic адреса (LAN со статическими IP);
+# - relay-only: только явные relay:// адреса.
+CONNECTION_MODES = ("direct-preferred", "direct-only", "relay-only")
+# Тип канала (`link:`) — для выбора `compression` устройства по оценке сжимаемости папок (compress_probe.py);
+# без `link:` он выводится из mode: relay-only -> relay, direct-only -> lan. Явный `compression:` побеждает оценку.
+LINK_TYPES = ("lan", "wan", "relay")
+COMPRESSION_MODES = ("always", "metadata", "never")
+
+# yaml key -> (дочерний элемент <device>, тип)
+CONNECTION_KEYS: dict[str, tuple[str, type]] = {
+    "num_connections": ("numConnections", int),
+    "max_send_kbps": ("maxSendKbps", int),
+    "max_recv_kbps": ("maxRecvKbps", int),
+}
+
+
+def resolve_connection(*layers: object) -> dict:
+    # Слои: defaults -> peer (как к ноде подключаются все) -> link (пара “эта нода -> peer”).
+    result: dict = {}
+    for layer in layers:
+        if not layer:
+            continue
+        if not isinstance(layer, dict):
+            raise ValueError("connection должен быть объектом")
+        for key, value in layer.items():
+            if key not in CONNECTION_KEYS and key not in ("mode", "addresses", "link", "compression"):
+                raise ValueError(f"Неизвестный ключ connection: {key!r}")
+            result[key] = value
+    mode = result.get("mode")
+    if mode is not None and mode not in CONNECTION_MODES:
+        raise ValueError(f"connection.mode: {mode!r} (допустимо: {', '.join(CONNECTION_MODES)})")
+    if result.get("link") is not None and result["link"] not in LINK_TYPES:
+        raise ValueError(f"connection.link: {result['link']!r} (допустимо: {', '.join(LINK_TYPES)})")
+    if result.get("compression") is not None and result["compression"] not in COMPRESSION_MODES:
+        raise ValueError(
+            f"connection.compression: {result['compression']!r} (допустимо: {', '.join(COMPRESSION_MODES)})"
+        )
+    addresses = result.get("addresses")
+    if addresses is not None and (
+        not isinstance(addresses, list) or not all(isinstance(a, str) and a.strip() for a in addresses)
+    ):
+        raise ValueError(f"connection.addresses: ожидается список строк, получено {addresses!r}")
+    for key in CONNECTION_KEYS:
+        value = result.get(key)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value < 0):
+            raise ValueError(f"connection.{key}: ожидается целое >= 0, получено {value!r}")
+    return result
+
+
+def connection_link(connection: dict) -> str | None:
+    if connection.get("link"):
+        return connection["link"]
+    return {"relay-only": "relay", "direct-only": "lan"}.get(connection.get("mode") or "")
+
+
+def has_address_policy(connection: dict) -> bool:
+    # link/compression не задают адресов: только с ними существующие <address> устройства не трогаем.
+    return any(key in connection for key in (*CONNECTION_KEYS, "mode", "addresses"))
+
+
+def connection_addresses(connection: dict, implicit: Iterable[str] = ()) -> list[str]:
+    # implicit — адреса, известные помимо политики (например tcp://<amvera domain>:22000).
+    seen: set[str] = set()
+    direct: list[str] = []
+    relays: list[str] = []
+    for addr in [*(connection.get("addresses") or []), *implicit]:
+        addr = addr.strip()
+        if addr in seen or addr == "dynamic":
+            continue
+        seen.add(addr)
+        (relays if addr.startswith("relay://") else direct).append(addr)
+    mode = connection.get("mode") or "direct-preferred"
+    if mode == "relay-only":
+        if not relays:
+            raise ValueError("connection.mode=relay-only: нужен хотя бы один relay:// адрес в connection.addresses")
+        return relays
+    if mode == "direct-only":
+        if not direct:
+            raise ValueError("connection.mode=direct-only: нужен хотя бы один tcp:// или quic:// адрес")
+        return direct
+    return [*direct, *relays, "dynamic"]
+
+
+# Роли нод (`nodes.<node>.role`): узлов может быть сколько угодно, имена произвольные.
+# - peer: обычная рабочая машина, папки как в YAML (`type`);
+# - backup: хранит версии (simple versioning из defaults.amvera_versioning), по умолчанию для type: amvera;
+# - receive-only: только принимает изменения (папки receiveonly).
+NODE_ROLES = ("peer", "backup", "receive-only")
+
+
+def is_missing(value: str) -> bool:
+    return not value or value.strip().upper() == "REQUIRED"
+
+
+def node_role(name: str, node: object) -> str:
+    node = node if isinstance(node, dict) else {}
+    role = node.get("role") or ("backup" if node.get("type") == "amvera" else "peer")
+    if role not in NODE_ROLES:
+        raise ValueError(f"nodes.{name}.role: {role!r} (допустимо: {', '.join(NODE_ROLES)})")
+    return role
+
+
+def node_device_id(node: object) -> str:
+    return str((node or {}).get("device_id") or "").strip() if isinstance(node, dict) else ""
+
+
+def node_implicit_addresses(node: object) -> list[str]:
+    # Нода с `domain:` доступна напрямую по tcp://<domain>:22000 (порт Syncthing по умолчанию).
+    domain = str((node or {}).get("domain") or "").strip() if isinstance(node, dict) else ""
+    return [f"tcp://{domain}:22000"] if domain and not is_missing(domain) else []
+
+
+def folder_members(item: dict) -> list[str]:
+    # Папка шарится между нодами, у которых есть путь для неё (REQUIRED_LOCAL — путь задан в local.yaml).
+    paths = item.get("paths") or {}
+    return [name for name, path in paths.items() if path] if isinstance(paths, dict) else []
+
+
+def peer_links(cfg: dict, node: str) -> dict[str, str]:
+    # peer -> тип канала с точки зрения node; peer без типа и с явным `compression:` не оцениваются.
+    nodes = cfg.get("nodes") or {}
+    defaults_conn = (cfg.get("defaults") or {}).get("connection")
+    links = (nodes.get(node) or {}).get("links") or {}
+    result: dict[str, str] = {}
+    for peer, peer_cfg in nodes.items():
+        if peer == node or not isinstance(peer_cfg, dict):
+            continue
+        connection = resolve_connection(defaults_conn, peer_cfg.get("connection"), links.get(peer))
+        link = connection_link(connection)
+        if link and not connection.get("compression"):
+            result[peer] = link
+    return result
+
+
+def shared_folders(cfg: dict, node: str, peer: str) -> list[str]:
+    return [
+        str(item.get("id"))
+        for item in cfg.get("folders") or []
+        if isinstance(item, dict) and item.get("id") and {node, peer} <= set(folder_members(item))
+    ]
+
+
+def folder_type_for(item: dict, role: str) -> str:
+    return "receiveonly" if role == "receive-only" else str(item.get("type") or "sendreceive")
+
+
+def apply_connection(device: ET.Element, connection: dict, addresses: list[str]) -> None:
+    if connection.get("compression"):
+        device.set("compression", connection["compression"])
+    if not has_address_policy(connection):
+        return
+    for addr in list(device.findall("address")):
+        device.remove(addr)
+    # <address> идут первыми среди детей <device> (как пишет Syncthing).
+    for idx, addr in enumerate(addresses):
+        addr_el = ET.Element("address")
+        addr_el.text = addr
+        device.insert(idx, addr_el)
+    for key, (name, _) in CONNECTION_KEYS.items():
+        if key not in connection:
+            continue
+        el = device.find(name)
+        if el is None:
+            el = ET.SubElement(device, name)
+        el.text = str(connection[key])
+
+
+def apply_performance(folder: ET.Element, performance: dict) -> None:
+    for key, value in performance.items():
+        name, place, kind = PERFORMANCE_KEYS[key]
+        text = ("true" if value else "false") if kind is bool else str(value)
+        if place == "attr":
+            folder.set(name, text)
+            continue
+        el = folder.find(name)
+        if el is None:
+            el = ET.SubElement(folder, name)
+        el.text = text
+
+
+class ConfigPatcher:
+    def __init__(self, root: ET.Element) -> None:
+        self.root = root
+        self.devices: dict[str, ET.Element] = {}
+        self.folders: dict[str, ET.Element] = {}
+        self.local_id = ""
+        for el in root:
+            if el.tag == "device":
+                did = (el.get("id") or "").strip()
+                if not self.local_id:
+                    # Первый <device> в config.xml — локальное устройство.
+                    self.local_id = did
+                if did:
+                    self.devices.setdefault(did, el)
+            elif el.tag == "folder":
+                fid = el.get("id") or ""
+                if fid:
+                    self.folders.setdefault(fid, el)
+        self.defaults_device = root.find("defaults/device")
+        self.defaults_folder = root.find("defaults/folder")
+
+    def ensure_device(
+        self,
+        *,
+        device_id: str,
+        name: str,
+        addresses: list[str],
+        connection: dict | None = None,
+    ) -> ET.Element:
+        # Без политики существующее устройство не трогаем; с политикой (resolve_connection)
+        # адреса и лимиты рендерятся заново и для существующих — YAML источник правды.
+        if connection and has_address_policy(connection):
+            try:
+                addresses = connection_addresses(connection, addresses)
+            except ValueError as e:
+                raise ValueError(f"device {name}: {e}") from e
+        existing = self.devices.get(device_id)
+        if existing is not None:
+            if connection:
+                apply_connection(existing, connection, addresses)
+            return existing
+        if self.defaults_device is None:
+            raise ValueError("defaults/device не найден в config.xml")
+
+        new_dev = copy.deepcopy(self.defaults_device)
+        new_dev.set("id", device_id)
+        new_dev.set("name", name)
+
+        # Replace <address> entries
+        if connection:
+            apply_connection(new_dev, connection, addresses)
+        if not connection or not has_address_policy(connection):
+            for addr in list(new_dev.findall("address")):
+                new_dev.remove(addr)
+            for addr in addresses:
+                addr_el = ET.Element("address")
+                addr_el.text = addr
+                new_dev.append(addr_el)
+
+        self.root.append(new_dev)
+        self.devices[device_id] = new_dev
+        return new_dev
+
+    def ensure_folder(
+        self,
+        *,
+        folder_id: str,
+        label: str,
+        path: str,
+        folder_type: str,
+        ignore_perms: bool,
+        device_ids: Iterable[str],
+        performance: dict,
+    ) -> ET.Element:
+        folder = self.folders.get(folder_id)
+        if folder is None:
+            if self.defaults_folder is None:
+                raise ValueError("defaults/folder не найден в config.xml")
+            folder = copy.deepcopy(self.defaults_folder)
+            self.root.append(folder)
+            self.folders[folder_id] = folder
+
+        folder.set("id", folder_id)
+        folder.set("label", label)
+        folder.set("path", path)
+        folder.set("type", folder_type)
+        folder.set("ignorePerms", "true" if ignore_perms else "false")
+        apply_performance(folder, performance)
+
+        # Devices in folder
+        for dev in list(folder.findall("device")):
+            folder.remove(dev)
+        for did in device_ids:
+            dev_el = ET.Element("device")
+            dev_el.set("id", did)
+            dev_el.set("introducedBy", "")
+            enc_el = ET.Element("encryptionPassword")
+            enc_el.text = ""
+            dev_el.append(enc_el)
+            folder.append(dev_el)
+        return folder
+
+    def remove_folders(self, folder_ids: Iterable[str]) -> int:
+        drop = {fid for fid in folder_ids if fid in self.folders}
+        if drop:
+            self.root[:] = [el for el in self.root if not (el.tag == "folder" and el.get("id") in drop)]
+            for fid in drop:
+                del self.folders[fid]
+        return len(drop)
+
+    def enforce_allowed_devices(self, allowed_remote_ids: set[str]) -> int:
+        # Один проход: пересобираем список детей root вместо root.remove() на каждое устройство.
+        kept: list[ET.Element] = []
+        removed = 0
+        for el in self.root:
+            if el.tag == "device":
+                did = (el.get("id") or "").strip()
+                if did and did != self.local_id and did not in allowed_remote_ids:
+                    if self.devices.get(did) is el:
+                        del self.devices[did]
+                    removed += 1
+                    continue
+            kept.append(el)
+        if removed:
+            self.root[:] = kept
+        return removed
+
+
+def apply_versioning(
+    folder: ET.Element,
+    *,
+    versioning_type: str,
+    versioning_path: str,
+    versioning_keep: int,
+    versioning_cleanout_days: int,
+) -> None:
+    ver = folder.find("versioning")
+    if ver is None:
+        ver = ET.SubElement(folder, "versioning")
+    if versioning_type:
+        ver.set("type", versioning_type)
+    else:
+        ver.attrib.pop("type", None)
+
+    # Ensure elements exist
+    cleanup = ver.find("cleanupIntervalS")
+    if cleanup is None:
+        cleanup = ET.SubElement(ver, "cleanupIntervalS")
+        cleanup.text = "3600"
+
+    fs_path = ver.find("fsPath")
+    if fs_path is None:
+        fs_path = ET.SubElement(ver, "fsPath")
+    fs_path.text = versioning_path or ""
+
+    fs_type = ver.find("fsType")
+    if fs_type is None:
+        fs_type = ET.SubElement(ver, "fsType")
+        fs_type.text = "basic"
+
+    # Params
+    for p in list(ver.findall("param")):
+        ver.remove(p)
+    if versioning_type == "simple":
+        cleanout = ET.SubElement(ver, "param")
+        cleanout.set("key", "cleanoutDays")
+        cleanout.set("val", str(versioning_cleanout_days))
+        keep = ET.SubElement(ver, "param")
+        keep.set("key", "keep")
+        keep.set("val", str(versioning_keep))
@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import copy
+import sys
+import time
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+from config_patch import CONNECTION_KEYS, PERFORMANCE_KEYS
+from st_api import API_UNAVAILABLE, SyncthingAPI, SyncthingAPIError
+
+# Горячее применение sync-folders.yaml к запущенному Syncthing через REST API, без рестарта.
+# Желаемое состояние — config.xml с диска (Syncthing сохраняет его при каждом изменении), пропатченный тем же
+# patch_config, что и офлайн-режим. Оно сравнивается с GET /rest/config только по полям, которые рендерит YAML
+# (папки: label/path/type/ignorePerms, performance, устройства, versioning; устройства: имя, адреса, лимиты, compression),
+# и применяются только изменившиеся объекты:
+# - PATCH /rest/config/{devices,folders}/<id> — только изменённые поля;
+# - PUT — новые объекты (поверх /rest/config/defaults/{device,folder}, как ensure_* поверх <defaults>);
+# - DELETE — объекты, которые убрал патч (allowlist AMVERA_ALLOWED_DEVICE_IDS, устаревшие шарды).
+# Syncthing перезапускает только затронутые папки — остальные продолжают синхронизироваться.
+
+class ReloadRejected(RuntimeError):
+    # Syncthing отклонил изменение (4xx: неверный путь/тип/значение из YAML); предыдущие уже применены.
+    def __init__(self, summary: str, error: SyncthingAPIError, applied: list[str]) -> None:
+        done = f"; применено до ошибки: {', '.join(applied)}" if applied else ""
+        super().__init__(f"{summary}: {error}{done}")
+        self.applied = applied
+
+
+FOLDER_ATTRS: dict[str, type] = {"label": str, "path": str, "type": str, "ignorePerms": bool}
+
+
+def _typed(raw: str, kind: type):
+    raw = raw.strip()
+    if kind is bool:
+        return raw == "true"
+    if kind is int:
+        return int(raw)
+    return raw
+
+
+def folder_state(el: ET.Element) -> dict:
+    # <folder> -> поля JSON /rest/config, которыми управляет YAML (имена в JSON те же, что в config.xml).
+    state = {name: _typed(el.get(name) or "", kind) for name, kind in FOLDER_ATTRS.items() if el.get(name) is not None}
+    for name, place, kind in PERFORMANCE_KEYS.values():
+        raw = el.get(name) if place == "attr" else el.findtext(name)
+        if raw is not None and raw.strip():
+            state[name] = _typed(raw, kind)
+    state["devices"] = [d.get("id") for d in el.findall("device") if d.get("id")]
+    ver = el.find("versioning")
+    if ver is not None:
+        state["versioning"] = {
+            "type": ver.get("type") or "",
+            "params": {p.get("key"): p.get("val") for p in ver.findall("param") if p.get("key")},
+            "fsPath": (ver.findtext("fsPath") or "").strip(),
+        }
+    return state
+
+
+def device_state(el: ET.Element) -> dict:
+    state = {"name": el.get("name") or "", "addresses": [(a.text or "").strip() for a in el.findall("address")]}
+    if el.get("compression"):
+        state["compression"] = el.get("compression")
+    for name, kind in CONNECTION_KEYS.values():
+        raw = el.findtext(name)
+        if raw is not None and raw.strip():
+            state[name] = _typed(raw, kind)
+    return state
+
+
+def _folder_changes(desired: dict, live: dict) -> dict:
+    # -> тело PATCH: изменившиеся поля (devices и versioning — целиком, с сохранением остального из live).
+    body = {}
+    for key, value in desired.items():
+        if key == "devices":
+            live_devices = {d.get("deviceID"): d for d in live.get("devices") or []}
+            if set(value) != set(live_devices):
+                body[key] = [
+                    live_devices.get(did) or {"deviceID": did, "introducedBy": "", "encryptionPassword": ""}
+                    for did in value
+                ]
+        elif key == "versioning":
+            live_ver = live.get("versioning") or {}
+            current = {
+                "type": live_ver.get("type") or "",
+                "params": live_ver.get("params") or {},
+                "fsPath": live_ver.get("fsPath") or "",
+            }
+            if current != value:
+                body[key] = {**live_ver, **value}
+        elif live.get(key) != value:
+            body[key] = value
+    return body
+
+
+def _device_changes(desired: dict, live: dict) -> dict:
+    return {key: value for key, value in desired.items() if live.get(key) != value}
+
+
+def plan_reload(root: ET.Element, live: dict, defaults: dict[str, dict]) -> list[tuple[str, str, object, str]]:
+    # -> [(метод, путь, тело, описание)] в порядке применения: устройства, папки, удаления папок, удаления устройств.
+    live_devices = {d.get("deviceID"): d for d in live.get("devices") or []}
+    live_folders = {f.get("id"): f for f in live.get("folders") or []}
+    device_ops: list[tuple[str, str, object, str]] = []
+    folder_ops: list[tuple[str, str, object, str]] = []
+    desired_devices: set[str] = set()
+    desired_folders: set[str] = set()
+    for el in root:
+        if el.tag == "device" and el.get("id"):
+            did = el.get("id")
+            desired_devices.add(did)
+            state = device_state(el)
+            path = f"/rest/config/devices/{did}"
+            if did not in live_devices:
+                body = {**copy.deepcopy(defaults.get("device") or {}), **state, "deviceID": did}
+                device_ops.append(("PUT", path, body, f"device {state['name'] or did[:7]}: new"))
+            else:
+                changed = _device_changes(state, live_devices[did])
+                if changed:
+                    summary = f"device {state['name'] or did[:7]}: {', '.join(changed)}"
+                    device_ops.append(("PATCH", path, changed, summary))
+        elif el.tag == "folder" and el.get("id"):
+            fid = el.get("id")
+            desired_folders.add(fid)
+            state = folder_state(el)
+            path = f"/rest/config/folders/{fid}"
+            if fid not in live_folders:
+                base = copy.deepcopy(defaults.get("folder") or {})
+                body = {**base, **_folder_changes(state, {}), "id": fid}
+                if "versioning" in state:
+                    body["versioning"] = {**(base.get("versioning") or {}), **state["versioning"]}
+                folder_ops.append(("PUT", path, body, f"folder {fid}: new"))
+            else:
+                changed = _folder_changes(state, live_folders[fid])
+                if changed:
+                    folder_ops.append(("PATCH", path, changed, f"folder {fid}: {', '.join(changed)}"))
+    drop_folders = [
+        ("DELETE", f"/rest/config/folders/{fid}", None, f"folder {fid}: removed")
+        for fid in live_folders
+        if fid not in desired_folders
+    ]
+    drop_devices = [
+        ("DELETE", f"/rest/config/devices/{did}", None, f"device {(live_devices[did].get('name') or did[:7])}: removed")
+        for did in live_devices
+        if did not in desired_devices
+    ]
+    return [*device_ops, *folder_ops, *drop_folders, *drop_devices]
+
+
+def reload_config(api: SyncthingAPI, root: ET.Element, *, dry_run: bool = False) -> list[str]:
+    # Применяет пропатченное дерево config.xml к запущенному Syncthing; -> описания применённых изменений.
+    live = api.get("/rest/config") or {}
+    defaults = {
+        "device": api.get("/rest/config/defaults/device") or {},
+        "folder": api.get("/rest/config/defaults/folder") or {},
+    }
+    changes = plan_reload(root, live, defaults)
+    applied: list[str] = []
+    if not dry_run:
+        for method, path, body, summary in changes:
+            try:
+                api.request(method, path, body=body)
+            except SyncthingAPIError as e:
+                # 5xx — Syncthing занят/перезапускается (повторяем всё); 4xx — ошибка в данных, остальное не трогаем.
+                if e.status >= 500:
+                    raise
+                raise ReloadRejected(summary, e, applied) from e
+            applied.append(summary)
+    return [summary for _, _, _, summary in changes]
+
+
+def input_signature(paths: list[Path]) -> tuple:
+    sig = []
+    for path in paths:
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            sig.append(None)
+            continue
+        sig.append((st.st_mtime_ns, st.st_size))
+    return tuple(sig)
+
+
+def watch_inputs(paths: list[Path], interval: float, apply, *, prefix: str) -> int:
+    # Применяет apply() при старте и после каждого изменения входов; пока Syncthing не отвечает — повторяет.
+    applied = None
+    waiting = False
+    while True:
+        sig = input_signature(paths)
+        if sig != applied:
+            try:
+                code = apply()
+            except ReloadRejected as e:
+                print(f"{prefix} ERROR: Syncthing отклонил изменение: {e}; жду следующей правки", file=sys.stderr)
+                waiting = False
+                applied = sig
+            except API_UNAVAILABLE as e:
+                if isinstance(e, SyncthingAPIError) and e.status < 500:
+                    # 4xx на чтении конфига (API key, права) сам не пройдёт — ждём следующей правки.
+                    print(f"{prefix} ERROR: {e}; жду следующей правки", file=sys.stderr)
+                    waiting = False
+                    applied = sig
+                else:
+                    if not waiting:
+                        print(f"{prefix} WARN: REST API недоступен ({e}), повторю каждые {interval:g}s", file=sys.stderr)
+                    waiting = True
+            else:
+                waiting = False
+                # Ошибка в YAML: ждём следующей правки, а не повторяем ту же ошибку.
+                applied = sig
+                if code:
+                    print(f"{prefix} WARN: изменения не применены (exit {code}), жду следующей правки", file=sys.stderr)
+        time.sleep(interval)
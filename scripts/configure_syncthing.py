@@ -2,7 +2,6 @@
 from __future__ import annotations
 
 import argparse
-import copy
 import os
 import sys
 import xml.etree.ElementTree as ET
@@ -15,6 +14,37 @@ except Exception:  # pragma: no cover
     raise
 
 
+from config_patch import (
+    ConfigPatcher,
+    apply_versioning,
+    folder_members,
+    folder_type_for,
+    is_missing,
+    node_device_id,
+    node_implicit_addresses,
+    node_role,
+    peer_links,
+    priority_layer,
+    resolve_connection,
+    resolve_performance,
+    shared_folders,
+)
+from compress_probe import describe_compression, describe_sample, estimate_compression, plan_compression
+from config_reload import ReloadRejected, reload_config, watch_inputs
+from copy_probe import CACHE_NAME, CopyCaps, describe_caps, probe_copy_caps
+from fs_probe import (
+    WatchPlan,
+    apply_watch_plan,
+    describe,
+    describe_plan,
+    plan_watchers,
+    probe_folder,
+    read_inotify_limit,
+    read_mounts,
+)
+from shards import apply_shard_ignores, describe_candidates, expand_shards, glob_candidates, node_root, stale_shards
+from st_api import SyncthingAPI, SyncthingAPIError
+
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 
 
@@ -33,9 +63,28 @@ def merge_local_config(base: dict, local: dict) -> dict:
     if isinstance(local_nodes, dict):
         for node_name, node_cfg in local_nodes.items():
             if isinstance(node_cfg, dict):
-                merged_nodes[node_name] = {**(merged_nodes.get(node_name) or {}), **node_cfg}
+                node = {**(merged_nodes.get(node_name) or {}), **node_cfg}
+                for key in ("performance", "connection", "links"):
+                    base_value = (merged_nodes.get(node_name) or {}).get(key)
+                    if isinstance(base_value, dict) and isinstance(node_cfg.get(key), dict):
+                        node[key] = {**base_value, **node_cfg[key]}
+                # links.<peer> — тоже объекты: мержим по каждому peer.
+                base_links = (merged_nodes.get(node_name) or {}).get("links")
+                if isinstance(base_links, dict) and isinstance(node_cfg.get("links"), dict):
+                    for peer, link in node_cfg["links"].items():
+                        if isinstance(base_links.get(peer), dict) and isinstance(link, dict):
+                            node["links"][peer] = {**base_links[peer], **link}
+                merged_nodes[node_name] = node
     merged["nodes"] = merged_nodes
 
+    local_defaults = local.get("defaults") or {}
+    if isinstance(local_defaults, dict):
+        defaults = dict(merged.get("defaults") or {})
+        for key in ("performance", "connection"):
+            if isinstance(local_defaults.get(key), dict):
+                defaults[key] = {**(defaults.get(key) or {}), **local_defaults[key]}
+        merged["defaults"] = defaults
+
     local_folders = local.get("folders") or {}
     if isinstance(local_folders, dict):
         folders = merged.get("folders") or []
@@ -53,9 +102,14 @@ def merge_local_config(base: dict, local: dict) -> dict:
                 if not isinstance(paths, dict):
                     paths = {}
                     item["paths"] = paths
+                # Ключ-имя ноды (любой из nodes.*) со строкой — путь папки на этой ноде.
                 for k, v in overrides.items():
-                    if k in ("wsl_a", "wsl_b", "amvera") and isinstance(v, str) and v:
+                    if k in merged_nodes and isinstance(v, str) and v:
                         paths[k] = v
+                if isinstance(overrides.get("performance"), dict):
+                    item["performance"] = {**(item.get("performance") or {}), **overrides["performance"]}
+                if isinstance(overrides.get("mirror"), dict):
+                    item["mirror"] = {**(item.get("mirror") or {}), **overrides["mirror"]}
     return merged
 
 
@@ -67,67 +121,154 @@ def expand_path(raw: str) -> str:
     return str(Path(os.path.expanduser(raw)).resolve())
 
 
-def find_or_add_device(root: ET.Element, template: ET.Element, *, device_id: str, name: str, addresses: list[str]) -> None:
-    for dev in root.findall("device"):
-        if dev.get("id") == device_id:
-            return
+# Применяет sync-folders.yaml к дереву config.xml ноды; возвращает список предупреждений.
+def patch_config(
+    root: ET.Element,
+    cfg: dict,
+    node: str,
+    *,
+    create_dirs: bool = True,
+    watch_plans: dict[str, WatchPlan] | None = None,
+    copy_caps: dict[str, CopyCaps] | None = None,
+    compression: dict[str, str] | None = None,
+) -> list[str]:
+    nodes = cfg.get("nodes") or {}
+    if not isinstance(nodes, dict):
+        raise ValueError("nodes должен быть объектом")
 
-    new_dev = copy.deepcopy(template)
-    new_dev.set("id", device_id)
-    new_dev.set("name", name)
+    if not isinstance(nodes.get(node), dict):
+        raise ValueError(f"нет nodes.{node}")
+    role = node_role(node, nodes.get(node))
 
-    for addr in list(new_dev.findall("address")):
-        new_dev.remove(addr)
-    for addr in addresses:
-        addr_el = ET.Element("address")
-        addr_el.text = addr
-        new_dev.append(addr_el)
+    patcher = ConfigPatcher(root)
+    local_id = patcher.local_id
+    if not local_id:
+        raise ValueError("не удалось определить local device id из config.xml")
+    if patcher.defaults_device is None or patcher.defaults_folder is None:
+        raise ValueError("defaults templates not found in config.xml")
+
+    warnings: list[str] = []
+
+    # Политика подключения к peer: defaults.connection -> nodes.<peer>.connection -> nodes.<node>.links.<peer>.
+    defaults_conn = (cfg.get("defaults") or {}).get("connection")
+    links = (nodes.get(node) or {}).get("links") or {}
+    if not isinstance(links, dict):
+        raise ValueError(f"nodes.{node}.links должен быть объектом")
+
+    def peer_connection(peer: str) -> dict:
+        try:
+            return resolve_connection(defaults_conn, (nodes.get(peer) or {}).get("connection"), links.get(peer))
+        except ValueError as e:
+            raise ValueError(f"{node} -> {peer}: {e}") from e
+
+    # Remote device entries: все остальные ноды из YAML (имя устройства = имя ноды).
+    peer_ids: dict[str, str] = {}
+    for peer, peer_cfg in nodes.items():
+        if peer == node or not isinstance(peer_cfg, dict):
+            continue
+        peer_id = node_device_id(peer_cfg)
+        if is_missing(peer_id):
+            warnings.append(f"{peer}.device_id не задан — нода будет работать без {peer}.")
+            continue
+        if peer_id == local_id:
+            continue
+        peer_ids[peer] = peer_id
+        connection = peer_connection(peer)
+        # compression по оценке сжимаемости общих папок — если в YAML не задан явно.
+        if (compression or {}).get(peer) and not connection.get("compression"):
+            connection = {**connection, "compression": compression[peer]}
+        patcher.ensure_device(
+            device_id=peer_id,
+            name=peer,
+            # Опционально: если нода доступна по прямому TCP (domain:, порт Syncthing 22000).
+            addresses=[*node_implicit_addresses(peer_cfg), "dynamic"],
+            connection=connection,
+        )
 
-    root.append(new_dev)
+    # GUI локально
+    gui = root.find("gui")
+    if gui is not None:
+        addr = gui.find("address")
+        if addr is not None:
+            addr.text = "127.0.0.1:8384"
+    options = root.find("options")
+    if options is not None:
+        start_browser = options.find("startBrowser")
+        if start_browser is not None:
+            start_browser.text = "false"
 
+    folders = cfg.get("folders") or []
+    if not isinstance(folders, list):
+        raise ValueError("folders должен быть массивом")
 
-def find_or_add_folder(
-    root: ET.Element,
-    template: ET.Element,
-    *,
-    folder_id: str,
-    label: str,
-    path: str,
-    folder_type: str,
-    ignore_perms: bool,
-    device_ids: list[str],
-) -> None:
-    existing = None
-    for f in root.findall("folder"):
-        if f.get("id") == folder_id:
-            existing = f
-            break
-
-    folder = existing or copy.deepcopy(template)
-    folder.set("id", folder_id)
-    folder.set("label", label)
-    folder.set("path", path)
-    folder.set("type", folder_type)
-    folder.set("ignorePerms", "true" if ignore_perms else "false")
-
-    for dev in list(folder.findall("device")):
-        folder.remove(dev)
-    for did in device_ids:
-        dev_el = ET.Element("device")
-        dev_el.set("id", did)
-        dev_el.set("introducedBy", "")
-        enc_el = ET.Element("encryptionPassword")
-        enc_el.text = ""
-        dev_el.append(enc_el)
-        folder.append(dev_el)
-
-    # На WSL нодах versioning выключаем явно.
-    ver = folder.find("versioning")
-    if ver is not None:
-        ver.attrib.pop("type", None)
-
-    if existing is None:
-        root.append(folder)
+    defaults_perf = (cfg.get("defaults") or {}).get("performance")
+    node_perf = (nodes.get(node) or {}).get("performance")
+    versioning = (cfg.get("defaults") or {}).get("amvera_versioning") or {}
+
+    for item in folders:
+        if not isinstance(item, dict):
+            continue
+        folder_id = str(item.get("id") or "").strip()
+        if not folder_id:
+            continue
+        label = str(item.get("label") or folder_id)
+        folder_type = folder_type_for(item, role)
+        ignore_perms = bool(item.get("ignore_perms", True))
+        paths = item.get("paths") or {}
+        if not isinstance(paths, dict):
+            continue
+        # mirror.<node>: Syncthing работает в ext4-копии, на Windows-сторону её переносит scripts/drvfs_mirror.py.
+        mirror = item.get("mirror") if isinstance(item.get("mirror"), dict) else {}
+        raw_path = mirror.get(node) or paths.get(node)
+        if not raw_path or raw_path == "REQUIRED_LOCAL":
+            continue
+        folder_path = expand_path(raw_path)
+        if create_dirs:
+            ensure_dir(Path(folder_path))
+        # Адаптивный watcher/рескан и способ копирования блоков (по замеру корня) — нижние слои,
+        # пресеты и явные ключи их переопределяют.
+        plan = (watch_plans or {}).get(folder_id)
+        caps = (copy_caps or {}).get(folder_id)
+        performance = resolve_performance(
+            caps.layer() if caps else None,
+            plan.layer() if plan else None,
+            defaults_perf,
+            priority_layer(item),
+            item.get("performance"),
+            node_perf,
+        )
+        if plan:
+            performance = apply_watch_plan(performance, plan)
+
+        folder = patcher.ensure_folder(
+            folder_id=folder_id,
+            label=label,
+            path=folder_path,
+            folder_type=folder_type,
+            ignore_perms=ignore_perms,
+            # Папка шарится только с нодами, у которых есть для неё путь.
+            device_ids=[local_id, *(peer_ids[m] for m in folder_members(item) if m in peer_ids)],
+            performance=performance,
+        )
+
+        if role == "backup":
+            # Backup-нода вне контейнера: simple versioning в .stversions папки (параметры как у Amvera).
+            apply_versioning(
+                folder,
+                versioning_type=str(versioning.get("type") or "simple"),
+                versioning_path="",
+                versioning_keep=int(versioning.get("keep", 3)),
+                versioning_cleanout_days=int(versioning.get("cleanout_days", 30)),
+            )
+        else:
+            # На рабочих нодах versioning выключаем явно.
+            ver = folder.find("versioning")
+            if ver is not None:
+                ver.attrib.pop("type", None)
+
+    # Шарды, которых больше нет (директорию удалили или убрали из shard.dirs): их содержимое снова в родителе.
+    patcher.remove_folders(stale_shards(cfg, list(patcher.folders)))
+    return warnings
 
 
 def main() -> int:
@@ -137,31 +278,79 @@ def main() -> int:
         default=str(PROJECT_ROOT / "sync-folders.yaml"),
         help="Путь до sync-folders.yaml",
     )
-    parser.add_argument("--node", required=True, choices=["wsl_a", "wsl_b"], help="Имя ноды")
+    parser.add_argument("--node", required=True, help="Имя ноды (ключ nodes.* в sync-folders.yaml)")
     parser.add_argument(
         "--home",
         default=str(Path("~/.local/state/syncthing").expanduser()),
         help="Syncthing home directory (содержит config.xml, cert.pem, key.pem)",
     )
+    parser.add_argument(
+        "--fs-budget",
+        type=float,
+        default=2.0,
+        help="Секунд на замер каждой папки: тип ФС, стоимость скана, число директорий для inotify (0 — не проверять)",
+    )
+    parser.add_argument(
+        "--copy-probe-mib",
+        type=float,
+        default=8.0,
+        help="Размер тестового файла для выбора copyRangeMethod по ФС корня, MiB (0 — не проверять)",
+    )
+    parser.add_argument(
+        "--copy-probe-refresh",
+        action="store_true",
+        help=f"Замерить копирование заново, не глядя в кеш ({CACHE_NAME} в --home)",
+    )
+    parser.add_argument(
+        "--compress-probe-mib",
+        type=float,
+        default=16.0,
+        help="Объём выборки файлов каждой папки для оценки сжимаемости -> compression устройств "
+        "по типу канала (connection.link), MiB (0 — не оценивать)",
+    )
+    parser.add_argument(
+        "--live",
+        action="store_true",
+        help="Применить к запущенному Syncthing через REST API (только изменившиеся объекты, без рестарта)",
+    )
+    parser.add_argument(
+        "--watch",
+        type=float,
+        default=0.0,
+        metavar="SECONDS",
+        help="Следить за sync-folders.yaml/local.yaml и применять изменения как --live (период проверки, сек)",
+    )
     args = parser.parse_args()
 
+    if args.watch > 0:
+        config_path = Path(args.config).resolve()
+        inputs = [config_path, config_path.with_name("sync-folders.local.yaml")]
+        print(f"[reload] слежу за {', '.join(str(p) for p in inputs)} каждые {args.watch:g}s", file=sys.stderr)
+        try:
+            return watch_inputs(inputs, args.watch, lambda: configure(args, live=True), prefix="[reload]")
+        except KeyboardInterrupt:
+            return 0
+    try:
+        return configure(args, live=args.live)
+    except (OSError, SyncthingAPIError, ReloadRejected) as e:
+        print(f"ERROR: REST API Syncthing: {e}", file=sys.stderr)
+        return 1
+
+
+def configure(args: argparse.Namespace, *, live: bool) -> int:
+    # live: вместо перезаписи config.xml (нужен рестарт) — diff с /rest/config и PATCH/PUT/DELETE изменившихся объектов.
     config_path = Path(args.config).resolve()
-    cfg = load_yaml(config_path)
-    local_path = config_path.with_name("sync-folders.local.yaml")
-    if local_path.exists():
-        cfg = merge_local_config(cfg, load_yaml(local_path))
-    nodes = cfg.get("nodes") or {}
-    if not isinstance(nodes, dict):
-        raise ValueError("nodes должен быть объектом")
-
-    # Device IDs must be filled in YAML.
-    wsl_a_id = str((nodes.get("wsl_a") or {}).get("device_id") or "").strip()
-    wsl_b_id = str((nodes.get("wsl_b") or {}).get("device_id") or "").strip()
-    amvera_id = str((nodes.get("amvera") or {}).get("device_id") or "").strip()
-    amvera_domain = str((nodes.get("amvera") or {}).get("domain") or "").strip()
-
-    def is_missing(value: str) -> bool:
-        return not value or value.strip().upper() == "REQUIRED"
+    try:
+        cfg = load_yaml(config_path)
+        local_path = config_path.with_name("sync-folders.local.yaml")
+        if local_path.exists():
+            cfg = merge_local_config(cfg, load_yaml(local_path))
+        cfg = expand_shards(cfg)
+    except (ValueError, yaml.YAMLError) as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 2
+    for folder_id, names in glob_candidates(cfg, args.node).items():
+        print(f"[configure] shard {describe_candidates(folder_id, names)}")
 
     home_dir = Path(args.home).expanduser().resolve()
     config_xml = home_dir / "config.xml"
@@ -178,89 +367,121 @@ def main() -> int:
     tree = ET.parse(config_xml)
     root = tree.getroot()
 
-    local_device = root.find("device")
-    local_id = local_device.get("id") if local_device is not None else ""
-    if not local_id:
-        print("ERROR: не удалось определить local device id из config.xml", file=sys.stderr)
-        return 2
+    watch_plans = None
+    if args.fs_budget > 0:
+        watch_plans = plan_folder_watchers(folder_roots(cfg, args.node), args.fs_budget)
+    copy_caps = None
+    if args.copy_probe_mib > 0:
+        copy_caps = plan_copy_methods(
+            folder_roots(cfg, args.node), home_dir / CACHE_NAME, args.copy_probe_mib, args.copy_probe_refresh
+        )
 
-    defaults_device = root.find("defaults/device")
-    defaults_folder = root.find("defaults/folder")
-    if defaults_device is None or defaults_folder is None:
-        print("ERROR: defaults templates not found in config.xml", file=sys.stderr)
+    try:
+        compression = None
+        if args.compress_probe_mib > 0:
+            compression = plan_device_compression(cfg, args.node, folder_roots(cfg, args.node), args.compress_probe_mib)
+        warnings = patch_config(
+            root, cfg, args.node, watch_plans=watch_plans, copy_caps=copy_caps, compression=compression
+        )
+    except ValueError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
         return 2
-
-    other_wsl_id = wsl_b_id if args.node == "wsl_a" else wsl_a_id
-    other_wsl_name = "wsl_b" if args.node == "wsl_a" else "wsl_a"
-
-    # Remote device entries
-    remote_device_ids: list[str] = []
-
-    if not is_missing(other_wsl_id):
-        remote_device_ids.append(other_wsl_id)
-        find_or_add_device(root, defaults_device, device_id=other_wsl_id, name=other_wsl_name, addresses=["dynamic"])
-    else:
-        print(f"WARN: {other_wsl_name}.device_id не задан — нода будет работать без второй WSL ноды.", file=sys.stderr)
-
-    if not is_missing(amvera_id):
-        remote_device_ids.append(amvera_id)
-        amvera_addresses = ["dynamic"]
-        if amvera_domain and amvera_domain.upper() != "REQUIRED":
-            # Опционально: если Amvera доступна по прямому TCP (порт Syncthing 22000).
-            amvera_addresses = [f"tcp://{amvera_domain}:22000", "dynamic"]
-        find_or_add_device(root, defaults_device, device_id=amvera_id, name="amvera", addresses=amvera_addresses)
+    for warning in warnings:
+        print(f"WARN: {warning}", file=sys.stderr)
+
+    if live:
+        api = SyncthingAPI.from_config_xml(config_xml)
+        try:
+            changes = reload_config(api, root)
+        finally:
+            api.close()
+        for change in changes:
+            print(f"OK: [live] {change}")
+        print(f"OK: применено изменений: {len(changes)} (REST API, без рестарта Syncthing)")
     else:
-        print("WARN: amvera.device_id не задан — нода будет работать без Amvera.", file=sys.stderr)
+        ET.indent(tree, space="    ")
+        tree.write(config_xml, encoding="utf-8")
+        print(f"OK: обновлён {config_xml}")
+    update_shard_ignores(cfg, args.node)
 
-    # GUI локально
-    gui = root.find("gui")
-    if gui is not None:
-        addr = gui.find("address")
-        if addr is not None:
-            addr.text = "127.0.0.1:8384"
-    options = root.find("options")
-    if options is not None:
-        start_browser = options.find("startBrowser")
-        if start_browser is not None:
-            start_browser.text = "false"
+    return 0
 
-    folders = cfg.get("folders") or []
-    if not isinstance(folders, list):
-        raise ValueError("folders должен быть массивом")
 
-    for item in folders:
-        if not isinstance(item, dict):
+def update_shard_ignores(cfg: dict, node: str) -> None:
+    # Родитель шардированной папки игнорирует шарды (блок в его локальном .stignore), иначе файлы синхронизируются дважды.
+    for item in cfg.get("folders") or []:
+        if not isinstance(item, dict) or "shard_dirs" not in item:
             continue
-        folder_id = str(item.get("id") or "").strip()
-        if not folder_id:
-            continue
-        label = str(item.get("label") or folder_id)
-        folder_type = str(item.get("type") or "sendreceive")
-        ignore_perms = bool(item.get("ignore_perms", True))
-        paths = item.get("paths") or {}
-        if not isinstance(paths, dict):
+        raw = node_root(item, node)
+        if not raw:
             continue
-        raw_path = paths.get(args.node)
-        if not raw_path or raw_path == "REQUIRED_LOCAL":
+        stignore = Path(expand_path(raw)) / ".stignore"
+        if not stignore.exists():
+            print(f"WARN: [shards] нет {stignore} — запусти scripts/install_stignore.py --node {node}", file=sys.stderr)
             continue
-        folder_path = expand_path(raw_path)
-        ensure_dir(Path(folder_path))
+        names = item["shard_dirs"]
+        if apply_shard_ignores(stignore, names):
+            print(f"OK: [shards] {item.get('id')}: {len(names)} шард(ов) в {stignore}")
 
-        find_or_add_folder(
-            root,
-            defaults_folder,
-            folder_id=folder_id,
-            label=label,
-            path=folder_path,
-            folder_type=folder_type,
-            ignore_perms=ignore_perms,
-            device_ids=[local_id, *remote_device_ids],
-        )
 
-    ET.indent(tree, space="    ")
-    tree.write(config_xml, encoding="utf-8")
-    print(f"OK: обновлён {config_xml}")
-    return 0
+def folder_roots(cfg: dict, node: str) -> dict[str, Path]:
+    # folder id -> корень, который будет сканировать Syncthing на этой ноде (mirror.<node> важнее paths.<node>).
+    roots: dict[str, Path] = {}
+    for item in cfg.get("folders") or []:
+        if not isinstance(item, dict) or not isinstance(item.get("paths") or {}, dict):
+            continue
+        mirror = item.get("mirror") if isinstance(item.get("mirror"), dict) else {}
+        raw_path = mirror.get(node) or (item.get("paths") or {}).get(node)
+        folder_id = str(item.get("id") or "").strip()
+        if folder_id and raw_path and raw_path != "REQUIRED_LOCAL":
+            roots[folder_id] = Path(expand_path(raw_path))
+    return roots
+
+
+def plan_folder_watchers(roots: dict[str, Path], budget_s: float) -> dict[str, WatchPlan]:
+    # Тип ФС и стоимость скана каждого корня (drvfs /mnt/c — медленно и без inotify), затем watcher/рескан
+    # по числу директорий и лимиту fs.inotify.max_user_watches.
+    mounts = read_mounts()
+    probes = {folder_id: probe_folder(path, mounts, budget_s=budget_s) for folder_id, path in roots.items()}
+    for folder_id, probe in probes.items():
+        line, warn = describe(folder_id, probe)
+        print(f"{'WARN' if warn else 'INFO'}: [fs] {line}", file=sys.stderr if warn else sys.stdout)
+    plans, warnings = plan_watchers(probes, read_inotify_limit())
+    for folder_id, plan in plans.items():
+        print(f"INFO: [watch] {describe_plan(folder_id, probes[folder_id], plan)}")
+    for warning in warnings:
+        print(f"WARN: [watch] {warning}", file=sys.stderr)
+    return plans
+
+
+def plan_copy_methods(roots: dict[str, Path], cache_path: Path, size_mib: float, refresh: bool) -> dict[str, CopyCaps]:
+    # Какие способы копирования блоков работают на ФС каждого корня и какой быстрее (кеш по устройству/монтированию).
+    caps, warnings = probe_copy_caps(roots, cache_path, size_mib=size_mib, refresh=refresh)
+    for folder_id, found in caps.items():
+        print(f"INFO: [copy] {describe_caps(folder_id, found)}")
+    for warning in warnings:
+        print(f"WARN: [copy] {warning}", file=sys.stderr)
+    return caps
+
+
+def plan_device_compression(cfg: dict, node: str, roots: dict[str, Path], size_mib: float) -> dict[str, str]:
+    # Тип канала до peer (connection.link / mode) и сжимаемость общих папок -> compression устройства.
+    links = peer_links(cfg, node)
+    shared = {peer: shared_folders(cfg, node, peer) for peer in links}
+    # LAN -> never без оценки: выборку читаем только для папок, общих с relay/wan peer.
+    needed = {folder_id for peer, link in links.items() if link != "lan" for folder_id in shared[peer]}
+    samples = estimate_compression({f: roots[f] for f in sorted(needed) if f in roots}, size_mib)
+    for folder_id, sample in samples.items():
+        print(f"INFO: [compress] {describe_sample(folder_id, sample)}")
+        if sample.errors:
+            print(
+                f"WARN: [compress] {folder_id}: не прочитано {len(sample.errors)} файл(ов): {sample.errors[0]}",
+                file=sys.stderr,
+            )
+    plans = plan_compression(links, shared, samples)
+    for peer, plan in plans.items():
+        print(f"INFO: [compress] {describe_compression(peer, plan)}")
+    return {peer: plan.compression for peer, plan in plans.items()}
 
 
 if __name__ == "__main__":
@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from fnmatch import fnmatch
+from pathlib import Path
+
+from install_stignore import PROJECT_ROOT, iter_folder_paths, load_config
+from shards import expand_shards
+from st_ignore import IgnoreMatcher, IgnoreParseError, is_internal
+
+# Индекс sync-conflict копий по всем папкам ноды и пакетное разрешение конфликтов.
+# Полный `find` по /mnt/c (drvfs) — минуты; здесь для каждой папки хранится индекс директорий
+# (SQLite: путь -> mtime, поддиректории, conflict-копии). Новая копия меняет mtime своей директории, поэтому
+# при повторном запуске директория с прежним mtime не перечитывается — только stat (параллельно, пачками).
+#
+# Syncthing называет копию `<имя>.sync-conflict-<YYYYMMDD>-<HHMMSS>-<short device id><.ext>`, где short id —
+# первые 7 символов Device ID устройства, чья версия проиграла. По nodes.*.device_id он сопоставляется с нодой.
+
+CONFLICT_RE = re.compile(r"^(?P<stem>.*)\.sync-conflict-(?P<date>\d{8})-(?P<time>\d{6})-(?P<device>[A-Z0-9]{7})(?P<ext>\.[^.]*)?$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    subdirs TEXT NOT NULL,
+    conflicts TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+POLICIES = ("keep-newest", "keep-node", "merge-jsonl")
+# Проигравшие версии по умолчанию не удаляются, а переносятся сюда (.stversions Syncthing не синхронизирует).
+BACKUP_DIR = ".stversions/sync-conflicts"
+
+
+def default_state_dir() -> Path:
+    base = os.environ.get("XDG_STATE_HOME") or str(Path.home() / ".local/state")
+    return Path(base) / "syncthing-conflicts"
+
+
+@dataclass
+class Copy:
+    rel: str
+    device: str
+    stamp: str  # YYYYMMDD-HHMMSS из имени
+    node: str | None = None
+
+
+@dataclass
+class Conflict:
+    original: str
+    copies: list[Copy] = field(default_factory=list)
+
+
+def parse_conflict(name: str) -> tuple[str, str, str] | None:
+    # -> (имя оригинала, short device id, отметка времени) или None.
+    m = CONFLICT_RE.match(name)
+    if not m:
+        return None
+    return m["stem"] + (m["ext"] or ""), m["device"], f"{m['date']}-{m['time']}"
+
+
+def ignores_digest(root: Path) -> str:
+    # Смена игноров меняет набор обходимых директорий — тогда индекс папки строится заново.
+    h = hashlib.sha256()
+    for name in (".stignore", ".stignore_sync"):
+        try:
+            h.update((root / name).read_bytes())
+        except OSError:
+            h.update(b"-")
+    return h.hexdigest()
+
+
+class ConflictIndex:
+    def __init__(self, folder_id: str, root: Path, state_dir: Path, *, workers: int = 8) -> None:
+        self.folder_id = folder_id
+        self.root = root
+        self.workers = max(1, workers)
+        state_dir.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(state_dir / f"{folder_id}.sqlite")
+        self.db.executescript(SCHEMA)
+        try:
+            self.matcher = IgnoreMatcher.from_file(root / ".stignore")
+        except (IgnoreParseError, OSError):
+            self.matcher = IgnoreMatcher([])
+        self.skip_dirs = self.matcher.skip_ignored_dirs()
+        self.dirs_seen = 0
+        self.dirs_listed = 0
+
+    def close(self) -> None:
+        self.db.close()
+
+    def _list(self, rel_dir: str) -> tuple[list[str], list[str]]:
+        subdirs: list[str] = []
+        conflicts: list[str] = []
+        with os.scandir(self.root / rel_dir if rel_dir else self.root) as it:
+            for entry in it:
+                rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                if is_internal(rel):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not (self.skip_dirs and self.matcher.is_ignored(rel)):
+                            subdirs.append(entry.name)
+                    elif ".sync-conflict-" in entry.name and parse_conflict(entry.name) and not self.matcher.is_ignored(rel):
+                        conflicts.append(entry.name)
+                except OSError:
+                    continue
+        return subdirs, conflicts
+
+    def _visit(self, rel_dir: str, known: dict[str, tuple[int, str, str]]) -> tuple[str, int, str, str, bool] | None:
+        # -> (dir, mtime, subdirs, conflicts, перечитана ли) или None, если директории больше нет.
+        try:
+            mtime = (self.root / rel_dir if rel_dir else self.root).stat().st_mtime_ns
+        except OSError:
+            return None
+        row = known.get(rel_dir)
+        if row and row[0] == mtime:
+            return rel_dir, mtime, row[1], row[2], False
+        try:
+            subdirs, conflicts = self._list(rel_dir)
+        except OSError:
+            return None
+        return rel_dir, mtime, "\n".join(subdirs), "\n".join(conflicts), True
+
+    def refresh(self) -> list[str]:
+        # Обходит дерево, перечитывая только директории с изменившимся mtime; -> rel пути всех conflict-копий.
+        digest = ignores_digest(self.root)
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'ignores'").fetchone()
+        if not row or row[0] != digest:
+            self.db.execute("DELETE FROM dirs")
+        known = {path: (mtime, subdirs, conflicts) for path, mtime, subdirs, conflicts in self.db.execute("SELECT * FROM dirs")}
+
+        updates: list[tuple[str, int, str, str]] = []
+        seen: set[str] = set()
+        found: list[str] = []
+        batch_size = self.workers * 4
+        pending = [""]
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while pending:
+                batch = pending[-batch_size:]
+                del pending[-batch_size:]
+                for result in pool.map(lambda rel: self._visit(rel, known), batch):
+                    if result is None:
+                        continue
+                    rel_dir, mtime, subdirs, conflicts, listed = result
+                    seen.add(rel_dir)
+                    if listed:
+                        updates.append((rel_dir, mtime, subdirs, conflicts))
+                        self.dirs_listed += 1
+                    prefix = f"{rel_dir}/" if rel_dir else ""
+                    pending.extend(prefix + name for name in subdirs.split("\n") if name)
+                    found.extend(prefix + name for name in conflicts.split("\n") if name)
+        self.dirs_seen = len(seen)
+
+        self.db.executemany("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?)", updates)
+        self.db.executemany("DELETE FROM dirs WHERE path = ?", [(path,) for path in known if path not in seen])
+        self.db.execute("INSERT OR REPLACE INTO meta VALUES ('ignores', ?)", (digest,))
+        self.db.commit()
+        return found
+
+
+def group_conflicts(paths: list[str], nodes_by_short: dict[str, str]) -> list[Conflict]:
+    groups: dict[str, Conflict] = {}
+    for rel in paths:
+        parent, _, name = rel.rpartition("/")
+        parsed = parse_conflict(name)
+        if not parsed:
+            continue
+        original_name, device, stamp = parsed
+        original = f"{parent}/{original_name}" if parent else original_name
+        conflict = groups.setdefault(original, Conflict(original))
+        conflict.copies.append(Copy(rel, device, stamp, nodes_by_short.get(device)))
+    for conflict in groups.values():
+        conflict.copies.sort(key=lambda c: c.stamp)
+    return sorted(groups.values(), key=lambda c: c.original)
+
+
+def node_short_ids(cfg: dict) -> dict[str, str]:
+    result: dict[str, str] = {}
+    for name, node in (cfg.get("nodes") or {}).items():
+        device_id = str((node or {}).get("device_id") or "").strip().upper() if isinstance(node, dict) else ""
+        if len(device_id) >= 7 and device_id not in ("REQUIRED",):
+            result[device_id[:7]] = name
+    return result
+
+
+def mtime_of(path: Path) -> float | None:
+    try:
+        return path.stat().st_mtime
+    except OSError:
+        return None
+
+
+def pick_winner(root: Path, conflict: Conflict, policy: str, keep_node: str | None) -> str | None:
+    # -> rel путь версии, которая станет оригиналом (None — оставить оригинал как есть).
+    if policy == "keep-newest":
+        candidates = [(mtime_of(root / c.rel), c.rel) for c in conflict.copies]
+        original_mtime = mtime_of(root / conflict.original)
+        best = max(((m, rel) for m, rel in candidates if m is not None), default=None)
+        if best and (original_mtime is None or best[0] > original_mtime):
+            return best[1]
+        return None
+    if policy == "keep-node":
+        # Копия несёт версию той ноды, чья запись проиграла; нет копии от keep_node — её версия уже в оригинале.
+        own = [c for c in conflict.copies if c.node == keep_node]
+        return own[-1].rel if own else None
+    raise ValueError(policy)
+
+
+def merge_jsonl(paths: list[Path]) -> bytes:
+    # Append-only JSONL (codex sessions): строки оригинала, затем новые строки копий в их порядке, без повторов.
+    seen: set[bytes] = set()
+    out: list[bytes] = []
+    for path in paths:
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            continue
+        for line in data.splitlines():
+            if line.strip() and line not in seen:
+                seen.add(line)
+                out.append(line)
+    return b"".join(line + b"\n" for line in out)
+
+
+def retire(root: Path, rel: str, *, delete: bool, suffix: str = "") -> None:
+    # Убирает проигравшую версию: в .stversions/sync-conflicts/ (по умолчанию) или совсем.
+    path = root / rel
+    if delete:
+        path.unlink(missing_ok=True)
+        return
+    target = root / BACKUP_DIR / (rel + suffix)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(path, target)
+
+
+def resolve(root: Path, conflict: Conflict, policy: str, *, keep_node: str | None, delete: bool, dry_run: bool) -> str:
+    original = root / conflict.original
+    copies = [c.rel for c in conflict.copies]
+    # Прежний оригинал в бэкапе — с отметкой времени, чтобы повторные разрешения не затирали друг друга.
+    stamp = time.strftime(".%Y%m%d-%H%M%S")
+    if policy == "merge-jsonl":
+        if not conflict.original.endswith(".jsonl"):
+            return "skip (не .jsonl)"
+        if dry_run:
+            return f"merge {len(copies)} копий"
+        merged = merge_jsonl([original, *(root / rel for rel in copies)])
+        if original.exists() and not delete:
+            backup = root / BACKUP_DIR / (conflict.original + stamp)
+            backup.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(original, backup)
+        tmp = original.with_name(f".{original.name}.merge-tmp")
+        tmp.write_bytes(merged)
+        os.replace(tmp, original)
+        for rel in copies:
+            retire(root, rel, delete=delete)
+        return f"merged {len(copies)} копий"
+
+    winner = pick_winner(root, conflict, policy, keep_node)
+    if dry_run:
+        return f"keep {winner or 'original'}"
+    if winner:
+        if original.exists():
+            retire(root, conflict.original, delete=delete, suffix=stamp)
+        os.replace(root / winner, original)
+    for rel in copies:
+        if rel != winner:
+            retire(root, rel, delete=delete)
+    return f"kept {winner or 'original'}"
+
+
+def human_size(path: Path) -> str:
+    try:
+        size = path.stat().st_size
+    except OSError:
+        return "-"
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024 or unit == "GiB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return "-"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Найти и разрешить sync-conflict копии во всех папках ноды.")
+    parser.add_argument("--config", default=str(PROJECT_ROOT / "sync-folders.yaml"), help="Путь до sync-folders.yaml")
+    parser.add_argument("--node", required=True, help="Имя ноды (ключ nodes.* в sync-folders.yaml)")
+    parser.add_argument("--folder", action="append", default=[], help="Только эти folder id (можно несколько)")
+    parser.add_argument("--match", action="append", default=[], help="Только оригиналы, подходящие под glob (например '*.jsonl')")
+    parser.add_argument("--state-dir", default=str(default_state_dir()), help="Где хранить индексы директорий")
+    parser.add_argument("--workers", type=int, default=8, help="Параллельных stat/scandir (drvfs — задержка на вызов)")
+    parser.add_argument("--resolve", choices=POLICIES, help="Разрешить найденные конфликты по политике")
+    parser.add_argument("--keep-node", help="Для --resolve keep-node: чья версия остаётся")
+    parser.add_argument("--delete", action="store_true", help=f"Удалять проигравшие версии (по умолчанию — в {BACKUP_DIR}/)")
+    parser.add_argument("--dry-run", action="store_true", help="Показать, что будет сделано, ничего не меняя")
+    args = parser.parse_args()
+
+    cfg = load_config(Path(args.config))
+    try:
+        cfg = expand_shards(cfg)
+    except ValueError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 2
+    # --folder <родитель> включает и его шарды.
+    shard_of = {str(i.get("id")): i["shard_of"] for i in cfg.get("folders") or [] if isinstance(i, dict) and i.get("shard_of")}
+
+    nodes_by_short = node_short_ids(cfg)
+    if args.resolve == "keep-node":
+        if not args.keep_node:
+            print("ERROR: --resolve keep-node требует --keep-node <node>", file=sys.stderr)
+            return 2
+        if args.keep_node not in nodes_by_short.values():
+            print(f"ERROR: у ноды {args.keep_node!r} не задан device_id — копии не сопоставить", file=sys.stderr)
+            return 2
+
+    state_dir = Path(args.state_dir).expanduser()
+    total = 0
+    for folder_id, _label, raw_path in iter_folder_paths(cfg, args.node):
+        if raw_path == "REQUIRED_LOCAL" or (args.folder and folder_id not in args.folder and shard_of.get(folder_id) not in args.folder):
+            continue
+        root = Path(os.path.expanduser(raw_path)).resolve()
+        if not root.is_dir():
+            continue
+        t0 = time.perf_counter()
+        index = ConflictIndex(folder_id, root, state_dir, workers=args.workers)
+        try:
+            conflicts = group_conflicts(index.refresh(), nodes_by_short)
+        finally:
+            index.close()
+        if args.match:
+            conflicts = [c for c in conflicts if any(fnmatch(c.original, pattern) for pattern in args.match)]
+        copies = sum(len(c.copies) for c in conflicts)
+        total += len(conflicts)
+        print(
+            f"[conflicts] {folder_id}: {len(conflicts)} files, {copies} copies "
+            f"(dirs {index.dirs_seen}, re-listed {index.dirs_listed}, {time.perf_counter() - t0:.2f}s)"
+        )
+        for conflict in conflicts:
+            print(f"  {conflict.original}  [{human_size(root / conflict.original)}]")
+            for c in conflict.copies:
+                who = c.node or c.device
+                print(f"    {c.stamp}  {who:<8}  [{human_size(root / c.rel)}]  {c.rel}")
+            if args.resolve:
+                try:
+                    outcome = resolve(
+                        root, conflict, args.resolve, keep_node=args.keep_node, delete=args.delete, dry_run=args.dry_run
+                    )
+                except OSError as e:
+                    print(f"[conflicts] WARN: {folder_id}: {conflict.original}: {e}", file=sys.stderr)
+                    continue
+                print(f"    -> {'dry-run: ' if args.dry_run else ''}{outcome}")
+    return 1 if total and not args.resolve else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
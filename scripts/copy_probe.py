@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+import errno
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+
+from fs_probe import Mount, mount_for, read_mounts
+
+# Замер способов копирования блоков на ФС корня папки -> `copyRangeMethod` и соседние I/O-опции <folder>.
+# Syncthing переиспользует уже имеющиеся блоки (переименования, правки больших файлов) копированием внутри ФС:
+# - ioctl — reflink (FICLONE/FICLONERANGE): btrfs, XFS с reflink=1 — данные не копируются вовсе;
+# - copy_file_range — копирование в ядре (на XFS/btrfs/NFS 4.2 тоже reflink/серверное), без буфера в userspace;
+# - sendfile — копирование в ядре через page cache;
+# - standard — read/write через userspace (значение Syncthing по умолчанию).
+# Каждый способ пробуется во временной директории на той же ФС (`.syncthing.probe-*.tmp` — Syncthing её не видит),
+# результат проверяется побайтно и меряется с fsync (Syncthing делает fsync, disableFsync остаётся false).
+# Результат кешируется по устройству/монтированию и версии ядра (`.fs-caps.json` рядом с config.xml).
+
+FICLONE = 0x40049409
+METHODS = ("ioctl", "copy_file_range", "sendfile", "standard")
+# Быстрее предпочтительного способа меньше чем на столько — берём предпочтительный (порядок METHODS).
+TIE_RATIO = 1.2
+CHUNK = 128 * 1024
+CACHE_NAME = ".fs-caps.json"
+CACHE_VERSION = 1
+# Weak hash (поиск сдвинутых блоков) перечитывает старую версию файла целиком; на медленной ФС это дороже,
+# чем докачать изменённые блоки — выключаем (порог > 100%), иначе оставляем значение Syncthing по умолчанию.
+WEAK_HASH_DEFAULT_PCT = 25
+WEAK_HASH_OFF_PCT = 101
+WEAK_HASH_SLOW_MIB_S = 100.0
+
+
+@dataclass
+class CopyCaps:
+    key: str
+    fstype: str
+    kind: str
+    mib_s: dict[str, float] = field(default_factory=dict)
+    errors: dict[str, str] = field(default_factory=dict)
+    cached: bool = False
+
+    @property
+    def best(self) -> str:
+        if not self.mib_s:
+            return "standard"
+        fastest = max(self.mib_s.values())
+        return next(m for m in METHODS if m in self.mib_s and self.mib_s[m] * TIE_RATIO >= fastest)
+
+    @property
+    def weak_hash_pct(self) -> int:
+        slow = self.kind in ("drvfs", "network") or self.mib_s.get("standard", WEAK_HASH_SLOW_MIB_S) < WEAK_HASH_SLOW_MIB_S
+        return WEAK_HASH_OFF_PCT if slow else WEAK_HASH_DEFAULT_PCT
+
+    def layer(self) -> dict:
+        # Нижний слой performance (как WatchPlan.layer): явные ключи YAML его переопределяют.
+        return {
+            "copy_range_method": self.best,
+            "disable_fsync": False,
+            "weak_hash_threshold_pct": self.weak_hash_pct,
+        }
+
+    def to_json(self) -> dict:
+        return {
+            "fstype": self.fstype,
+            "kind": self.kind,
+            "mib_s": {m: round(v, 1) for m, v in self.mib_s.items()},
+            "errors": self.errors,
+            "probed_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }
+
+    @classmethod
+    def from_json(cls, key: str, data: dict) -> CopyCaps:
+        return cls(
+            key,
+            str(data.get("fstype") or "?"),
+            str(data.get("kind") or "unknown"),
+            {str(m): float(v) for m, v in (data.get("mib_s") or {}).items() if m in METHODS},
+            {str(m): str(v) for m, v in (data.get("errors") or {}).items()},
+            cached=True,
+        )
+
+
+def existing_base(path: Path) -> Path:
+    # Корень папки может ещё не существовать (configure создаёт его позже) — мерим ближайшего существующего предка.
+    for candidate in (path, *path.parents):
+        if candidate.is_dir():
+            return candidate
+    return Path("/")
+
+
+def cache_key(base: Path, mount: Mount | None) -> str:
+    st = os.stat(base)
+    where = f"{mount.source}|{mount.mountpoint}|{mount.fstype}" if mount else "?"
+    return f"{where}|dev={st.st_dev}|kernel={os.uname().release}"
+
+
+def _copy(method: str, src: int, dst: int, size: int) -> None:
+    if method == "ioctl":
+        import fcntl
+
+        fcntl.ioctl(dst, FICLONE, src)
+        return
+    offset = 0
+    while offset < size:
+        if method == "copy_file_range":
+            n = os.copy_file_range(src, dst, size - offset, offset, offset)
+        elif method == "sendfile":
+            n = os.sendfile(dst, src, offset, size - offset)
+        else:
+            chunk = os.pread(src, min(CHUNK, size - offset), offset)
+            n = os.pwrite(dst, chunk, offset) if chunk else 0
+        if n <= 0:
+            raise OSError(errno.EIO, f"{method}: скопировано {offset} из {size} байт")
+        offset += n
+
+
+def _digest(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def measure(base: Path, size: int, rounds: int = 2) -> tuple[dict[str, float], dict[str, str]]:
+    # -> (MiB/s рабочих способов, ошибки остальных).
+    mib_s: dict[str, float] = {}
+    errors: dict[str, str] = {}
+    tmp = Path(tempfile.mkdtemp(prefix=".syncthing.probe-", suffix=".tmp", dir=base))
+    try:
+        src_path = tmp / "src"
+        with src_path.open("wb") as f:
+            f.write(os.urandom(size))
+            f.flush()
+            os.fsync(f.fileno())
+        expected = _digest(src_path)
+        src = os.open(src_path, os.O_RDONLY)
+        try:
+            for method in METHODS:
+                best = 0.0
+                try:
+                    for i in range(rounds):
+                        dst_path = tmp / f"{method}-{i}"
+                        dst = os.open(dst_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                        try:
+                            t0 = time.perf_counter()
+                            _copy(method, src, dst, size)
+                            os.fsync(dst)
+                            elapsed = time.perf_counter() - t0
+                        finally:
+                            os.close(dst)
+                        if _digest(dst_path) != expected:
+                            raise OSError(errno.EIO, "копия не совпала с оригиналом")
+                        dst_path.unlink()
+                        best = max(best, size / 2**20 / max(elapsed, 1e-6))
+                except (OSError, AttributeError) as e:
+                    errors[method] = errno.errorcode.get(e.errno, str(e)) if isinstance(e, OSError) and e.errno else str(e)
+                    continue
+                mib_s[method] = best
+        finally:
+            os.close(src)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return mib_s, errors
+
+
+def load_cache(path: Path) -> dict:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get("version") != CACHE_VERSION:
+        return {}
+    entries = data.get("entries")
+    return entries if isinstance(entries, dict) else {}
+
+
+def save_cache(path: Path, entries: dict) -> None:
+    tmp = path.with_name(f".{path.name}.tmp-{os.getpid()}")
+    tmp.write_text(json.dumps({"version": CACHE_VERSION, "entries": entries}, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def probe_copy_caps(
+    roots: dict[str, Path], cache_path: Path, *, size_mib: float = 8.0, refresh: bool = False
+) -> tuple[dict[str, CopyCaps], list[str]]:
+    # -> (возможности по folder id, предупреждения). Папки на одной ФС (шарды, соседние корни) мерятся один раз.
+    mounts = read_mounts()
+    entries = {} if refresh else load_cache(cache_path)
+    size = max(1, int(size_mib * 2**20))
+    caps: dict[str, CopyCaps] = {}
+    by_key: dict[str, CopyCaps | None] = {}
+    warnings: list[str] = []
+    dirty = False
+    for folder_id, root in roots.items():
+        base = existing_base(root)
+        mount = mount_for(base, mounts)
+        try:
+            key = cache_key(base, mount)
+        except OSError as e:
+            warnings.append(f"{folder_id}: {base}: {e}")
+            continue
+        if key not in by_key:
+            if isinstance(entries.get(key), dict):
+                by_key[key] = CopyCaps.from_json(key, entries[key])
+            else:
+                try:
+                    mib_s, errors = measure(base, size)
+                except OSError as e:
+                    # Нет прав на запись в корень и т.п. — copyRangeMethod не трогаем.
+                    warnings.append(f"{folder_id}: не удалось замерить копирование в {base}: {e}")
+                    by_key[key] = None
+                    continue
+                found = CopyCaps(key, mount.fstype if mount else "?", mount.kind if mount else "unknown", mib_s, errors)
+                by_key[key] = found
+                entries[key] = found.to_json()
+                dirty = True
+        if by_key[key] is not None:
+            caps[folder_id] = by_key[key]
+    if dirty:
+        try:
+            save_cache(cache_path, entries)
+        except OSError as e:
+            warnings.append(f"кеш {cache_path} не записан: {e}")
+    return caps, warnings
+
+
+def describe_caps(folder_id: str, caps: CopyCaps) -> str:
+    measured = ", ".join(f"{m} {caps.mib_s[m]:.0f} MiB/s" for m in METHODS if m in caps.mib_s)
+    failed = ", ".join(f"{m} {caps.errors[m]}" for m in METHODS if m in caps.errors)
+    detail = "; ".join(part for part in (measured, f"нет: {failed}" if failed else "") if part)
+    source = "кеш" if caps.cached else "замер"
+    return (
+        f"{folder_id}: {caps.fstype} -> copyRangeMethod={caps.best}, weakHashThresholdPct={caps.weak_hash_pct} "
+        f"({detail}; {source})"
+    )
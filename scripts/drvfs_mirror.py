@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from install_stignore import PROJECT_ROOT, iter_mirrors, load_config
+from shards import expand_shards
+from st_ignore import IgnoreMatcher, IgnoreParseError, is_internal
+
+# Односторонняя копия ext4 -> Windows (drvfs) для папок с `mirror.<node>` в sync-folders.local.yaml.
+# Syncthing синхронизирует ext4-корень (быстрый stat/хеш, работающий inotify), а этот копировщик пачками
+# переносит изменения в paths.<node> (/mnt/c/...):
+# - обход ext4 быстрый; по индексу (SQLite: путь -> size, mtime) копируются только изменённые файлы;
+# - копирование параллельно (задержка drvfs на файл, а не пропускная способность), через tmp + rename;
+# - удаляются только файлы, которые копировщик сам положил раньше (чужие файлы на Windows не трогаем);
+# - игнорируемое Syncthing (по .stignore корня) и служебные файлы не копируются.
+# Изменения, сделанные на Windows-стороне, назад НЕ переносятся — править нужно в ext4-пути.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+"""
+
+
+def default_state_dir() -> Path:
+    base = os.environ.get("XDG_STATE_HOME") or str(Path.home() / ".local/state")
+    return Path(base) / "syncthing-mirror"
+
+
+def scan_source(root: Path) -> dict[str, tuple[int, int]]:
+    # rel path -> (size, mtime_ns) для всех синхронизируемых файлов ext4-корня.
+    try:
+        matcher = IgnoreMatcher.from_file(root / ".stignore")
+    except (IgnoreParseError, OSError):
+        matcher = IgnoreMatcher([])
+    skip_dirs = matcher.skip_ignored_dirs()
+    files: dict[str, tuple[int, int]] = {}
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        try:
+            it = os.scandir(root / rel_dir if rel_dir else root)
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                if is_internal(rel) or rel == ".stignore_sync":
+                    continue
+                ignored = matcher.is_ignored(rel)
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not (ignored and skip_dirs):
+                            stack.append(rel)
+                    elif not ignored and entry.is_file(follow_symlinks=False):
+                        st = entry.stat(follow_symlinks=False)
+                        files[rel] = (st.st_size, st.st_mtime_ns)
+                except OSError:
+                    continue
+    return files
+
+
+def copy_one(source: Path, target: Path, rel: str) -> tuple[str, str | None]:
+    src = source / rel
+    dst = target / rel
+    tmp = dst.with_name(f".mirror-tmp-{os.getpid()}-{dst.name}")
+    try:
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(src, tmp)
+        os.replace(tmp, dst)
+    except OSError as e:
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+        return rel, str(e)
+    return rel, None
+
+
+def remove_one(target: Path, rel: str) -> tuple[str, str | None]:
+    try:
+        (target / rel).unlink()
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        return rel, str(e)
+    # Пустые директории, оставшиеся после удаления, тоже убираем (до корня).
+    parent = (target / rel).parent
+    while parent != target:
+        try:
+            parent.rmdir()
+        except OSError:
+            break
+        parent = parent.parent
+    return rel, None
+
+
+def sync_folder(
+    folder_id: str,
+    source: Path,
+    target: Path,
+    state_dir: Path,
+    *,
+    workers: int,
+    dry_run: bool,
+    exclude: frozenset[str] = frozenset(),
+) -> dict:
+    t0 = time.perf_counter()
+    state_dir.mkdir(parents=True, exist_ok=True)
+    db = sqlite3.connect(state_dir / f"{folder_id}.sqlite")
+    db.executescript(SCHEMA)
+    known = {path: (size, mtime) for path, size, mtime in db.execute("SELECT path, size, mtime_ns FROM files")}
+
+    current = scan_source(source)
+    if exclude:
+        # Поддиректории-шарды переносит mirror самих шардов: здесь их не копируем и не удаляем.
+        current = {rel: meta for rel, meta in current.items() if rel.split("/", 1)[0] not in exclude}
+        known = {rel: meta for rel, meta in known.items() if rel.split("/", 1)[0] not in exclude}
+    changed = [rel for rel, meta in current.items() if known.get(rel) != meta]
+    removed = [rel for rel in known if rel not in current]
+    errors: list[str] = []
+
+    if not dry_run and (changed or removed):
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            copied = list(pool.map(lambda rel: copy_one(source, target, rel), changed))
+            deleted = list(pool.map(lambda rel: remove_one(target, rel), removed))
+        errors = [f"{rel}: {error}" for rel, error in copied + deleted if error]
+        # Индекс обновляем только по успешным операциям: неудачные повторятся на следующем проходе.
+        db.executemany(
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns) VALUES (?, ?, ?)",
+            [(rel, *current[rel]) for rel, error in copied if not error],
+        )
+        db.executemany("DELETE FROM files WHERE path = ?", [(rel,) for rel, error in deleted if not error])
+        db.commit()
+    db.close()
+    return {
+        "files": len(current),
+        "copied": len(changed),
+        "removed": len(removed),
+        "errors": errors,
+        "seconds": round(time.perf_counter() - t0, 3),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Односторонняя копия ext4-корней Syncthing на Windows-сторону (mirror).")
+    parser.add_argument("--config", default=str(PROJECT_ROOT / "sync-folders.yaml"), help="Путь до sync-folders.yaml")
+    parser.add_argument("--node", required=True, help="Имя ноды (wsl_a/wsl_b)")
+    parser.add_argument("--folder", action="append", default=[], help="Только эти folder id (можно несколько)")
+    parser.add_argument("--state-dir", default=str(default_state_dir()), help="Где хранить индексы копий")
+    parser.add_argument("--workers", type=int, default=8, help="Параллельных копирований (drvfs — задержка на файл)")
+    parser.add_argument("--interval", type=float, default=0.0, help="Повторять каждые N секунд (0 — один проход)")
+    parser.add_argument("--dry-run", action="store_true", help="Только посчитать изменения")
+    args = parser.parse_args()
+
+    cfg = load_config(Path(args.config))
+    try:
+        cfg = expand_shards(cfg)
+    except ValueError as e:
+        print(f"[mirror] ERROR: {e}", file=sys.stderr)
+        return 2
+    items = [i for i in cfg.get("folders") or [] if isinstance(i, dict)]
+    excludes = {str(i.get("id")): frozenset(i["shard_dirs"]) for i in items if "shard_dirs" in i}
+    shard_of = {str(i.get("id")): i["shard_of"] for i in items if i.get("shard_of")}
+
+    mirrors = [
+        m for m in iter_mirrors(cfg, args.node) if not args.folder or m[0] in args.folder or shard_of.get(m[0]) in args.folder
+    ]
+    if not mirrors:
+        print(f"[mirror] для {args.node} нет папок с mirror.{args.node}", file=sys.stderr)
+        return 0
+
+    state_dir = Path(args.state_dir).expanduser()
+    while True:
+        failed = False
+        for folder_id, source, target in mirrors:
+            src = Path(os.path.expanduser(source)).resolve()
+            dst = Path(os.path.expanduser(target)).resolve()
+            if not src.is_dir():
+                print(f"[mirror] WARN: {folder_id}: нет {src}", file=sys.stderr)
+                continue
+            stats = sync_folder(
+                folder_id,
+                src,
+                dst,
+                state_dir,
+                workers=max(1, args.workers),
+                dry_run=args.dry_run,
+                exclude=excludes.get(folder_id, frozenset()),
+            )
+            for error in stats["errors"][:20]:
+                print(f"[mirror] WARN: {folder_id}: {error}", file=sys.stderr)
+            failed = failed or bool(stats["errors"])
+            if stats["copied"] or stats["removed"] or args.dry_run:
+                prefix = "[mirror] dry-run" if args.dry_run else "[mirror]"
+                print(
+                    f"{prefix} {folder_id}: {src} -> {dst}: files={stats['files']} copied={stats['copied']} "
+                    f"removed={stats['removed']} errors={len(stats['errors'])} in {stats['seconds']}s"
+                )
+        if args.interval <= 0:
+            return 1 if failed else 0
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
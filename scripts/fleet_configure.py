@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from config_patch import ConfigPatcher, node_role
+from configure_syncthing import PROJECT_ROOT, patch_config
+from install_stignore import load_config
+from shards import expand_shards
+
+# Генерация config.xml сразу для всего парка нод из одного sync-folders.yaml (+ local.yaml).
+# Home каждой ноды — `nodes.<node>.home` (обычно в sync-folders.local.yaml) или --home NODE=PATH;
+# ноды без home пропускаются (например, Amvera: её настраивает docker/configure_syncthing.py при старте).
+# Ноды обрабатываются параллельно в отдельных процессах (разбор/патч XML упирается в CPU и GIL);
+# config.xml перезаписывается атомарно и только если содержимое изменилось.
+# Директории папок не создаются, watcher и copyRangeMethod не подбираются по замеру: пути ноды могут быть на другой машине —
+# это делает scripts/configure_syncthing.py на самой ноде.
+
+
+def configure_node(cfg: dict, node: str, home: str, dry_run: bool) -> dict:
+    t0 = time.perf_counter()
+    result = {"node": node, "home": home, "role": "", "devices": 0, "folders": 0, "changed": False, "warnings": [], "error": ""}
+    config_xml = Path(home) / "config.xml"
+    try:
+        result["role"] = node_role(node, (cfg.get("nodes") or {}).get(node))
+        before = config_xml.read_bytes()
+        root = ET.fromstring(before)
+        result["warnings"] = patch_config(root, expand_shards(cfg), node, create_dirs=False)
+        ET.indent(root, space="    ")
+        after = ET.tostring(root, encoding="utf-8", xml_declaration=True)
+        local_id = ConfigPatcher(root).local_id
+        result["devices"] = sum(1 for d in root.findall("device") if d.get("id") != local_id)
+        result["folders"] = len(root.findall("folder"))
+        result["changed"] = after != before
+        if result["changed"] and not dry_run:
+            tmp = config_xml.with_name(f".{config_xml.name}.fleet-{os.getpid()}")
+            tmp.write_bytes(after)
+            os.replace(tmp, config_xml)
+    except (OSError, ValueError, ET.ParseError) as e:
+        result["error"] = str(e)
+    result["ms"] = (time.perf_counter() - t0) * 1000
+    return result
+
+
+def fleet_homes(cfg: dict, overrides: list[str]) -> dict[str, str]:
+    homes = {
+        name: os.path.expanduser(str(node["home"]))
+        for name, node in (cfg.get("nodes") or {}).items()
+        if isinstance(node, dict) and node.get("home")
+    }
+    for raw in overrides:
+        name, sep, path = raw.partition("=")
+        if not sep or not name or not path:
+            raise ValueError(f"--home {raw!r}: ожидается NODE=PATH")
+        homes[name] = os.path.expanduser(path)
+    return homes
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Render Syncthing config.xml for every node of the fleet in parallel.")
+    parser.add_argument("--config", default=str(PROJECT_ROOT / "sync-folders.yaml"), help="Путь до sync-folders.yaml")
+    parser.add_argument("--home", action="append", default=[], metavar="NODE=PATH", help="Syncthing home ноды (поверх nodes.<node>.home)")
+    parser.add_argument("--node", action="append", default=[], help="Только эти ноды (можно несколько раз)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 4, help="Параллельных процессов")
+    parser.add_argument("--dry-run", action="store_true", help="Ничего не писать, только показать, что изменится")
+    args = parser.parse_args()
+
+    cfg = load_config(Path(args.config))
+
+    try:
+        homes = fleet_homes(cfg, args.home)
+    except ValueError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 2
+    nodes = cfg.get("nodes") or {}
+    unknown = sorted(name for name in [*homes, *args.node] if name not in nodes)
+    if unknown:
+        print(f"ERROR: нет в nodes.*: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+    if args.node:
+        homes = {name: home for name, home in homes.items() if name in args.node}
+    if not homes:
+        print("ERROR: нет нод с home (nodes.<node>.home или --home NODE=PATH)", file=sys.stderr)
+        return 2
+
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, min(args.jobs, len(homes)))) as pool:
+        futures = [pool.submit(configure_node, cfg, name, home, args.dry_run) for name, home in sorted(homes.items())]
+        results = [f.result() for f in futures]
+
+    prefix = "[fleet] dry-run" if args.dry_run else "[fleet]"
+    width = max(len(r["node"]) for r in results)
+    for r in results:
+        if r["error"]:
+            print(f"{prefix} {r['node']:<{width}}  ERROR: {r['error']}", file=sys.stderr)
+            continue
+        state = "changed" if r["changed"] else "unchanged"
+        print(
+            f"{prefix} {r['node']:<{width}}  {r['role']:<12} devices={r['devices']:<3} folders={r['folders']:<3} "
+            f"{state:<9} {r['ms']:.1f}ms"
+        )
+        for warning in r["warnings"]:
+            print(f"{prefix} {r['node']:<{width}}  WARN: {warning}", file=sys.stderr)
+    failed = sum(1 for r in results if r["error"])
+    changed = sum(1 for r in results if r["changed"])
+    print(
+        f"{prefix} nodes={len(results)} changed={changed} failed={failed} "
+        f"in {(time.perf_counter() - t0) * 1000:.0f}ms (jobs={args.jobs})"
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,314 @@
+from __future__ import annotations
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+from st_ignore import IgnoreMatcher, IgnoreParseError, is_internal
+
+# Тип файловой системы корня папки (по /proc/mounts) и ориентировочная стоимость скана Syncthing.
+# На WSL2 /mnt/c — это 9p (drvfs): stat и чтение на порядок медленнее ext4, а inotify не видит
+# изменений со стороны Windows — Syncthing узнаёт о них только полным рескан'ом.
+
+NATIVE_FS = {"ext4", "ext3", "ext2", "xfs", "btrfs", "zfs", "f2fs", "bcachefs", "tmpfs", "overlay"}
+DRVFS_FS = {"9p", "drvfs", "virtiofs", "fuse.drvfs"}
+NETWORK_FS = {"nfs", "nfs4", "cifs", "smb3", "smbfs", "fuse.sshfs", "sshfs", "fuse.rclone"}
+
+# Ориентировочные скорости (для оценки, если замер не успел обойти дерево целиком).
+FS_PROFILES: dict[str, dict] = {
+    "native": {"stat_per_s": 50000, "hash_mib_s": 400, "inotify": True},
+    "drvfs": {"stat_per_s": 2500, "hash_mib_s": 40, "inotify": False},
+    "network": {"stat_per_s": 1000, "hash_mib_s": 30, "inotify": False},
+    "unknown": {"stat_per_s": 10000, "hash_mib_s": 100, "inotify": True},
+}
+
+
+@dataclass(frozen=True)
+class Mount:
+    source: str
+    mountpoint: str
+    fstype: str
+    options: str
+
+    @property
+    def kind(self) -> str:
+        if self.fstype in NATIVE_FS:
+            return "native"
+        if self.fstype in DRVFS_FS:
+            return "drvfs"
+        if self.fstype in NETWORK_FS or self.fstype.startswith("fuse.s"):
+            return "network"
+        return "unknown"
+
+
+def _unescape(field: str) -> str:
+    # В /proc/mounts пробелы и т.п. экранированы как \040.
+    out = []
+    i = 0
+    while i < len(field):
+        if field[i] == "\\" and i + 3 < len(field) and field[i + 1 : i + 4].isdigit():
+            out.append(chr(int(field[i + 1 : i + 4], 8)))
+            i += 4
+        else:
+            out.append(field[i])
+            i += 1
+    return "".join(out)
+
+
+def read_mounts(path: Path = Path("/proc/mounts")) -> list[Mount]:
+    mounts: list[Mount] = []
+    try:
+        lines = path.read_text(encoding="utf-8", errors="replace").splitlines()
+    except OSError:
+        return mounts
+    for line in lines:
+        parts = line.split()
+        if len(parts) >= 4:
+            mounts.append(Mount(_unescape(parts[0]), _unescape(parts[1]), parts[2], parts[3]))
+    return mounts
+
+
+def mount_for(path: Path, mounts: list[Mount]) -> Mount | None:
+    # Самая длинная точка монтирования, которая является префиксом пути (последняя при равенстве).
+    target = str(path)
+    best: Mount | None = None
+    for m in mounts:
+        mp = m.mountpoint.rstrip("/") or "/"
+        if target == mp or target.startswith(mp if mp == "/" else mp + "/"):
+            if best is None or len(mp) >= len(best.mountpoint.rstrip("/") or "/"):
+                best = m
+    return best
+
+
+@dataclass
+class FolderProbe:
+    path: Path
+    mount: Mount | None
+    files: int = 0
+    dirs: int = 0
+    bytes: int = 0
+    complete: bool = False
+    elapsed_s: float = 0.0
+
+    @property
+    def kind(self) -> str:
+        return self.mount.kind if self.mount else "unknown"
+
+    @property
+    def profile(self) -> dict:
+        return FS_PROFILES[self.kind]
+
+    @property
+    def stat_rate(self) -> float:
+        # Измеренная скорость обхода (записей/с); если мерить нечего — табличная.
+        entries = self.files + self.dirs
+        if entries >= 200 and self.elapsed_s > 0:
+            return entries / self.elapsed_s
+        return float(self.profile["stat_per_s"])
+
+    @property
+    def rescan_s(self) -> float | None:
+        return (self.files + self.dirs) / self.stat_rate if self.complete else None
+
+    @property
+    def hash_s(self) -> float | None:
+        return self.bytes / (self.profile["hash_mib_s"] * 1024 * 1024) if self.complete else None
+
+
+def _scan_dir(root: Path, rel_dir: str, matcher: IgnoreMatcher, skip_dirs: bool) -> tuple[list[str], int, int, int]:
+    # -> (поддиректории для обхода, не игнорируемых директорий, файлов, байт) одной директории.
+    subdirs: list[str] = []
+    dirs = files = size = 0
+    try:
+        it = os.scandir(root / rel_dir if rel_dir else root)
+    except OSError:
+        return subdirs, dirs, files, size
+    with it:
+        for entry in it:
+            rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            if is_internal(rel):
+                continue
+            ignored = matcher.is_ignored(rel)
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if ignored and skip_dirs:
+                        continue
+                    subdirs.append(rel)
+                    if not ignored:
+                        dirs += 1
+                elif not ignored and entry.is_file(follow_symlinks=False):
+                    files += 1
+                    size += entry.stat(follow_symlinks=False).st_size
+            except OSError:
+                continue
+    return subdirs, dirs, files, size
+
+
+def probe_folder(path: Path, mounts: list[Mount], *, budget_s: float = 2.0, workers: int = 8) -> FolderProbe:
+    # Обход как у сканера Syncthing (с учётом .stignore корня), но не дольше budget_s.
+    # Директории читаются пачками в пуле потоков: на drvfs/сетевых ФС время уходит на ожидание, а не на CPU.
+    probe = FolderProbe(path=path, mount=mount_for(path, mounts))
+    if budget_s <= 0 or not path.is_dir():
+        return probe
+    try:
+        matcher = IgnoreMatcher.from_file(path / ".stignore")
+    except (IgnoreParseError, OSError):
+        matcher = IgnoreMatcher([])
+    skip_dirs = matcher.skip_ignored_dirs()
+    t0 = time.perf_counter()
+    deadline = t0 + budget_s
+    batch_size = max(1, workers) * 4
+    pending = [""]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        while pending:
+            if time.perf_counter() > deadline:
+                probe.elapsed_s = time.perf_counter() - t0
+                return probe
+            batch = pending[-batch_size:]
+            del pending[-batch_size:]
+            for subdirs, dirs, files, size in pool.map(lambda rel: _scan_dir(path, rel, matcher, skip_dirs), batch):
+                pending.extend(subdirs)
+                probe.dirs += dirs
+                probe.files += files
+                probe.bytes += size
+    probe.complete = True
+    probe.elapsed_s = time.perf_counter() - t0
+    return probe
+
+
+# inotify: Syncthing ставит по watch на каждую не игнорируемую директорию папки (плюс корень).
+# Лимит — на пользователя, его делят все процессы (IDE, node watchers, ...), поэтому Syncthing отдаём только часть.
+INOTIFY_MAX_WATCHES = Path("/proc/sys/fs/inotify/max_user_watches")
+WATCH_HEADROOM = 0.8
+# С рабочим watcher рескан — только страховка от пропущенных событий; без него — единственный способ узнать
+# об изменениях, но не чаще, чем ~5% времени уходит на скан.
+RESCAN_WATCHED_S = 21600
+RESCAN_UNWATCHED_MIN_S = 300
+RESCAN_UNWATCHED_MAX_S = 3600
+RESCAN_DUTY = 20
+
+
+def read_inotify_limit(path: Path = INOTIFY_MAX_WATCHES) -> int | None:
+    try:
+        return int(path.read_text(encoding="utf-8").strip())
+    except (OSError, ValueError):
+        return None
+
+
+@dataclass(frozen=True)
+class WatchPlan:
+    enabled: bool
+    delay_s: int
+    rescan_s: int
+    reason: str
+
+    def layer(self) -> dict:
+        # Нижний слой performance: пресеты и явные ключи из YAML его переопределяют (см. apply_watch_plan).
+        return {
+            "fs_watcher_enabled": self.enabled,
+            "fs_watcher_delay_s": self.delay_s,
+            "rescan_interval_s": self.rescan_s,
+        }
+
+
+def watch_delay(dirs: int) -> int:
+    # Большие деревья — дольше копим события, чтобы сканировать пачкой (10s — значение Syncthing по умолчанию).
+    if dirs < 10000:
+        return 10
+    if dirs < 100000:
+        return 30
+    return 60
+
+
+def unwatched_rescan(probe: FolderProbe) -> int:
+    if probe.rescan_s is None:
+        return RESCAN_UNWATCHED_MAX_S if probe.files or probe.dirs else RESCAN_UNWATCHED_MIN_S
+    return int(min(RESCAN_UNWATCHED_MAX_S, max(RESCAN_UNWATCHED_MIN_S, probe.rescan_s * RESCAN_DUTY)))
+
+
+def plan_watchers(probes: dict[str, FolderProbe], max_watches: int | None) -> tuple[dict[str, WatchPlan], list[str]]:
+    # -> (план по folder id, предупреждения). Папки на ФС без inotify — всегда частый рескан; остальные
+    # получают watcher от меньших к большим, пока хватает лимита watches.
+    plans: dict[str, WatchPlan] = {}
+    warnings: list[str] = []
+    budget = int(max_watches * WATCH_HEADROOM) if max_watches else None
+    used = 0
+    over: list[tuple[str, int]] = []
+    lower_bound: list[str] = []
+    for folder_id, probe in sorted(probes.items(), key=lambda kv: kv[1].dirs):
+        delay = watch_delay(probe.dirs)
+        if not probe.profile["inotify"]:
+            plans[folder_id] = WatchPlan(False, delay, unwatched_rescan(probe), f"{probe.kind}: inotify не видит изменений")
+            continue
+        need = probe.dirs + 1
+        if budget is not None and used + need > budget:
+            over.append((folder_id, need))
+            plans[folder_id] = WatchPlan(False, delay, unwatched_rescan(probe), f"не хватает inotify watches ({need})")
+            continue
+        used += need
+        if not probe.complete and probe.dirs:
+            lower_bound.append(folder_id)
+        plans[folder_id] = WatchPlan(True, delay, RESCAN_WATCHED_S, f"{need} watches")
+    if over:
+        total = used + sum(need for _, need in over)
+        suggested = -(-int(total / WATCH_HEADROOM) // 65536) * 65536
+        warnings.append(
+            f"inotify: папкам нужно ~{total} watches, доступно {budget} из fs.inotify.max_user_watches={max_watches}; "
+            f"watcher выключен для {', '.join(fid for fid, _ in over)} (частый рескан). "
+            f"Подними лимит: sudo sysctl -w fs.inotify.max_user_watches={suggested} "
+            "(постоянно — в /etc/sysctl.d/; на WSL — в /etc/sysctl.conf или через [boot] command в /etc/wsl.conf)"
+        )
+    if lower_bound and budget is not None:
+        warnings.append(
+            f"inotify: {', '.join(lower_bound)} не обойдены целиком за отведённое время — число директорий занижено, "
+            f"занято ≥{used} из {budget} watches (увеличь --fs-budget для точного подсчёта)"
+        )
+    return plans, warnings
+
+
+def apply_watch_plan(performance: dict, plan: WatchPlan) -> dict:
+    # Если watcher не будет работать, пресет/явное fs_watcher_enabled: true его не включат,
+    # а рескан не реже, чем в плане: иначе изменения неделями могут оставаться незамеченными.
+    if plan.enabled:
+        return performance
+    result = dict(performance)
+    result["fs_watcher_enabled"] = False
+    result["rescan_interval_s"] = min(result.get("rescan_interval_s") or plan.rescan_s, plan.rescan_s)
+    return result
+
+
+def describe_plan(folder_id: str, probe: FolderProbe, plan: WatchPlan) -> str:
+    if plan.enabled:
+        mode = f"watcher on, delay {plan.delay_s}s, rescan {human_seconds(plan.rescan_s)}"
+    else:
+        mode = f"watcher off, rescan {human_seconds(plan.rescan_s)}"
+    return f"{folder_id}: {mode} ({plan.reason}; {probe.dirs}{'' if probe.complete else '+'} dirs)"
+
+
+def human_seconds(value: float) -> str:
+    if value < 90:
+        return f"{value:.0f}s"
+    if value < 5400:
+        return f"{value / 60:.0f}m"
+    return f"{value / 3600:.1f}h"
+
+
+def describe(folder_id: str, probe: FolderProbe) -> tuple[str, bool]:
+    # -> (строка отчёта, нужно ли предупредить).
+    fstype = probe.mount.fstype if probe.mount else "?"
+    head = f"{folder_id}: {probe.path} on {fstype} ({probe.kind})"
+    if probe.complete:
+        cost = (
+            f"{probe.files} files, {probe.dirs} dirs, {probe.bytes / 2**30:.2f} GiB; "
+            f"rescan ≈{human_seconds(probe.rescan_s or 0)}, full hash ≈{human_seconds(probe.hash_s or 0)}"
+        )
+    elif probe.files or probe.dirs:
+        cost = f">{probe.files} files за {probe.elapsed_s:.1f}s (~{probe.stat_rate:.0f} entries/s) — обход не успел закончиться"
+    else:
+        cost = "не измерялось"
+    warn = probe.kind in ("drvfs", "network")
+    if warn:
+        cost += "; inotify не видит изменений с Windows-стороны, stat/хеширование на порядок медленнее ext4 — см. `mirror:`"
+    return f"{head}: {cost}", warn
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import sys
+from pathlib import Path
+
+from st_ignore import (
+    IgnoreMatcher,
+    IgnoreParseError,
+    Pattern,
+    compile_pattern,
+    glob_to_regex,
+    is_internal,
+    parse_lines,
+)
+
+# Оптимизатор игноров: из шаблона .stignore_sync (+ локальная цепочка .stignore) строит эквивалентный
+# файл, который Syncthing проверяет быстрее:
+# - убирает дубликаты и шаблоны, которые никогда не сработают (их перекрывает более ранний);
+# - внутри блока подряд идущих шаблонов с одинаковым исходом (`!` и `(?d)`) порядок не влияет на результат,
+#   поэтому там частые по замеру на образцовом дереве шаблоны ставятся первыми;
+# - литеральные имена одного блока сворачиваются в один `{a,b,c}`;
+# - --verify доказывает, что старый и новый файл дают одинаковый исход на каждом пути дерева.
+
+GLOB_META = re.compile(r"[*?\[\]{}\\,]")
+
+
+def outcome(matcher: IgnoreMatcher, rel: str) -> tuple[bool, bool]:
+    # (игнорируется, можно удалять) — ровно то, что определяет поведение Syncthing для пути.
+    if is_internal(rel):
+        return True, False
+    p = matcher.match(rel)
+    if p is None or p.negate:
+        return False, False
+    return True, p.deletable
+
+
+def walk_paths(root: Path, matcher: IgnoreMatcher | None, *, limit: int = 0):
+    # matcher=None — полный обход (для --verify); иначе как сканер: в игнорируемые директории не заходим.
+    skip = matcher is not None and matcher.skip_ignored_dirs()
+    stack = [""]
+    count = 0
+    while stack:
+        rel_dir = stack.pop()
+        try:
+            it = os.scandir(root / rel_dir if rel_dir else root)
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                yield rel
+                count += 1
+                if limit and count >= limit:
+                    return
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+                if not is_dir:
+                    continue
+                if skip and matcher is not None and outcome(matcher, rel)[0]:
+                    continue
+                stack.append(rel)
+
+
+def is_literal_name(p: Pattern) -> bool:
+    return "/" not in p.glob and not GLOB_META.search(p.glob)
+
+
+def is_component_glob(p: Pattern) -> bool:
+    # Неякорный шаблон из одного компонента пути: совпадает с путём, если совпадает любой его компонент.
+    return "/" not in p.glob and "**" not in p.glob
+
+
+def component_regex(p: Pattern) -> re.Pattern:
+    return re.compile(glob_to_regex(p.glob), re.IGNORECASE if p.casefold else 0)
+
+
+def shadowed_by(earlier: Pattern, later: Pattern) -> bool:
+    # True, если каждый путь, совпадающий с later, совпадает и с earlier (later никогда не будет первым).
+    if earlier.glob == later.glob and (earlier.casefold or not later.casefold):
+        return True
+    if not is_component_glob(earlier) or (later.casefold and not earlier.casefold):
+        return False
+    body = later.glob.rstrip("/")
+    if body.startswith("/"):
+        body = body[1:]
+    rx = component_regex(earlier)
+    for component in body.split("/"):
+        if component and not GLOB_META.search(component) and rx.fullmatch(component):
+            return True
+    return False
+
+
+def count_hits(patterns: list[Pattern], paths: list[str]) -> list[int]:
+    hits = [0] * len(patterns)
+    for rel in paths:
+        for i, p in enumerate(patterns):
+            if p.regex.fullmatch(rel) is not None:
+                hits[i] += 1
+    return hits
+
+
+def avg_checks(patterns: list[Pattern], paths: list[str]) -> float:
+    # Среднее число проверок шаблонов до первого совпадения (или до конца списка).
+    if not paths:
+        return 0.0
+    total = 0
+    for rel in paths:
+        for i, p in enumerate(patterns):
+            if p.regex.fullmatch(rel) is not None:
+                total += i + 1
+                break
+        else:
+            total += len(patterns)
+    return total / len(paths)
+
+
+def optimize(patterns: list[Pattern], hits: list[int], *, collapse: bool) -> tuple[list[str], list[str]]:
+    actions: list[str] = []
+
+    # 1) Дубликаты и перекрытые шаблоны.
+    kept: list[tuple[Pattern, int]] = []
+    for p, h in zip(patterns, hits):
+        by = next((k for k, _ in kept if shadowed_by(k, p)), None)
+        if by is not None:
+            what = "duplicate" if by.line == p.line else "shadowed"
+            actions.append(f"drop {what}: {p.line} ({p.source}) <- {by.line} ({by.source})")
+            continue
+        kept.append((p, h))
+
+    # 2) Блоки подряд идущих шаблонов с одинаковым исходом.
+    blocks: list[list[tuple[Pattern, int]]] = []
+    for p, h in kept:
+        if blocks and (blocks[-1][0][0].negate, blocks[-1][0][0].deletable) == (p.negate, p.deletable):
+            blocks[-1].append((p, h))
+        else:
+            blocks.append([(p, h)])
+
+    lines: list[str] = []
+    for block in blocks:
+        items: list[tuple[str, int]] = []
+        literals: dict[bool, list[tuple[Pattern, int]]] = {}
+        for p, h in block:
+            if collapse and is_literal_name(p):
+                literals.setdefault(p.casefold, []).append((p, h))
+            else:
+                items.append((p.line, h))
+        for casefold, group in literals.items():
+            if len(group) == 1:
+                items.append((group[0][0].line, group[0][1]))
+                continue
+            first = group[0][0]
+            prefix = ("!" if first.negate else "") + ("(?i)" if casefold else "") + ("(?d)" if first.deletable else "")
+            names = [p.glob for p, _ in sorted(group, key=lambda g: -g[1])]
+            line = prefix + "{" + ",".join(names) + "}"
+            actions.append(f"collapse {len(group)} literal names -> {line}")
+            items.append((line, sum(h for _, h in group)))
+        before = [line for line, _ in items]
+        items.sort(key=lambda item: -item[1])
+        if [line for line, _ in items] != before and len(items) > 1:
+            actions.append(f"reorder block of {len(items)} by hits: {', '.join(f'{line}={h}' for line, h in items)}")
+        lines.extend(line for line, _ in items)
+    return lines, actions
+
+
+def build_matcher(input_text: str, input_path: Path, chain: Path | None) -> IgnoreMatcher:
+    if chain is None:
+        return IgnoreMatcher.from_text(input_text, source=input_path.name, base_dir=input_path.parent)
+
+    # Локальная цепочка: .stignore с `#include .stignore_sync`, куда подставляется проверяемый файл.
+    def loader(path: Path) -> str:
+        if path.name == ".stignore_sync":
+            return input_text
+        return path.read_text(encoding="utf-8")
+
+    return IgnoreMatcher.from_file(chain, loader=loader)
+
+
+def verify(old: IgnoreMatcher, new: IgnoreMatcher, trees: list[Path], *, show: int = 20) -> int:
+    mismatches = 0
+    checked = 0
+    for tree in trees:
+        for rel in walk_paths(tree, None):
+            checked += 1
+            a = outcome(old, rel)
+            b = outcome(new, rel)
+            if a != b:
+                mismatches += 1
+                if mismatches <= show:
+                    print(f"MISMATCH {tree}/{rel}: old={a} new={b}", file=sys.stderr)
+    print(f"verify: {checked} paths, {mismatches} mismatches")
+    return mismatches
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Оптимизирует .stignore_sync шаблон (эквивалентно, но быстрее для Syncthing).")
+    parser.add_argument("--input", required=True, help="Шаблон, например templates/stignore/.stignore_sync.dev")
+    parser.add_argument("--chain", help="Локальный .stignore, который включает шаблон (#include .stignore_sync)")
+    parser.add_argument("--sample", action="append", default=[], help="Образцовое дерево для замера частоты (можно несколько)")
+    parser.add_argument("--sample-limit", type=int, default=200000, help="Максимум путей из каждого образца")
+    parser.add_argument("--output", help="Куда записать оптимизированный файл (по умолчанию stdout)")
+    parser.add_argument("--no-collapse", action="store_true", help="Не сворачивать литеральные имена в {a,b}")
+    parser.add_argument("--compare", help="Режим проверки: готовый оптимизированный файл для сравнения с --input")
+    parser.add_argument("--verify", action="append", default=[], help="Дерево для проверки эквивалентности (можно несколько)")
+    args = parser.parse_args()
+
+    input_path = Path(args.input)
+    input_text = input_path.read_text(encoding="utf-8")
+    chain = Path(args.chain) if args.chain else None
+    try:
+        old = build_matcher(input_text, input_path, chain)
+    except IgnoreParseError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 2
+
+    if args.compare:
+        new = build_matcher(Path(args.compare).read_text(encoding="utf-8"), input_path, chain)
+        if not args.verify:
+            parser.error("--compare требует хотя бы одно --verify DIR")
+        return 1 if verify(old, new, [Path(t) for t in args.verify]) else 0
+
+    # Оптимизируем только сам шаблон (include'ы внутри него разворачиваются), цепочка — контекст замера.
+    patterns = parse_lines(input_text.splitlines(), source=input_path.name, base_dir=input_path.parent)
+    paths: list[str] = []
+    for tree in args.sample:
+        paths.extend(walk_paths(Path(tree), old, limit=args.sample_limit))
+    hits = count_hits(patterns, paths)
+
+    lines, actions = optimize(patterns, hits, collapse=not args.no_collapse)
+    header = [
+        f"// Сгенерировано scripts/ignore_optimize.py из {input_path.name}; правь исходный шаблон, не этот файл.",
+        "// ВАЖНО: в Syncthing “первое совпадение выигрывает”.",
+    ]
+    output_text = "\n".join(header + lines) + "\n"
+
+    new_patterns = [compile_pattern(line, f"optimized:{i}") for i, line in enumerate(lines, start=1)]
+    for action in actions:
+        print(f"[optimize] {action}", file=sys.stderr)
+    print(
+        f"[optimize] patterns: {len(patterns)} -> {len(new_patterns)}; "
+        f"avg checks/path on {len(paths)} sample paths: "
+        f"{avg_checks(patterns, paths):.2f} -> {avg_checks(new_patterns, paths):.2f}",
+        file=sys.stderr,
+    )
+
+    trees = [Path(t) for t in (args.verify or args.sample)]
+    if trees:
+        new = build_matcher(output_text, input_path, chain)
+        if verify(old, new, trees):
+            print("ERROR: оптимизированный файл не эквивалентен исходному, не записываю", file=sys.stderr)
+            return 1
+
+    if args.output:
+        Path(args.output).write_text(output_text, encoding="utf-8")
+    else:
+        sys.stdout.write(output_text)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from install_stignore import PROJECT_ROOT, TEMPLATES_DIR, iter_folder_paths, load_config
+from shards import expand_shards
+from st_ignore import INTERNAL_PATTERN, IgnoreMatcher, IgnoreParseError, is_internal
+
+# Симулятор игноров: сколько файлов/байт каждая папка отдаст сканеру/хешеру Syncthing при данном
+# профиле .stignore_sync, какой шаблон сколько отсекает, и какие тяжёлые поддеревья стоит добавить в шаблон.
+
+# Имена директорий, которые почти всегда генерируются/кешируются и обычно не нужны в синхронизации.
+KNOWN_HEAVY = {
+    ".git",
+    ".hg",
+    ".svn",
+    ".idea",
+    ".vs",
+    ".vscode-server",
+    ".terraform",
+    ".tox",
+    ".nox",
+    ".gradle",
+    ".m2",
+    ".cache",
+    ".next",
+    ".angular",
+    "coverage",
+    "htmlcov",
+    "logs",
+    "tmp",
+    "temp",
+    "out",
+    "packages",
+    "vendor",
+    "Pods",
+    "DerivedData",
+    "site-packages",
+    "wandb",
+    "mlruns",
+    "checkpoints",
+}
+
+
+class Stats:
+    def __init__(self) -> None:
+        self.included_files = 0
+        self.included_bytes = 0
+        self.excluded_files = 0
+        self.excluded_bytes = 0
+        self.per_pattern: dict[str, list[int]] = {}
+        # Включённые байты по директориям (до --depth) и по именам директорий на пути.
+        self.dir_bytes: dict[str, int] = {}
+        self.name_bytes: dict[str, int] = {}
+        self.name_dirs: dict[str, int] = {}
+
+    def merge(self, other: Stats) -> None:
+        self.included_files += other.included_files
+        self.included_bytes += other.included_bytes
+        self.excluded_files += other.excluded_files
+        self.excluded_bytes += other.excluded_bytes
+        for key, (files, size) in other.per_pattern.items():
+            acc = self.per_pattern.setdefault(key, [0, 0])
+            acc[0] += files
+            acc[1] += size
+        for src, dst in (
+            (other.dir_bytes, self.dir_bytes),
+            (other.name_bytes, self.name_bytes),
+            (other.name_dirs, self.name_dirs),
+        ):
+            for key, value in src.items():
+                dst[key] = dst.get(key, 0) + value
+
+    def exclude(self, pattern: str, files: int, size: int) -> None:
+        acc = self.per_pattern.setdefault(pattern, [0, 0])
+        acc[0] += files
+        acc[1] += size
+        self.excluded_files += files
+        self.excluded_bytes += size
+
+
+def subtree_size(path: str) -> tuple[int, int]:
+    files = 0
+    total = 0
+    stack = [path]
+    while stack:
+        cur = stack.pop()
+        try:
+            it = os.scandir(cur)
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    else:
+                        files += 1
+                        total += entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    continue
+    return files, total
+
+
+def walk(root: str, start_rel: str, matcher: IgnoreMatcher, *, depth: int, count_excluded: bool) -> Stats:
+    # Обходит запись верхнего уровня start_rel так, как её видел бы сканер Syncthing.
+    stats = Stats()
+    skip_dirs = matcher.skip_ignored_dirs()
+    start_abs = os.path.join(root, start_rel)
+    if os.path.islink(start_abs) or not os.path.isdir(start_abs):
+        handle_file(stats, root, start_rel, matcher, depth=depth)
+        return stats
+    if not enter_dir(stats, root, start_rel, matcher, skip_dirs=skip_dirs, count_excluded=count_excluded):
+        return stats
+    stack = [start_rel]
+    while stack:
+        rel_dir = stack.pop()
+        try:
+            it = os.scandir(os.path.join(root, rel_dir))
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                rel = f"{rel_dir}/{entry.name}"
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+                if not is_dir:
+                    handle_file(stats, root, rel, matcher, depth=depth)
+                elif enter_dir(stats, root, rel, matcher, skip_dirs=skip_dirs, count_excluded=count_excluded):
+                    stack.append(rel)
+    return stats
+
+
+def enter_dir(
+    stats: Stats,
+    root: str,
+    rel: str,
+    matcher: IgnoreMatcher,
+    *,
+    skip_dirs: bool,
+    count_excluded: bool,
+) -> bool:
+    if is_internal(rel):
+        if count_excluded:
+            stats.exclude(INTERNAL_PATTERN, *subtree_size(os.path.join(root, rel)))
+        return False
+    pattern = matcher.match(rel)
+    if pattern is not None and not pattern.negate and skip_dirs:
+        if count_excluded:
+            stats.exclude(pattern.line, *subtree_size(os.path.join(root, rel)))
+        return False
+    name = rel.rsplit("/", 1)[-1]
+    stats.name_dirs[name] = stats.name_dirs.get(name, 0) + 1
+    return True
+
+
+def handle_file(stats: Stats, root: str, rel: str, matcher: IgnoreMatcher, *, depth: int) -> None:
+    try:
+        size = os.lstat(os.path.join(root, rel)).st_size
+    except OSError:
+        return
+    if is_internal(rel):
+        stats.exclude(INTERNAL_PATTERN, 1, size)
+        return
+    pattern = matcher.match(rel)
+    if pattern is not None and not pattern.negate:
+        stats.exclude(pattern.line, 1, size)
+        return
+    stats.included_files += 1
+    stats.included_bytes += size
+    parts = rel.split("/")[:-1]
+    for i in range(min(depth, len(parts))):
+        key = "/".join(parts[: i + 1])
+        stats.dir_bytes[key] = stats.dir_bytes.get(key, 0) + size
+    for name in set(parts):
+        stats.name_bytes[name] = stats.name_bytes.get(name, 0) + size
+
+
+def build_matcher(profile: str, folder_root: Path) -> IgnoreMatcher:
+    if profile == "installed":
+        return IgnoreMatcher.from_file(folder_root / ".stignore")
+    sync_template = TEMPLATES_DIR / (".stignore_sync.dev" if profile == "dev" else ".stignore_sync.minimal")
+
+    # Цепочка как после install_stignore.py: шаблон .stignore + выбранный профиль вместо .stignore_sync.
+    def loader(path: Path) -> str:
+        if path == folder_root / ".stignore":
+            return (TEMPLATES_DIR / ".stignore").read_text(encoding="utf-8")
+        if path == folder_root / ".stignore_sync":
+            return sync_template.read_text(encoding="utf-8")
+        return path.read_text(encoding="utf-8")
+
+    return IgnoreMatcher.from_file(folder_root / ".stignore", loader=loader)
+
+
+def advise(stats: Stats, *, top: int, min_bytes: int) -> tuple[list[dict], list[dict]]:
+    candidates = {path: size for path, size in stats.dir_bytes.items() if size >= min_bytes}
+    # Цепочку a -> a/b -> a/b/c с почти теми же байтами показываем одной, самой глубокой записью.
+    specific = [
+        path
+        for path, size in candidates.items()
+        if not any(
+            other.startswith(path + "/") and other_size >= 0.9 * size for other, other_size in candidates.items()
+        )
+    ]
+    heavy = sorted(({"path": p, "bytes": candidates[p]} for p in specific), key=lambda item: item["bytes"], reverse=True)[
+        :top
+    ]
+    suggestions = []
+    for name, size in stats.name_bytes.items():
+        if size < min_bytes:
+            continue
+        dirs = stats.name_dirs.get(name, 0)
+        if name in KNOWN_HEAVY or dirs >= 3:
+            suggestions.append({"pattern": name, "bytes": size, "dirs": dirs, "known": name in KNOWN_HEAVY})
+    suggestions.sort(key=lambda item: item["bytes"], reverse=True)
+    return heavy, suggestions[:top]
+
+
+def human(n: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if abs(n) < 1024 or unit == "TiB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return str(n)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Симулирует .stignore для папок из sync-folders.yaml: что уйдёт в сканер, что отсекается, что стоит добавить.",
+    )
+    parser.add_argument("--config", default=str(PROJECT_ROOT / "sync-folders.yaml"), help="Путь до sync-folders.yaml")
+    parser.add_argument("--node", required=True, help="Имя ноды из sync-folders.yaml (ключ nodes.*)")
+    parser.add_argument(
+        "--profile",
+        action="append",
+        choices=["installed", "dev", "minimal"],
+        help="installed — текущий .stignore в папке; dev/minimal — шаблон (можно несколько раз для сравнения)",
+    )
+    parser.add_argument("--folder", action="append", help="Только эти folder id")
+    parser.add_argument("--workers", type=int, default=min(32, (os.cpu_count() or 2) * 4), help="Потоков обхода")
+    parser.add_argument("--depth", type=int, default=3, help="Глубина агрегации тяжёлых поддеревьев")
+    parser.add_argument("--top", type=int, default=10, help="Сколько тяжёлых поддеревьев/подсказок показать")
+    parser.add_argument("--min-mb", type=float, default=50.0, help="Порог для подсказок, MiB")
+    parser.add_argument("--no-count-excluded", action="store_true", help="Не обходить игнорируемые поддеревья (быстрее)")
+    parser.add_argument("--json", dest="json_out", default="", help="Записать отчёт в JSON")
+    args = parser.parse_args()
+    profiles = args.profile or ["installed"]
+
+    config = load_config(Path(args.config))
+    try:
+        config = expand_shards(config)
+    except ValueError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 2
+    # --folder <родитель> включает и его шарды.
+    shard_of = {str(i.get("id")): i["shard_of"] for i in config.get("folders") or [] if isinstance(i, dict) and i.get("shard_of")}
+
+    folders = []
+    for folder_id, label, raw_path in iter_folder_paths(config, args.node):
+        if raw_path == "REQUIRED_LOCAL" or (args.folder and folder_id not in args.folder and shard_of.get(folder_id) not in args.folder):
+            continue
+        root = Path(os.path.expanduser(raw_path)).resolve()
+        if not root.is_dir():
+            print(f"[skip] {root} не существует (folder={folder_id})", file=sys.stderr)
+            continue
+        folders.append((folder_id, label, root))
+
+    # Задачи: (папка, профиль, запись верхнего уровня) — большие корни обходятся параллельно по поддеревьям.
+    jobs = []
+    matchers: dict[tuple[str, str], IgnoreMatcher] = {}
+    for folder_id, _, root in folders:
+        for profile in profiles:
+            try:
+                matchers[(folder_id, profile)] = build_matcher(profile, root)
+            except IgnoreParseError as e:
+                print(f"ERROR: {folder_id} ({profile}): {e}", file=sys.stderr)
+                return 2
+            try:
+                tops = sorted(os.listdir(root))
+            except OSError:
+                tops = []
+            for name in tops:
+                jobs.append((folder_id, profile, str(root), name))
+
+    totals: dict[tuple[str, str], Stats] = {key: Stats() for key in matchers}
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = {
+            pool.submit(
+                walk,
+                root,
+                name,
+                matchers[(folder_id, profile)],
+                depth=args.depth,
+                count_excluded=not args.no_count_excluded,
+            ): (folder_id, profile)
+            for folder_id, profile, root, name in jobs
+        }
+        for future, key in futures.items():
+            totals[key].merge(future.result())
+
+    min_bytes = int(args.min_mb * 1024 * 1024)
+    report = []
+    for folder_id, label, root in folders:
+        for profile in profiles:
+            stats = totals[(folder_id, profile)]
+            heavy, suggestions = advise(stats, top=args.top, min_bytes=min_bytes)
+            report.append(
+                {
+                    "folder": folder_id,
+                    "label": label,
+                    "path": str(root),
+                    "profile": profile,
+                    "included": {"files": stats.included_files, "bytes": stats.included_bytes},
+                    "excluded": {"files": stats.excluded_files, "bytes": stats.excluded_bytes},
+                    "patterns": [
+                        {"pattern": p, "files": files, "bytes": size}
+                        for p, (files, size) in sorted(stats.per_pattern.items(), key=lambda kv: -kv[1][1])
+                    ],
+                    "heavy_subtrees": heavy,
+                    "suggested_patterns": suggestions,
+                }
+            )
+
+    for item in report:
+        inc = item["included"]
+        exc = item["excluded"]
+        print(f"== {item['folder']} ({item['path']}) profile={item['profile']}")
+        print(
+            f"   scanner: {inc['files']} files, {human(inc['bytes'])}; "
+            f"excluded: {exc['files']} files, {human(exc['bytes'])}"
+        )
+        for p in item["patterns"]:
+            print(f"   {p['pattern']:<32} {p['files']:>9} files {human(p['bytes']):>11}")
+        if item["heavy_subtrees"]:
+            print("   heavy non-ignored subtrees:")
+            for h in item["heavy_subtrees"]:
+                print(f"     {human(h['bytes']):>11}  {h['path']}")
+        if item["suggested_patterns"]:
+            print("   suggested additions to .stignore_sync:")
+            for s in item["suggested_patterns"]:
+                print(f"     {s['pattern']:<24} {human(s['bytes']):>11} in {s['dirs']} dir(s)")
+
+    if args.json_out:
+        Path(args.json_out).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -16,6 +16,10 @@ except Exception as exc:  # pragma: no cover
     raise
 
 
+from fs_probe import describe, probe_folder, read_mounts
+from shards import apply_shard_ignores, expand_shards
+from st_ignore import CANARY_DIR
+
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 TEMPLATES_DIR = PROJECT_ROOT / "templates" / "stignore"
 
@@ -28,6 +32,16 @@ def load_yaml(path: Path) -> dict:
     return data
 
 
+def load_config(path: Path) -> dict:
+    # sync-folders.yaml + sync-folders.local.yaml рядом с ним (если есть).
+    path = path.resolve()
+    config = load_yaml(path)
+    local_path = path.with_name("sync-folders.local.yaml")
+    if local_path.exists():
+        config = merge_local_config(config, load_yaml(local_path))
+    return config
+
+
 def merge_local_config(base: dict, local: dict) -> dict:
     merged = dict(base)
     merged_nodes = dict((base.get("nodes") or {}))
@@ -35,9 +49,28 @@ def merge_local_config(base: dict, local: dict) -> dict:
     if isinstance(local_nodes, dict):
         for node_name, node_cfg in local_nodes.items():
             if isinstance(node_cfg, dict):
-                merged_nodes[node_name] = {**(merged_nodes.get(node_name) or {}), **node_cfg}
+                node = {**(merged_nodes.get(node_name) or {}), **node_cfg}
+                for key in ("performance", "connection", "links"):
+                    base_value = (merged_nodes.get(node_name) or {}).get(key)
+                    if isinstance(base_value, dict) and isinstance(node_cfg.get(key), dict):
+                        node[key] = {**base_value, **node_cfg[key]}
+                # links.<peer> — тоже объекты: мержим по каждому peer.
+                base_links = (merged_nodes.get(node_name) or {}).get("links")
+                if isinstance(base_links, dict) and isinstance(node_cfg.get("links"), dict):
+                    for peer, link in node_cfg["links"].items():
+                        if isinstance(base_links.get(peer), dict) and isinstance(link, dict):
+                            node["links"][peer] = {**base_links[peer], **link}
+                merged_nodes[node_name] = node
     merged["nodes"] = merged_nodes
 
+    local_defaults = local.get("defaults") or {}
+    if isinstance(local_defaults, dict):
+        defaults = dict(merged.get("defaults") or {})
+        for key in ("performance", "connection"):
+            if isinstance(local_defaults.get(key), dict):
+                defaults[key] = {**(defaults.get(key) or {}), **local_defaults[key]}
+        merged["defaults"] = defaults
+
     local_folders = local.get("folders") or {}
     if isinstance(local_folders, dict):
         folders = merged.get("folders") or []
@@ -55,9 +88,14 @@ def merge_local_config(base: dict, local: dict) -> dict:
                 if not isinstance(paths, dict):
                     paths = {}
                     item["paths"] = paths
+                # Ключ-имя ноды (любой из nodes.*) со строкой — путь папки на этой ноде.
                 for k, v in overrides.items():
-                    if k in ("wsl_a", "wsl_b", "amvera") and isinstance(v, str) and v:
+                    if k in merged_nodes and isinstance(v, str) and v:
                         paths[k] = v
+                if isinstance(overrides.get("performance"), dict):
+                    item["performance"] = {**(item.get("performance") or {}), **overrides["performance"]}
+                if isinstance(overrides.get("mirror"), dict):
+                    item["mirror"] = {**(item.get("mirror") or {}), **overrides["mirror"]}
     return merged
 
 
@@ -73,12 +111,32 @@ def iter_folder_paths(config: dict, node: str):
         paths = item.get("paths", {})
         if not isinstance(paths, dict):
             continue
-        folder_path = paths.get(node)
+        # mirror.<node> — корень, который синхронизирует Syncthing (ext4), paths.<node> — копия на Windows.
+        folder_path = mirror_path(item, node) or paths.get(node)
         if not folder_path:
             continue
         yield str(folder_id), str(label), str(folder_path)
 
 
+def mirror_path(item: dict, node: str) -> str | None:
+    mirror = item.get("mirror")
+    if not isinstance(mirror, dict):
+        return None
+    value = mirror.get(node)
+    return str(value) if value else None
+
+
+def iter_mirrors(config: dict, node: str):
+    # -> (folder_id, корень Syncthing на ext4, целевой путь на Windows-стороне) для папок с mirror.<node>.
+    for item in config.get("folders") or []:
+        if not isinstance(item, dict):
+            continue
+        source = mirror_path(item, node)
+        target = (item.get("paths") or {}).get(node) if isinstance(item.get("paths"), dict) else None
+        if source and target and target != "REQUIRED_LOCAL":
+            yield str(item.get("id")), str(source), str(target)
+
+
 def ensure_dir(path: Path) -> None:
     path.mkdir(parents=True, exist_ok=True)
 
@@ -102,8 +160,7 @@ def main() -> int:
     parser.add_argument(
         "--node",
         required=True,
-        choices=["wsl_a", "wsl_b", "amvera"],
-        help="Имя ноды из sync-folders.yaml",
+        help="Имя ноды из sync-folders.yaml (ключ nodes.*)",
     )
     parser.add_argument(
         "--profile",
@@ -126,13 +183,22 @@ def main() -> int:
         action="store_true",
         help="Ничего не писать, только показать план действий",
     )
+    parser.add_argument(
+        "--fs-budget",
+        type=float,
+        default=2.0,
+        help="Секунд на замер стоимости скана каждой папки (0 — не проверять тип ФС)",
+    )
     args = parser.parse_args()
 
-    config_path = Path(args.config).resolve()
-    config = load_yaml(config_path)
-    local_path = config_path.with_name("sync-folders.local.yaml")
-    if local_path.exists():
-        config = merge_local_config(config, load_yaml(local_path))
+    config = load_config(Path(args.config))
+    try:
+        config = expand_shards(config)
+    except ValueError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 2
+    # folder id родителя -> имена шардов (их игнорирует .stignore родителя).
+    shard_dirs = {str(i.get("id")): i["shard_dirs"] for i in config["folders"] if isinstance(i, dict) and "shard_dirs" in i}
 
     stignore_template = (TEMPLATES_DIR / ".stignore").read_text(encoding="utf-8")
     stignore_sync_template = (
@@ -141,6 +207,7 @@ def main() -> int:
     ).read_text(encoding="utf-8")
 
     changes = 0
+    mounts = read_mounts() if args.fs_budget > 0 else []
     for folder_id, label, raw_path in iter_folder_paths(config, args.node):
         expanded = Path(os.path.expanduser(raw_path)).resolve()
         stignore_path = expanded / ".stignore"
@@ -164,12 +231,27 @@ def main() -> int:
             action = "overwrite" if args.force else "create-if-missing"
             print(f"[{action}] {stignore_path}")
             print(f"[{action}] {stignore_sync_path} (profile={args.profile})")
+            if folder_id in shard_dirs and apply_shard_ignores(stignore_path, shard_dirs[folder_id], dry_run=True):
+                print(f"[shards] {stignore_path}: {', '.join(shard_dirs[folder_id]) or '-'}")
+            if not (expanded / CANARY_DIR).is_dir():
+                print(f"[mkdir] {expanded / CANARY_DIR}")
             continue
 
         if write_text(stignore_path, stignore_template, force=args.force):
             changes += 1
         if write_text(stignore_sync_path, stignore_sync_template, force=args.force):
             changes += 1
+        if folder_id in shard_dirs and apply_shard_ignores(stignore_path, shard_dirs[folder_id]):
+            changes += 1
+        # Директория проб scripts/sync_canary.py (синхронизируется как обычные файлы).
+        if not (expanded / CANARY_DIR).is_dir():
+            ensure_dir(expanded / CANARY_DIR)
+            changes += 1
+
+        # Замер — уже с установленными игнорами (как будет сканировать Syncthing).
+        if mounts:
+            line, warn = describe(folder_id, probe_folder(expanded, mounts, budget_s=args.fs_budget))
+            print(f"{'WARN' if warn else 'INFO'}: [fs] {line}", file=sys.stderr if warn else sys.stdout)
 
     if args.dry_run:
         return 0
@@ -16,12 +16,14 @@ fi
 if [[ -d "$BASE" ]]; then
   echo "Stopping syncthing nodes"
   for n in n1 n2 n3; do
-    if [[ -f "$BASE/$n/pid" ]]; then
-      pid="$(cat "$BASE/$n/pid" || true)"
-      if [[ -n "${pid:-}" ]]; then
-        kill "$pid" >/dev/null 2>&1 || true
+    for pidfile in "$BASE/$n/pid" "$BASE/$n/canary.pid"; do
+      if [[ -f "$pidfile" ]]; then
+        pid="$(cat "$pidfile" || true)"
+        if [[ -n "${pid:-}" ]]; then
+          kill "$pid" >/dev/null 2>&1 || true
+        fi
       fi
-    fi
+    done
   done
 fi
 
@@ -7,6 +7,9 @@ SERVER_NAME="amvera_srv_test"
 SERVER_PORT="22010"
 SERVER_ADDR="tcp://127.0.0.1:${SERVER_PORT}"
 SERVER_BROWSER_PORT="18080"
+# Канарейка задержки (scripts/sync_canary.py): период проб и сколько секунд собирать их перед сводкой.
+CANARY_INTERVAL_S="${CANARY_INTERVAL_S:-5}"
+CANARY_WAIT_S="${CANARY_WAIT_S:-30}"
 
 echo "== Local test start =="
 echo "Base: $BASE"
@@ -95,6 +98,8 @@ echo
 
 echo "== Start server (Amvera-like) with allowlist =="
 cat >"$BASE/sync-folders.server.yaml" <<'YAML'
+nodes:
+  amvera: {}
 folders:
   - id: test-sync
     label: test-sync
@@ -115,6 +120,8 @@ docker run -d \
   -v "$BASE/sync-folders.server.yaml":/app/sync-folders.yaml:ro \
   -e SYNC_CONFIG=/app/sync-folders.yaml \
   -e FILE_BROWSER_ENABLED=0 \
+  -e CANARY_ENABLED=1 \
+  -e CANARY_INTERVAL_S="$CANARY_INTERVAL_S" \
   -e AMVERA_ALLOWED_DEVICE_IDS="$IDS" \
   "$IMAGE" >/dev/null
 
@@ -224,6 +231,15 @@ for n in n1 n2 n3; do
 done
 echo
 
+echo "== Start latency canary on n1/n2/n3 (server: CANARY_ENABLED=1) =="
+for n in n1 n2 n3; do
+  nohup python3 "$(dirname "$0")/sync_canary.py" --node "$n" --folder "test-sync=$BASE/$n/sync/test-sync" \
+    --config-xml "$BASE/$n/home/config.xml" --out "$BASE/$n/canary.json" \
+    --interval "$CANARY_INTERVAL_S" >"$BASE/$n/canary.log" 2>&1 &
+  echo $! > "$BASE/$n/canary.pid"
+done
+echo
+
 echo "== Create 3 files (one per node) and wait for sync =="
 TS="$(date -u +%Y-%m-%dT%H:%M:%SZ)"
 for n in n1 n2 n3; do
@@ -278,4 +294,10 @@ sha256sum "$BASE"/n1/sync/test-sync/from-n*.txt
 sha256sum "$BASE"/n2/sync/test-sync/from-n*.txt
 sha256sum "$BASE"/n3/sync/test-sync/from-n*.txt
 echo
+
+echo "== Sync latency (canary, ${CANARY_WAIT_S}s of probes every ${CANARY_INTERVAL_S}s) =="
+sleep "$CANARY_WAIT_S"
+python3 "$(dirname "$0")/sync_canary.py" --report "$BASE"/n*/canary.json \
+  "$BASE/server-data/syncthing/config/.canary.json" || echo "WARN: канарейка не получила проб" >&2
+echo
 echo "== Done =="
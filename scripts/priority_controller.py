@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from bandwidth_scheduler import Window, load_timezone
+from config_patch import FOLDER_PRIORITIES, folder_priority
+from install_stignore import PROJECT_ROOT, load_config
+from shards import expand_shards
+from st_api import API_UNAVAILABLE, SyncthingAPI, default_config_xml, read_gui_settings
+
+# Пауза bulk-папок, пока interactive-папки догоняют (`folders[].priority` в sync-folders.yaml), через REST API:
+# - interactive-папка с needBytes > 0 (есть что скачать) -> все bulk-папки ноды ставятся на паузу
+#   (PATCH /rest/config/folders/<id> paused=true) — puller, диск и канал/relay достаются interactive;
+# - когда у interactive needBytes = 0 дольше --resume-after секунд, bulk-папки возвращаются;
+# - `folders[].pause_windows` — окна (как в bandwidth_schedule: days/from/to/nodes, timezone оттуда же),
+#   в которые папка на паузе независимо от приоритета.
+# Снимается только пауза, поставленная контроллером (список — в --state), ручные паузы не трогаются.
+# --simulate гоняет политику на симулированных часах против заглушки API (scripts/st_stub.py)
+# и сравнивает задержку interactive-папок с контроллером и без.
+
+
+class Policy:
+    def __init__(self, cfg: dict, node: str, *, resume_after: float) -> None:
+        self.resume_after = resume_after
+        self.tz = load_timezone((cfg.get("bandwidth_schedule") or {}).get("timezone"))
+        self.priority: dict[str, str] = {}
+        self.windows: dict[str, list[Window]] = {}
+        for item in cfg.get("folders") or []:
+            if not isinstance(item, dict) or not item.get("id"):
+                continue
+            folder_id = str(item["id"])
+            if not (item.get("paths") or {}).get(node):
+                continue
+            self.priority[folder_id] = folder_priority(item)
+            raw = item.get("pause_windows") or []
+            if not isinstance(raw, list):
+                raise ValueError(f"folders.{folder_id}.pause_windows должен быть списком")
+            windows = [Window(w, i, f"folders.{folder_id}.pause_windows") for i, w in enumerate(raw) if isinstance(w, dict)]
+            self.windows[folder_id] = [w for w in windows if w.nodes is None or node in w.nodes]
+        self.interactive = [f for f, p in self.priority.items() if p == "interactive"]
+        self.bulk = [f for f, p in self.priority.items() if p == "bulk"]
+        self.last_busy: float | None = None
+
+    @property
+    def active(self) -> bool:
+        return bool((self.interactive and self.bulk) or any(self.windows.values()))
+
+    def decide(self, now: datetime, now_s: float, need: dict[str, int]) -> dict[str, str]:
+        # -> folder id -> причина паузы ('' — папка должна работать). need — needBytes interactive-папок.
+        reasons = {}
+        for folder_id in self.priority:
+            window = next((w for w in self.windows.get(folder_id, []) if w.active(now)), None)
+            reasons[folder_id] = f"window {window.name}" if window else ""
+        busy = [f for f in self.interactive if need.get(f, 0) > 0 and not reasons[f]]
+        if busy:
+            self.last_busy = now_s
+        if busy or (self.last_busy is not None and now_s - self.last_busy < self.resume_after):
+            why = f"interactive {','.join(busy)} needs {sum(need[f] for f in busy)}B" if busy else "interactive settling"
+            for folder_id in self.bulk:
+                reasons[folder_id] = reasons[folder_id] or why
+        return reasons
+
+
+def step(api: SyncthingAPI, policy: Policy, owned: set[str], now: datetime, now_s: float) -> list[str]:
+    configured = {f.get("id"): f for f in api.get("/rest/config/folders") or []}
+    need = {}
+    for folder_id in policy.interactive:
+        folder = configured.get(folder_id)
+        if folder is not None and not folder.get("paused"):
+            need[folder_id] = int((api.get("/rest/db/status", folder=folder_id) or {}).get("needBytes") or 0)
+    changes: list[str] = []
+    for folder_id, reason in policy.decide(now, now_s, need).items():
+        folder = configured.get(folder_id)
+        if folder is None:
+            continue
+        paused = bool(folder.get("paused"))
+        if reason and not paused:
+            api.patch(f"/rest/config/folders/{folder_id}", {"paused": True})
+            owned.add(folder_id)
+            changes.append(f"{folder_id} paused ({reason})")
+        elif not reason and paused and folder_id in owned:
+            api.patch(f"/rest/config/folders/{folder_id}", {"paused": False})
+            owned.discard(folder_id)
+            changes.append(f"{folder_id} resumed")
+        elif not paused:
+            # Кто-то снял паузу вручную — папка больше не наша.
+            owned.discard(folder_id)
+    return changes
+
+
+def load_owned(path: Path) -> set[str]:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return set()
+    return {str(f) for f in data} if isinstance(data, list) else set()
+
+
+def save_owned(path: Path, owned: set[str]) -> None:
+    tmp = path.with_name(f".{path.name}.tmp-{os.getpid()}")
+    tmp.write_text(json.dumps(sorted(owned)), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def run_daemon(api: SyncthingAPI, policy: Policy, state_path: Path, interval: float) -> int:
+    owned = load_owned(state_path)
+    while True:
+        now = datetime.now(policy.tz)
+        before = set(owned)
+        try:
+            changes = step(api, policy, owned, now, time.monotonic())
+        except API_UNAVAILABLE as e:
+            print(f"[priority] WARN: {e}", file=sys.stderr)
+            api.close()
+        else:
+            for change in changes:
+                print(f"[priority] {now:%a %H:%M:%S} {change}")
+        if owned != before:
+            save_owned(state_path, owned)
+        time.sleep(interval)
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run_simulation(policy: Policy, start: datetime, args: argparse.Namespace) -> int:
+    from st_stub import STUB_API_KEY, StubState, start_stub
+
+    folders = []
+    for folder_id, priority in policy.priority.items():
+        # Доля канала папки в заглушке пропорциональна данным в полёте (pullerMaxPendingKiB класса).
+        pending = FOLDER_PRIORITIES[priority]["puller_max_pending_kib"]
+        folder = {"id": folder_id, "label": folder_id, "pullerMaxPendingKiB": pending, "_need_bytes": 0}
+        if priority == "interactive":
+            folder.update(_burst_every_s=args.burst_every, _burst_bytes=int(args.burst_kib * 1024))
+        elif priority == "bulk":
+            folder["_need_bytes"] = int(args.bulk_mib * 2**20)
+        folders.append(folder)
+    fixture = {"devices": [], "folders": folders, "pull_bps": int(args.pull_kbps * 1024)}
+    results = {}
+    for controlled in (False, True):
+        clock = [start]
+        state = StubState(fixture, clock=lambda: clock[0].timestamp())
+        stub = start_stub(state)
+        api = SyncthingAPI(stub.base_url, STUB_API_KEY)
+        policy.last_busy = None
+        owned: set[str] = set()
+        # Фаза опроса сдвинута относительно изменений — контроллер видит их с задержкой, как в жизни.
+        next_run = clock[0] + timedelta(seconds=args.interval / 2)
+        try:
+            end = start + timedelta(minutes=args.minutes)
+            while clock[0] < end:
+                if controlled and clock[0] >= next_run:
+                    step(api, policy, owned, clock[0], clock[0].timestamp())
+                    next_run = clock[0] + timedelta(seconds=args.interval)
+                with state.lock:
+                    state.tick()
+                clock[0] += timedelta(seconds=1)
+            waits = [w for f in policy.interactive for w in state.sim[f]["waits"]]
+            left = sum(state.sim[f]["need_bytes"] for f in policy.bulk)
+            patches = sum(1 for method, _ in state.requests if method == "PATCH")
+            results[controlled] = (waits, left, patches)
+        finally:
+            api.close()
+            stub.shutdown()
+    for controlled, (waits, left, patches) in results.items():
+        bulk_done = args.bulk_mib * len(policy.bulk) - left / 2**20
+        print(
+            f"[sim] {'controller' if controlled else 'no control'}: interactive catch-up "
+            f"p50={percentile(waits, 50):.0f}s p95={percentile(waits, 95):.0f}s max={max(waits, default=0):.0f}s "
+            f"({len(waits)} bursts), bulk pulled {bulk_done:.0f} MiB, {patches} PATCH"
+        )
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Pause bulk folders while interactive folders catch up (REST API).")
+    parser.add_argument("--config", default=str(PROJECT_ROOT / "sync-folders.yaml"), help="Путь до sync-folders.yaml")
+    parser.add_argument("--node", required=True, help="Имя этой ноды в nodes.*")
+    parser.add_argument(
+        "--config-xml",
+        default=str(default_config_xml()),
+        help="config.xml Syncthing (адрес GUI и API key)",
+    )
+    parser.add_argument("--state", help="Какие папки поставил на паузу контроллер (по умолчанию рядом с config.xml)")
+    parser.add_argument("--interval", type=float, default=5.0, help="Период опроса needBytes, сек")
+    parser.add_argument("--resume-after", type=float, default=10.0, help="Сколько секунд interactive без needBytes до снятия паузы")
+    parser.add_argument("--once", action="store_true", help="Один шаг и выход")
+    parser.add_argument("--simulate", metavar="START", help="Симуляция против заглушки API с момента START (YYYY-MM-DDTHH:MM)")
+    parser.add_argument("--minutes", type=float, default=30.0, help="Длительность симуляции")
+    parser.add_argument("--pull-kbps", type=float, default=1024.0, help="Симуляция: общая скорость скачивания, KiB/s")
+    parser.add_argument("--burst-every", type=int, default=30, help="Симуляция: interactive-изменения каждые N сек")
+    parser.add_argument("--burst-kib", type=float, default=1024.0, help="Симуляция: размер изменения, KiB")
+    parser.add_argument("--bulk-mib", type=float, default=4096.0, help="Симуляция: отставание каждой bulk-папки, MiB")
+    args = parser.parse_args()
+
+    cfg = load_config(Path(args.config))
+    try:
+        policy = Policy(expand_shards(cfg), args.node, resume_after=args.resume_after)
+    except ValueError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 2
+
+    if args.simulate:
+        start = datetime.fromisoformat(args.simulate)
+        if start.tzinfo is None and policy.tz is not None:
+            start = start.replace(tzinfo=policy.tz)
+        return run_simulation(policy, start, args)
+
+    if not policy.active:
+        print(f"[priority] для {args.node} нет пар interactive/bulk и pause_windows — нечего делать", file=sys.stderr)
+        return 0
+    config_xml = Path(args.config_xml)
+    try:
+        base_url, api_key = read_gui_settings(config_xml)
+    except (OSError, ValueError) as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 2
+    api = SyncthingAPI(base_url, api_key)
+    state_path = Path(args.state) if args.state else config_xml.with_name(".priority-paused.json")
+    if args.once:
+        owned = load_owned(state_path)
+        try:
+            changes = step(api, policy, owned, datetime.now(policy.tz), time.monotonic())
+        except API_UNAVAILABLE as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            return 1
+        save_owned(state_path, owned)
+        print(f"[priority] {'; '.join(changes) or 'no changes'}")
+        return 0
+    print(
+        f"[priority] interactive={','.join(policy.interactive) or '-'} bulk={','.join(policy.bulk) or '-'} "
+        f"every {args.interval:g}s, resume after {args.resume_after:g}s",
+        file=sys.stderr,
+    )
+    try:
+        return run_daemon(api, policy, state_path, args.interval)
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
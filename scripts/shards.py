@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import copy
+import fnmatch
+import hashlib
+import os
+import re
+from pathlib import Path
+
+# Шардирование больших папок (`folders[].shard` в sync-folders.yaml): поддиректории верхнего уровня корня
+# становятся отдельными папками Syncthing — каждая сканируется, отслеживается watcher'ом и качается сама по себе,
+# а родитель игнорирует их через сгенерированный блок в своём локальном `.stignore`.
+#   shard:
+#     dirs: [repo-a, repo-b]   # шарды — только явный список (одинаков на всех нодах)
+#     glob: "*"                # подсказка: подходящие поддиректории корня (скрытые — нет), которых нет в dirs
+# ID шарда детерминированный: `<id родителя>--<имя>` (с хешем имени, если его пришлось нормализовать),
+# путь — `<путь родителя>/<имя>` на каждой ноде. Шарды по локальному листингу glob'а были бы гонкой: нода, где
+# директорию создали, сразу игнорировала бы её в родителе, и остальные ноды не получили бы её ни через родителя,
+# ни как шард (только непринятая «offered folder»). Поэтому glob лишь предлагает имена для dirs (glob_candidates) —
+# их добавляют в YAML, когда директория уже есть на всех нодах.
+
+SHARD_BEGIN = "// BEGIN shards (sync-folders.yaml shard:, генерируется — не править)"
+SHARD_END = "// END shards"
+PATH_KEYS = ("paths", "mirror")
+
+
+def shard_id(parent_id: str, name: str) -> str:
+    slug = re.sub(r"[^A-Za-z0-9._-]+", "-", name).strip("-.") or "dir"
+    if slug != name:
+        slug += "-" + hashlib.sha1(name.encode("utf-8")).hexdigest()[:6]
+    return f"{parent_id}--{slug}"
+
+
+def shard_spec(item: dict) -> tuple[list[str], list[str]] | None:
+    # -> (явные dirs, globs) или None, если папка не шардируется.
+    spec = item.get("shard")
+    if spec is None:
+        return None
+    folder_id = item.get("id")
+    if not isinstance(spec, dict):
+        raise ValueError(f"folders.{folder_id}.shard должен быть объектом")
+    dirs = spec.get("dirs") or []
+    globs = spec.get("glob") or []
+    if isinstance(globs, str):
+        globs = [globs]
+    if not isinstance(dirs, list) or not isinstance(globs, list):
+        raise ValueError(f"folders.{folder_id}.shard: dirs и glob — строки или списки строк")
+    for name in dirs:
+        if not isinstance(name, str) or not name or "/" in name or name in (".", "..") or name.startswith(".st"):
+            raise ValueError(f"folders.{folder_id}.shard.dirs: {name!r} — нужно имя поддиректории верхнего уровня")
+    if not dirs and not globs:
+        raise ValueError(f"folders.{folder_id}.shard: задай dirs и/или glob")
+    return [str(d) for d in dirs], [str(g) for g in globs]
+
+
+def list_subdirs(root: Path) -> list[str]:
+    try:
+        with os.scandir(root) as it:
+            return sorted(e.name for e in it if not e.name.startswith(".") and e.is_dir(follow_symlinks=False))
+    except OSError:
+        return []
+
+
+def node_root(item: dict, node: str) -> str | None:
+    # Корень, который сканирует Syncthing на ноде: mirror.<node> важнее paths.<node>.
+    for key in ("mirror", "paths"):
+        value = (item.get(key) or {}).get(node) if isinstance(item.get(key), dict) else None
+        if value and value != "REQUIRED_LOCAL":
+            return str(value)
+    return None
+
+
+def glob_candidates(cfg: dict, node: str) -> dict[str, list[str]]:
+    # folder id -> поддиректории корня на этой ноде под shard.glob, которых ещё нет в shard.dirs.
+    found: dict[str, list[str]] = {}
+    for item in cfg.get("folders") or []:
+        if not isinstance(item, dict) or item.get("shard") is None:
+            continue
+        dirs, globs = shard_spec(item) or ([], [])
+        raw = node_root(item, node)
+        if not globs or not raw:
+            continue
+        names = [
+            name
+            for name in list_subdirs(Path(os.path.expanduser(raw)))
+            if name not in dirs and any(fnmatch.fnmatchcase(name, g) for g in globs)
+        ]
+        if names:
+            found[str(item.get("id"))] = names
+    return found
+
+
+def describe_candidates(folder_id: str, names: list[str]) -> str:
+    shown = ", ".join(names[:10]) + (f" и ещё {len(names) - 10}" if len(names) > 10 else "")
+    return f"{folder_id}: под shard.glob, но не в shard.dirs: {shown} — добавь в dirs, когда они есть на всех нодах"
+
+
+def expand_shards(cfg: dict) -> dict:
+    # -> копия cfg, где у шардированных папок появился `shard_dirs` (имена), а следом идут папки-шарды.
+    # От ноды не зависит: шарды — только явный shard.dirs, одинаковый везде.
+    folders = cfg.get("folders")
+    if not isinstance(folders, list) or not any(isinstance(i, dict) and i.get("shard") is not None for i in folders):
+        return cfg
+    expanded: list = []
+    for item in folders:
+        if not isinstance(item, dict) or item.get("shard") is None:
+            expanded.append(item)
+            continue
+        spec = shard_spec(item)
+        names = sorted(set(spec[0])) if spec else []
+        parent = {**item, "shard_dirs": names}
+        expanded.append(parent)
+        parent_id = str(item.get("id") or "").strip()
+        label = str(item.get("label") or parent_id)
+        for name in names:
+            shard = copy.deepcopy({k: v for k, v in item.items() if k != "shard"})
+            shard["id"] = shard_id(parent_id, name)
+            shard["label"] = f"{label}/{name}"
+            shard["shard_of"] = parent_id
+            for key in PATH_KEYS:
+                if isinstance(item.get(key), dict):
+                    shard[key] = {
+                        n: (p if not p or p == "REQUIRED_LOCAL" else f"{str(p).rstrip('/')}/{name}")
+                        for n, p in item[key].items()
+                    }
+            expanded.append(shard)
+    return {**cfg, "folders": expanded}
+
+
+def stale_shards(cfg: dict, folder_ids) -> list[str]:
+    # Папки-шарды из config.xml, которых больше нет в раскрытом cfg (директорию удалили/убрали из dirs).
+    items = [i for i in cfg.get("folders") or [] if isinstance(i, dict)]
+    parents = [str(i.get("id")) for i in items if "shard_dirs" in i]
+    current = {str(i.get("id")) for i in items if i.get("shard_of")}
+    return [fid for fid in folder_ids if fid not in current and any(fid.startswith(f"{p}--") for p in parents)]
+
+
+def escape_ignore(name: str) -> str:
+    return re.sub(r"([\\*?\[\]{}])", r"\\\1", name)
+
+
+def render_shard_block(names: list[str]) -> str:
+    if not names:
+        return ""
+    lines = [SHARD_BEGIN, *(f"/{escape_ignore(name)}" for name in names), SHARD_END]
+    return "\n".join(lines) + "\n"
+
+
+def with_shard_block(text: str, names: list[str]) -> str:
+    # Заменяет сгенерированный блок в .stignore (или добавляет его); остальные строки не трогает.
+    kept: list[str] = []
+    inside = False
+    for line in text.splitlines():
+        if line.strip() == SHARD_BEGIN:
+            inside = True
+        elif inside and line.strip() == SHARD_END:
+            inside = False
+        elif not inside:
+            kept.append(line)
+    body = "\n".join(kept).rstrip("\n")
+    block = render_shard_block(names)
+    if not block:
+        return body + "\n" if body else ""
+    # Блок — в начало: первое совпадение в .stignore выигрывает, и `!`-исключения ниже не вернут шард в родителя.
+    return block + (body + "\n" if body else "")
+
+
+def apply_shard_ignores(stignore: Path, names: list[str], *, dry_run: bool = False) -> bool:
+    # -> True, если .stignore родителя изменился (или изменился бы при dry_run).
+    try:
+        current = stignore.read_text(encoding="utf-8")
+    except FileNotFoundError:
+        current = ""
+    updated = with_shard_block(current, names)
+    if updated == current or (not current and not names):
+        return False
+    if not dry_run:
+        stignore.write_text(updated, encoding="utf-8")
+    return True
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import http.client
+import json
+import os
+import ssl
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlencode, urlsplit
+
+# Минимальный клиент Syncthing REST API поверх http.client: одно keep-alive соединение
+# на экземпляр (не потокобезопасно — на поток свой экземпляр), API key из config.xml.
+
+
+class SyncthingAPIError(RuntimeError):
+    def __init__(self, method: str, path: str, status: int, body: str) -> None:
+        super().__init__(f"{method} {path}: HTTP {status}: {body.strip()[:200]}")
+        self.status = status
+
+
+# Syncthing ещё не поднялся или перезапускается: демоны пишут WARN и пробуют снова на следующем тике.
+API_UNAVAILABLE = (OSError, SyncthingAPIError)
+
+
+def default_config_xml() -> Path:
+    home = os.environ.get("STHOMEDIR") or str(Path.home() / ".local/state/syncthing")
+    return Path(home) / "config.xml"
+
+
+def read_gui_settings(config_xml: Path) -> tuple[str, str]:
+    # -> (base_url, api_key) из <gui> в config.xml.
+    root = ET.parse(config_xml).getroot()
+    gui = root.find("gui")
+    if gui is None:
+        raise ValueError(f"{config_xml}: нет <gui>")
+    address = (gui.findtext("address") or "127.0.0.1:8384").strip()
+    api_key = (gui.findtext("apikey") or "").strip()
+    if not api_key:
+        raise ValueError(f"{config_xml}: пустой <gui><apikey>")
+    if "://" not in address:
+        scheme = "https" if gui.get("tls") == "true" else "http"
+        address = f"{scheme}://{address}"
+    # Слушает на всех интерфейсах — ходим через loopback.
+    address = address.replace("://0.0.0.0:", "://127.0.0.1:")
+    return address, api_key
+
+
+class SyncthingAPI:
+    def __init__(self, base_url: str, api_key: str, *, timeout: float = 10.0) -> None:
+        parts = urlsplit(base_url)
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.timeout = timeout
+        self._https = parts.scheme == "https"
+        self._host = parts.hostname or "127.0.0.1"
+        self._port = parts.port or (443 if self._https else 80)
+        self._conn: http.client.HTTPConnection | None = None
+
+    @classmethod
+    def from_config_xml(cls, config_xml: Path, *, timeout: float = 10.0) -> SyncthingAPI:
+        base_url, api_key = read_gui_settings(config_xml)
+        return cls(base_url, api_key, timeout=timeout)
+
+    def _connection(self) -> http.client.HTTPConnection:
+        if self._conn is None:
+            if self._https:
+                # GUI Syncthing по умолчанию с self-signed сертификатом.
+                ctx = ssl._create_unverified_context()
+                self._conn = http.client.HTTPSConnection(self._host, self._port, timeout=self.timeout, context=ctx)
+            else:
+                self._conn = http.client.HTTPConnection(self._host, self._port, timeout=self.timeout)
+        return self._conn
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        *,
+        params: dict | None = None,
+        body: object = None,
+        timeout: float | None = None,
+    ):
+        url = path
+        if params:
+            url = f"{path}?{urlencode({k: v for k, v in params.items() if v is not None})}"
+        headers = {"X-API-Key": self.api_key}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+
+        # Одна повторная попытка: keep-alive соединение могло быть закрыто сервером.
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                if conn.sock is None:
+                    conn.connect()
+                conn.sock.settimeout(timeout or self.timeout)
+                conn.request(method, url, body=payload, headers=headers)
+                resp = conn.getresponse()
+                data = resp.read()
+            except (http.client.HTTPException, ConnectionError):
+                self.close()
+                if attempt:
+                    raise
+                continue
+            if resp.status >= 400:
+                raise SyncthingAPIError(method, path, resp.status, data.decode("utf-8", "replace"))
+            if not data:
+                return None
+            if (resp.getheader("Content-Type") or "").startswith("application/json"):
+                return json.loads(data)
+            return data.decode("utf-8", "replace")
+        return None
+
+    def get(self, path: str, **params):
+        return self.request("GET", path, params=params or None)
+
+    def post(self, path: str, body: object = None, **params):
+        return self.request("POST", path, params=params or None, body=body)
+
+    def put(self, path: str, body: object, **params):
+        return self.request("PUT", path, params=params or None, body=body)
+
+    def patch(self, path: str, body: object, **params):
+        return self.request("PATCH", path, params=params or None, body=body)
+
+    def delete(self, path: str, **params):
+        return self.request("DELETE", path, params=params or None)
+
+    def ping(self) -> bool:
+        try:
+            return (self.get("/rest/system/ping") or {}).get("ping") == "pong"
+        except (OSError, SyncthingAPIError, http.client.HTTPException):
+            return False
+
+
+class SyncthingAPIPool:
+    # Несколько keep-alive соединений для параллельных запросов: по SyncthingAPI на поток пула,
+    # соединения живут между вызовами map() (пул потоков не пересоздаётся).
+    def __init__(self, base_url: str, api_key: str, *, size: int = 4, timeout: float = 10.0) -> None:
+        self.base_url = base_url
+        self.api_key = api_key
+        self.timeout = timeout
+        self._local = threading.local()
+        self._clients: list[SyncthingAPI] = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, size), thread_name_prefix="st-api")
+
+    @classmethod
+    def from_config_xml(cls, config_xml: Path, *, size: int = 4, timeout: float = 10.0) -> SyncthingAPIPool:
+        base_url, api_key = read_gui_settings(config_xml)
+        return cls(base_url, api_key, size=size, timeout=timeout)
+
+    def api(self) -> SyncthingAPI:
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = SyncthingAPI(self.base_url, self.api_key, timeout=self.timeout)
+            self._local.client = client
+            with self._lock:
+                self._clients.append(client)
+        return client
+
+    def map(self, fn, items) -> list:
+        # fn(api, item) для каждого item; исключения пробрасываются из результата.
+        return list(self._executor.map(lambda item: fn(self.api(), item), items))
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for client in self._clients:
+                client.close()
+            self._clients.clear()
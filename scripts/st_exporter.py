@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from st_api import SyncthingAPIPool, default_config_xml, read_gui_settings
+
+# Экспортер метрик Syncthing в текстовом формате Prometheus.
+# Раз в --interval опрашивает REST API (пул keep-alive соединений, API key из config.xml):
+# /rest/system/connections, /rest/config/{devices,folders}, /rest/db/status (по папкам параллельно),
+# /rest/stats/folder и /rest/events (StateChanged — точная длительность сканов, а не догадка по опросу).
+# /metrics отдаёт последний снимок: частые scrape'ы не создают нагрузку на Syncthing.
+# Если рядом есть гистограммы канарейки (scripts/sync_canary.py, --canary) — они добавляются к снимку.
+
+FRACTION_RE = re.compile(r"(\.\d{6})\d+")
+
+
+def parse_time(value: str | None) -> float | None:
+    # RFC3339 Syncthing с наносекундами -> unix time.
+    if not value or value.startswith("0001-"):
+        return None
+    value = FRACTION_RE.sub(r"\1", value).replace("Z", "+00:00")
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+
+def escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Exposition:
+    # Семейства метрик выводятся одним блоком (HELP/TYPE + все сэмплы), как требует text format.
+    def __init__(self) -> None:
+        self.families: dict[str, tuple[str, str, list[str]]] = {}
+
+    def add(self, name: str, kind: str, help_text: str, value: float, *, suffix: str = "", **labels: str) -> None:
+        family = self.families.setdefault(name, (kind, help_text, []))
+        label_str = ",".join(f'{k}="{escape_label(v)}"' for k, v in labels.items())
+        sample = str(int(value)) if float(value).is_integer() else repr(float(value))
+        family[2].append(f"{name}{suffix}{{{label_str}}} {sample}" if label_str else f"{name}{suffix} {sample}")
+
+    def text(self) -> str:
+        lines: list[str] = []
+        for name, (kind, help_text, samples) in self.families.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+def add_canary(out: Exposition, path: Path | None) -> None:
+    # Гистограммы задержки доставки проб (путь src -> dst по папке) из JSON канарейки этой ноды.
+    try:
+        data = json.loads(path.read_text(encoding="utf-8")) if path else None
+    except (OSError, ValueError):
+        return
+    if not isinstance(data, dict):
+        return
+    buckets = data.get("buckets") or []
+    help_text = "Delivery latency of canary probe files from src node to dst node"
+    for entry in data.get("paths") or []:
+        counts = entry.get("counts") or []
+        if len(counts) != len(buckets) + 1:
+            continue
+        labels = {"folder": str(entry.get("folder")), "src": str(entry.get("src")), "dst": str(entry.get("dst"))}
+        total = 0
+        for le, count in zip([*(f"{b:g}" for b in buckets), "+Inf"], counts):
+            total += int(count)
+            out.add("syncthing_canary_latency_seconds", "histogram", help_text, total, suffix="_bucket", **labels, le=le)
+        out.add("syncthing_canary_latency_seconds", "histogram", help_text, entry.get("sum") or 0, suffix="_sum", **labels)
+        out.add("syncthing_canary_latency_seconds", "histogram", help_text, total, suffix="_count", **labels)
+        if entry.get("last_s") is not None:
+            last_help = "Latency of the last canary probe"
+            out.add("syncthing_canary_last_latency_seconds", "gauge", last_help, entry["last_s"], **labels)
+            out.add(
+                "syncthing_canary_last_arrival_timestamp_seconds",
+                "gauge",
+                "Unix time the last canary probe arrived",
+                entry.get("last_at") or 0,
+                **labels,
+            )
+
+
+class Collector:
+    def __init__(self, pool: SyncthingAPIPool, *, clock=time.monotonic, canary: Path | None = None) -> None:
+        self.pool = pool
+        self.clock = clock
+        self.canary = canary
+        self.errors_total = 0
+        self._prev: dict[str, tuple[float, int, int]] = {}
+        self._event_since: int | None = None
+        self._scans: dict[str, list[float]] = {}  # folder -> [count, sum, last]
+
+    def _rates(self, key: str, now: float, in_total: int, out_total: int) -> tuple[float, float]:
+        prev = self._prev.get(key)
+        self._prev[key] = (now, in_total, out_total)
+        if prev is None or now <= prev[0]:
+            return 0.0, 0.0
+        dt = now - prev[0]
+        # Счётчики сбрасываются при переподключении — тогда скорость за интервал неизвестна (0).
+        return max(0, in_total - prev[1]) / dt, max(0, out_total - prev[2]) / dt
+
+    def _poll_events(self, api) -> None:
+        first = self._event_since is None
+        events = api.request(
+            "GET",
+            "/rest/events",
+            params={"events": "StateChanged", "since": self._event_since or 0, "timeout": 0},
+        ) or []
+        for event in events:
+            self._event_since = max(self._event_since or 0, event.get("id", 0))
+            data = event.get("data") or {}
+            if data.get("from") != "scanning" or "duration" not in data:
+                continue
+            stats = self._scans.setdefault(data.get("folder", ""), [0, 0.0, 0.0])
+            stats[2] = float(data["duration"])
+            if not first:
+                stats[0] += 1
+                stats[1] += float(data["duration"])
+        if self._event_since is None:
+            self._event_since = 0
+
+    def collect(self) -> str:
+        out = Exposition()
+        t0 = time.perf_counter()
+        api = self.pool.api()
+        try:
+            connections = api.get("/rest/system/connections") or {}
+            devices = {d["deviceID"]: d for d in api.get("/rest/config/devices") or []}
+            folders = api.get("/rest/config/folders") or []
+            statuses = self.pool.map(lambda a, f: a.get("/rest/db/status", folder=f["id"]), folders)
+            folder_stats = api.get("/rest/stats/folder") or {}
+            self._poll_events(api)
+        except Exception as e:  # noqa: BLE001 — любая ошибка опроса = syncthing_up 0, процесс живёт дальше
+            self.errors_total += 1
+            # Syncthing мог перезапуститься: id событий начнутся заново.
+            self._event_since = None
+            print(f"[exporter] WARN: poll failed: {e}", file=sys.stderr)
+            out.add("syncthing_up", "gauge", "1 if the last poll of the REST API succeeded", 0)
+            out.add("syncthing_exporter_errors_total", "counter", "Failed polls", self.errors_total)
+            return out.text()
+
+        now = self.clock()
+        out.add("syncthing_up", "gauge", "1 if the last poll of the REST API succeeded", 1)
+        out.add("syncthing_exporter_errors_total", "counter", "Failed polls", self.errors_total)
+
+        total = connections.get("total") or {}
+        t_in, t_out = total.get("inBytesTotal", 0), total.get("outBytesTotal", 0)
+        r_in, r_out = self._rates("__total__", now, t_in, t_out)
+        out.add("syncthing_in_bytes_total", "counter", "Bytes received from all devices", t_in)
+        out.add("syncthing_out_bytes_total", "counter", "Bytes sent to all devices", t_out)
+        out.add("syncthing_in_bytes_per_second", "gauge", "Receive rate over the last poll interval", r_in)
+        out.add("syncthing_out_bytes_per_second", "gauge", "Send rate over the last poll interval", r_out)
+
+        for device_id, conn in sorted((connections.get("connections") or {}).items()):
+            labels = {"device_id": device_id, "device": (devices.get(device_id) or {}).get("name") or device_id[:7]}
+            d_in, d_out = conn.get("inBytesTotal", 0), conn.get("outBytesTotal", 0)
+            dr_in, dr_out = self._rates(device_id, now, d_in, d_out)
+            conn_type = conn.get("type") or ""
+            connected = bool(conn.get("connected"))
+            out.add("syncthing_device_connected", "gauge", "1 if the device is connected", int(connected), **labels)
+            out.add("syncthing_device_paused", "gauge", "1 if the device is paused", int(bool(conn.get("paused"))), **labels)
+            if connected:
+                out.add(
+                    "syncthing_device_relay",
+                    "gauge",
+                    "1 if the connection goes through a relay, 0 if direct",
+                    int(conn_type.startswith("relay")),
+                    **labels,
+                    type=conn_type,
+                )
+            out.add("syncthing_device_in_bytes_total", "counter", "Bytes received from the device", d_in, **labels)
+            out.add("syncthing_device_out_bytes_total", "counter", "Bytes sent to the device", d_out, **labels)
+            out.add("syncthing_device_in_bytes_per_second", "gauge", "Receive rate from the device", dr_in, **labels)
+            out.add("syncthing_device_out_bytes_per_second", "gauge", "Send rate to the device", dr_out, **labels)
+
+        for folder, status in zip(folders, statuses):
+            labels = {"folder": folder["id"], "label": folder.get("label") or folder["id"]}
+            status = status or {}
+            out.add("syncthing_folder_need_bytes", "gauge", "Bytes still to download", status.get("needBytes", 0), **labels)
+            out.add("syncthing_folder_need_files", "gauge", "Files still to download", status.get("needFiles", 0), **labels)
+            out.add("syncthing_folder_global_bytes", "gauge", "Size of the global (cluster) state", status.get("globalBytes", 0), **labels)
+            out.add("syncthing_folder_local_bytes", "gauge", "Size of the local state", status.get("localBytes", 0), **labels)
+            out.add("syncthing_folder_errors", "gauge", "Folder errors", status.get("errors", 0), **labels)
+            out.add("syncthing_folder_pull_errors", "gauge", "Files that failed to sync", status.get("pullErrors", 0), **labels)
+            out.add("syncthing_folder_state", "gauge", "Current folder state", 1, **labels, state=status.get("state") or "unknown")
+            last_scan = parse_time((folder_stats.get(folder["id"]) or {}).get("lastScan"))
+            if last_scan is not None:
+                out.add("syncthing_folder_last_scan_timestamp_seconds", "gauge", "Unix time of the last scan", last_scan, **labels)
+            scans = self._scans.get(folder["id"])
+            if scans is not None:
+                out.add("syncthing_folder_last_scan_duration_seconds", "gauge", "Duration of the last scan", scans[2], **labels)
+                help_text = "Scan durations observed since the exporter started"
+                out.add("syncthing_folder_scan_duration_seconds", "summary", help_text, scans[1], suffix="_sum", **labels)
+                out.add("syncthing_folder_scan_duration_seconds", "summary", help_text, scans[0], suffix="_count", **labels)
+
+        add_canary(out, self.canary)
+        out.add("syncthing_exporter_poll_seconds", "gauge", "Time spent polling the REST API", time.perf_counter() - t0)
+        return out.text()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    server_version = "syncthing-exporter"
+    snapshot = b"syncthing_up 0\n"
+
+    def log_message(self, format: str, *args) -> None:  # noqa: A002
+        pass
+
+    def do_GET(self) -> None:
+        path = self.path.split("?", 1)[0]
+        if path == "/healthz":
+            body, ctype = b"ok\n", "text/plain; charset=utf-8"
+        elif path == "/metrics":
+            body, ctype = MetricsHandler.snapshot, "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            self.send_response(HTTPStatus.NOT_FOUND)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def poll_forever(collector: Collector, interval: float, stop: threading.Event) -> None:
+    while not stop.is_set():
+        MetricsHandler.snapshot = collector.collect().encode("utf-8")
+        stop.wait(interval)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Экспортер метрик Syncthing (Prometheus text format).")
+    parser.add_argument("--config-xml", default=str(default_config_xml()), help="Откуда взять адрес GUI и API key")
+    parser.add_argument("--url", help="Адрес REST API (перекрывает config.xml)")
+    parser.add_argument("--api-key", help="API key (перекрывает config.xml)")
+    parser.add_argument("--bind", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("METRICS_PORT", "9090")))
+    parser.add_argument("--interval", type=float, default=15.0, help="Период опроса REST API, сек")
+    parser.add_argument("--connections", type=int, default=4, help="Размер пула keep-alive соединений")
+    parser.add_argument("--once", action="store_true", help="Один опрос (два — для скоростей) и вывод в stdout")
+    parser.add_argument("--stub", action="store_true", help="Опрашивать встроенную заглушку API (scripts/st_stub.py)")
+    parser.add_argument("--canary", help="JSON канарейки задержки (по умолчанию .canary.json рядом с config.xml)")
+    args = parser.parse_args()
+
+    stub = None
+    if args.stub:
+        from st_stub import STUB_API_KEY, start_stub
+
+        stub = start_stub()
+        base_url, api_key = stub.base_url, STUB_API_KEY
+    elif args.url and args.api_key:
+        base_url, api_key = args.url, args.api_key
+    else:
+        try:
+            base_url, api_key = read_gui_settings(Path(args.config_xml))
+        except (OSError, ValueError) as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            return 2
+        base_url = args.url or base_url
+        api_key = args.api_key or api_key
+
+    pool = SyncthingAPIPool(base_url, api_key, size=args.connections)
+    canary = Path(args.canary) if args.canary else Path(args.config_xml).with_name(".canary.json")
+    collector = Collector(pool, canary=canary)
+    try:
+        if args.once:
+            collector.collect()
+            time.sleep(min(args.interval, 1.0))
+            sys.stdout.write(collector.collect())
+            return 0
+
+        server = ThreadingHTTPServer((args.bind, args.port), MetricsHandler)
+        server.daemon_threads = True
+        stop = threading.Event()
+        threading.Thread(target=poll_forever, args=(collector, args.interval, stop), daemon=True).start()
+        print(f"[exporter] {base_url} -> http://{args.bind}:{args.port}/metrics every {args.interval:g}s", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop.set()
+            server.server_close()
+    finally:
+        pool.close()
+        if stub is not None:
+            stub.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from pathlib import Path
+
+# Семантика .stignore Syncthing на Python (для симуляции/оптимизации игноров, не для самого Syncthing):
+# - строки сверху вниз, первое совпадение выигрывает;
+# - `//` — комментарий, `#include <file>` — вставка файла (путь относительно включающего файла);
+# - префиксы `!` (исключение из игнора), `(?i)` (без учёта регистра), `(?d)` (можно удалять);
+# - `/x` — от корня папки, иначе совпадение на любой глубине (`x` и `**/x`);
+# - совпавшая директория игнорирует и всё, что под ней (`x/**`);
+# - glob: `*` и `?` не пересекают `/`, `**` — пересекает, `[...]`, `{a,b}`, `\` — экранирование.
+
+# Внутренние файлы Syncthing, которые никогда не синхронизируются.
+INTERNAL_NAMES = {".stfolder", ".stignore", ".stversions"}
+INTERNAL_PATTERN = "<internal>"
+# Пробы канарейки задержки (scripts/sync_canary.py): обычная синхронизируемая директория в корне каждой папки.
+CANARY_DIR = ".stcanary"
+
+
+class IgnoreParseError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Pattern:
+    raw: str
+    glob: str
+    negate: bool
+    casefold: bool
+    deletable: bool
+    source: str
+    regex: re.Pattern
+
+    @property
+    def line(self) -> str:
+        # Строка в каноническом виде (как её можно записать обратно в файл).
+        prefix = ("!" if self.negate else "") + ("(?i)" if self.casefold else "") + ("(?d)" if self.deletable else "")
+        return prefix + self.glob
+
+    def matches(self, rel_path: str) -> bool:
+        return self.regex.fullmatch(rel_path) is not None
+
+
+def glob_to_regex(glob: str) -> str:
+    out: list[str] = []
+    i = 0
+    depth = 0
+    n = len(glob)
+    while i < n:
+        c = glob[i]
+        if c == "\\" and i + 1 < n:
+            out.append(re.escape(glob[i + 1]))
+            i += 2
+            continue
+        if c == "*":
+            if i + 1 < n and glob[i + 1] == "*":
+                out.append(".*")
+                i += 2
+            else:
+                out.append("[^/]*")
+                i += 1
+            continue
+        if c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            j = glob.find("]", i + 2 if i + 1 < n and glob[i + 1] in "!^" else i + 1)
+            if j < 0:
+                out.append(re.escape(c))
+            else:
+                body = glob[i + 1 : j]
+                if body[:1] in ("!", "^"):
+                    body = "^" + body[1:]
+                out.append("[" + body.replace("\\", "\\\\") + "]")
+                i = j + 1
+                continue
+        elif c == "{":
+            out.append("(?:")
+            depth += 1
+        elif c == "}" and depth:
+            out.append(")")
+            depth -= 1
+        elif c == "," and depth:
+            out.append("|")
+        else:
+            out.append(re.escape(c))
+        i += 1
+    if depth:
+        raise IgnoreParseError(f"незакрытая {{ в шаблоне {glob!r}")
+    return "".join(out)
+
+
+def compile_pattern(line: str, source: str) -> Pattern:
+    raw = line
+    negate = casefold = deletable = False
+    while True:
+        if line.startswith("!"):
+            negate = True
+            line = line[1:]
+        elif line.startswith("(?i)"):
+            casefold = True
+            line = line[4:]
+        elif line.startswith("(?d)"):
+            deletable = True
+            line = line[4:]
+        else:
+            break
+    glob = line
+    body = line.rstrip("/") or line
+    if body.startswith("/"):
+        expr = glob_to_regex(body[1:])
+    elif body.startswith("**/"):
+        expr = glob_to_regex(body)
+    else:
+        expr = "(?:.*/)?" + glob_to_regex(body)
+    expr += "(?:/.*)?"
+    flags = re.IGNORECASE if casefold else 0
+    try:
+        regex = re.compile(expr, flags | re.DOTALL)
+    except re.error as e:
+        raise IgnoreParseError(f"{source}: некорректный шаблон {raw!r}: {e}") from e
+    return Pattern(raw=raw, glob=glob, negate=negate, casefold=casefold, deletable=deletable, source=source, regex=regex)
+
+
+def parse_lines(
+    lines: list[str],
+    *,
+    source: str,
+    base_dir: Path | None,
+    loader=None,
+    _stack: tuple[str, ...] = (),
+) -> list[Pattern]:
+    # loader(path) -> текст файла; по умолчанию читаем с диска. Нужен, чтобы подставлять шаблоны.
+    patterns: list[Pattern] = []
+    for lineno, raw in enumerate(lines, start=1):
+        line = raw.strip()
+        if not line or line.startswith("//") or line.startswith("#escape"):
+            continue
+        where = f"{source}:{lineno}"
+        if line.startswith("#include"):
+            name = line[len("#include") :].strip()
+            if not name:
+                raise IgnoreParseError(f"{where}: пустой #include")
+            if base_dir is None:
+                raise IgnoreParseError(f"{where}: #include без базовой директории")
+            target = base_dir / name
+            key = str(target)
+            if key in _stack:
+                raise IgnoreParseError(f"{where}: циклический #include {name}")
+            text = loader(target) if loader else _read(target, where)
+            patterns.extend(
+                parse_lines(
+                    text.splitlines(),
+                    source=name,
+                    base_dir=target.parent,
+                    loader=loader,
+                    _stack=(*_stack, key),
+                )
+            )
+            continue
+        patterns.append(compile_pattern(line, where))
+    return patterns
+
+
+def _read(path: Path, where: str) -> str:
+    try:
+        return path.read_text(encoding="utf-8")
+    except FileNotFoundError as e:
+        raise IgnoreParseError(f"{where}: #include {path} не найден") from e
+
+
+class IgnoreMatcher:
+    def __init__(self, patterns: list[Pattern]) -> None:
+        self.patterns = patterns
+        self.has_negations = any(p.negate for p in patterns)
+
+    @classmethod
+    def from_file(cls, path: Path, *, loader=None) -> IgnoreMatcher:
+        text = loader(path) if loader else (path.read_text(encoding="utf-8") if path.exists() else "")
+        return cls(parse_lines(text.splitlines(), source=path.name, base_dir=path.parent, loader=loader))
+
+    @classmethod
+    def from_text(cls, text: str, *, source: str = "<text>", base_dir: Path | None = None, loader=None) -> IgnoreMatcher:
+        return cls(parse_lines(text.splitlines(), source=source, base_dir=base_dir, loader=loader))
+
+    def match(self, rel_path: str) -> Pattern | None:
+        # Первый совпавший шаблон (или None — путь не упомянут и синхронизируется).
+        for p in self.patterns:
+            if p.regex.fullmatch(rel_path) is not None:
+                return p
+        return None
+
+    def is_ignored(self, rel_path: str) -> bool:
+        if is_internal(rel_path):
+            return True
+        p = self.match(rel_path)
+        return p is not None and not p.negate
+
+    def skip_ignored_dirs(self) -> bool:
+        # Как Syncthing: в проигнорированную директорию можно не заходить, если нет `!`-шаблонов.
+        return not self.has_negations
+
+
+def is_internal(rel_path: str) -> bool:
+    first = rel_path.split("/", 1)[0]
+    if first in INTERNAL_NAMES:
+        return True
+    name = rel_path.rsplit("/", 1)[-1]
+    return (name.startswith(".syncthing.") and name.endswith(".tmp")) or name.startswith("~syncthing~")
@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import copy
+import json
+import sys
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Заглушка Syncthing REST API для проверки инструментов без живого Syncthing:
+# - /rest/system/{ping,version,connections}, /rest/db/status, /rest/stats/folder, /rest/events;
+# - /rest/config (+ /folders, /devices, /options, /defaults/{folder,device}, объекты по ID): GET/PUT/PATCH/DELETE
+#   меняют состояние в памяти;
+# - трафик устройств растёт с заданной скоростью, папки периодически “сканируются” (события StateChanged);
+# - если в fixture задан pull_bps, needBytes непаузнутых папок убывает (скорость делится пропорционально
+#   pullerMaxPendingKiB папки — сколько данных она держит в полёте), а папки с
+#   _burst_every_s/_burst_bytes периодически получают новые изменения; время до needBytes=0 — в sim[..]["waits"];
+# - все запросы пишутся в state.requests (метод, путь) — чтобы проверять, что и сколько раз меняли.
+# Время берётся из clock() — в тестовых режимах инструментов подставляется симулированное.
+
+STUB_API_KEY = "stub-key"
+STUB_LOCAL_ID = "LOCAL00-AAAAAAA-AAAAAAA-AAAAAAA-AAAAAAA-AAAAAAA-AAAAAAA-AAAAAAA"
+
+
+def default_fixture() -> dict:
+    # Локальное устройство + WSL-пир по прямому TCP + Amvera через relay.
+    devices = [
+        {"deviceID": STUB_LOCAL_ID, "name": "local", "addresses": ["dynamic"]},
+        {
+            "deviceID": "WSLB000-BBBBBBB-BBBBBBB-BBBBBBB-BBBBBBB-BBBBBBB-BBBBBBB-BBBBBBB",
+            "name": "wsl_b",
+            "addresses": ["dynamic"],
+            "_type": "tcp-client",
+            "_in_bps": 2_000_000,
+            "_out_bps": 500_000,
+        },
+        {
+            "deviceID": "AMVERA0-CCCCCCC-CCCCCCC-CCCCCCC-CCCCCCC-CCCCCCC-CCCCCCC-CCCCCCC",
+            "name": "amvera",
+            "addresses": ["dynamic"],
+            "_type": "relay-client",
+            "_in_bps": 50_000,
+            "_out_bps": 120_000,
+        },
+    ]
+    folders = [
+        {"id": "codex-sessions", "label": "Codex sessions", "_need_bytes": 0, "_scan_every_s": 60, "_scan_s": 1.5},
+        {"id": "aihub-reps", "label": "AI Hub repos", "_need_bytes": 7_340_032, "_scan_every_s": 300, "_scan_s": 42.0},
+    ]
+    return {"devices": devices, "folders": folders}
+
+
+class StubState:
+    def __init__(self, fixture: dict | None = None, *, clock=time.time) -> None:
+        fixture = fixture or default_fixture()
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.started = clock()
+        self.last_tick = self.started
+        self.requests: list[tuple[str, str]] = []
+        self.events: list[dict] = []
+        self.sim: dict[str, dict] = {}
+        self.pull_bps = fixture.get("pull_bps", 0)
+        self.config = {
+            "version": 37,
+            "folders": [],
+            "devices": [],
+            "gui": {"enabled": True, "address": "127.0.0.1:8384", "apiKey": STUB_API_KEY},
+            "options": {"maxSendKbps": 0, "maxRecvKbps": 0, "limitBandwidthInLan": False},
+            "defaults": {"device": {}, "folder": {}},
+        }
+        for dev in fixture["devices"]:
+            public = {k: v for k, v in dev.items() if not k.startswith("_")}
+            public.setdefault("maxSendKbps", 0)
+            public.setdefault("maxRecvKbps", 0)
+            public.setdefault("numConnections", 0)
+            public.setdefault("paused", False)
+            self.config["devices"].append(public)
+            if dev["deviceID"] != STUB_LOCAL_ID:
+                self.track("devices", dev)
+        for folder in fixture["folders"]:
+            public = {k: v for k, v in folder.items() if not k.startswith("_")}
+            public.setdefault("path", f"/data/sync/{folder['id']}")
+            public.setdefault("paused", False)
+            public.setdefault("devices", [{"deviceID": d["deviceID"]} for d in self.config["devices"]])
+            self.config["folders"].append(public)
+            self.track("folders", folder)
+
+    def track(self, section: str, item: dict) -> None:
+        # Состояние симуляции объекта (fixture или добавленного через PUT /rest/config/...): `_`-поля — параметры.
+        if section == "devices":
+            self.sim.setdefault(
+                item["deviceID"],
+                {
+                    "type": item.get("_type", "tcp-client"),
+                    "in_bps": item.get("_in_bps", 0),
+                    "out_bps": item.get("_out_bps", 0),
+                    "in_total": 0.0,
+                    "out_total": 0.0,
+                },
+            )
+            return
+        self.sim.setdefault(
+            item["id"],
+            {
+                "need_bytes": item.get("_need_bytes", 0),
+                "scan_every_s": item.get("_scan_every_s", 0),
+                "scan_s": item.get("_scan_s", 0.0),
+                "scans_emitted": 0,
+                "errors": item.get("_errors", 0),
+                "burst_every_s": item.get("_burst_every_s", 0),
+                "burst_bytes": item.get("_burst_bytes", 0),
+                "bursts_emitted": 0,
+                "waiting_since": self.started if item.get("_need_bytes") else None,
+                "waits": [],
+            },
+        )
+
+    # --- симуляция ---
+
+    def _elapsed(self) -> float:
+        return max(0.0, self.clock() - self.started)
+
+    def _device_limit(self, device_id: str, key: str) -> float:
+        # Скорость с учётом лимитов (Kbps в Syncthing — KiB/s): min(собственная, устройства, глобальная).
+        rate = self.sim[device_id]["in_bps" if key == "maxRecvKbps" else "out_bps"]
+        device = self._find("devices", "deviceID", device_id) or {}
+        for limit in (device.get(key, 0), self.config["options"].get(key, 0)):
+            if limit:
+                rate = min(rate, limit * 1024)
+        return rate
+
+    def tick(self) -> None:
+        # Продвигает симуляцию до clock(): трафик копится с учётом текущих лимитов, сканы дают события.
+        now = self.clock()
+        dt = max(0.0, now - self.last_tick)
+        self.last_tick = now
+        for device in self.config["devices"]:
+            sim = self.sim.get(device["deviceID"])
+            if sim is None or device.get("paused", False):
+                continue
+            sim["in_total"] += self._device_limit(device["deviceID"], "maxRecvKbps") * dt
+            sim["out_total"] += self._device_limit(device["deviceID"], "maxSendKbps") * dt
+        self._emit_scans(now)
+        self._pull(now, dt)
+
+    def _emit_scans(self, now: float) -> None:
+        for folder in self.config["folders"]:
+            sim = self.sim[folder["id"]]
+            every = sim["scan_every_s"]
+            if not every:
+                continue
+            due = int(self._elapsed() // every)
+            while sim["scans_emitted"] < due:
+                sim["scans_emitted"] += 1
+                for frm, to, duration in (("idle", "scanning", every - sim["scan_s"]), ("scanning", "idle", sim["scan_s"])):
+                    self.events.append(
+                        {
+                            "id": len(self.events) + 1,
+                            "type": "StateChanged",
+                            "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now)),
+                            "data": {"folder": folder["id"], "from": frm, "to": to, "duration": duration},
+                        }
+                    )
+
+    def _pull(self, now: float, dt: float) -> None:
+        for folder in self.config["folders"]:
+            sim = self.sim[folder["id"]]
+            every = sim["burst_every_s"]
+            due = int(self._elapsed() // every) if every else 0
+            if due > sim["bursts_emitted"]:
+                sim["bursts_emitted"] = due
+                if not sim["need_bytes"]:
+                    sim["waiting_since"] = now
+                sim["need_bytes"] += sim["burst_bytes"]
+        if not self.pull_bps:
+            return
+        # Скорость скачивания делится между папками, которым есть что качать, по весу pullerMaxPendingKiB
+        # (остаток от докачавших — остальным).
+        active = sorted(
+            (
+                (self.sim[f["id"]], f.get("pullerMaxPendingKiB") or 1)
+                for f in self.config["folders"]
+                if not f.get("paused") and self.sim[f["id"]]["need_bytes"] > 0
+            ),
+            key=lambda pair: pair[0]["need_bytes"] / pair[1],
+        )
+        budget = self.pull_bps * dt
+        weights = sum(weight for _, weight in active)
+        for sim, weight in active:
+            take = min(sim["need_bytes"], budget * weight / weights)
+            sim["need_bytes"] -= take
+            budget -= take
+            weights -= weight
+            if sim["need_bytes"] <= 0 and sim["waiting_since"] is not None:
+                sim["waits"].append(now - sim["waiting_since"])
+                sim["waiting_since"] = None
+
+    def _find(self, section: str, key: str, value: str) -> dict | None:
+        return next((item for item in self.config[section] if item.get(key) == value), None)
+
+    # --- ответы ---
+
+    def connections(self) -> dict:
+        conns = {}
+        total_in = total_out = 0
+        for device in self.config["devices"]:
+            device_id = device["deviceID"]
+            if device_id == STUB_LOCAL_ID:
+                continue
+            sim = self.sim[device_id]
+            paused = device.get("paused", False)
+            in_total = int(sim["in_total"])
+            out_total = int(sim["out_total"])
+            total_in += in_total
+            total_out += out_total
+            conns[device_id] = {
+                "connected": not paused,
+                "paused": paused,
+                "type": "" if paused else sim["type"],
+                "address": "" if paused else "192.0.2.10:22000",
+                "clientVersion": "v1.27.0",
+                "inBytesTotal": in_total,
+                "outBytesTotal": out_total,
+            }
+        return {"connections": conns, "total": {"inBytesTotal": total_in, "outBytesTotal": total_out}}
+
+    def db_status(self, folder_id: str) -> dict | None:
+        folder = self._find("folders", "id", folder_id)
+        if folder is None:
+            return None
+        sim = self.sim[folder_id]
+        scanning = False
+        if sim["scan_every_s"]:
+            scanning = (self._elapsed() % sim["scan_every_s"]) >= sim["scan_every_s"] - sim["scan_s"]
+        state = "paused" if folder.get("paused") else ("scanning" if scanning else ("syncing" if sim["need_bytes"] else "idle"))
+        return {
+            "state": state,
+            "needBytes": int(sim["need_bytes"]),
+            "needFiles": 1 if sim["need_bytes"] else 0,
+            "globalBytes": 1_073_741_824,
+            "localBytes": 1_073_741_824 - int(sim["need_bytes"]),
+            "errors": sim["errors"],
+            "pullErrors": sim["errors"],
+        }
+
+    def stats_folder(self) -> dict:
+        now = self.clock()
+        return {
+            folder["id"]: {
+                "lastScan": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now)),
+                "lastFile": {"filename": "", "deleted": False},
+            }
+            for folder in self.config["folders"]
+        }
+
+    def events_since(self, since: int, types: set[str] | None) -> list[dict]:
+        return [e for e in self.events if e["id"] > since and (not types or e["type"] in types)]
+
+    def config_change(self) -> None:
+        self.events.append({"id": len(self.events) + 1, "type": "ConfigSaved", "data": {"version": self.config["version"]}})
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "syncthing-stub"
+    # Заголовки и тело уходят отдельными write(): без TCP_NODELAY каждый ответ ждёт delayed ACK клиента (~40ms).
+    disable_nagle_algorithm = True
+    state: StubState
+
+    def log_message(self, format: str, *args) -> None:  # noqa: A002
+        pass
+
+    def send_json(self, status: int, payload: object) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"null")
+
+    def handle_any(self, method: str) -> None:
+        parts = urlsplit(self.path)
+        query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        if self.headers.get("X-API-Key") != self.server.api_key:
+            self.send_json(HTTPStatus.FORBIDDEN, {"error": "bad api key"})
+            return
+        state = self.state
+        body = self.read_json() if method in ("PUT", "PATCH", "POST") else None
+        with state.lock:
+            state.requests.append((method, parts.path))
+            state.tick()
+            status, payload = route(state, method, parts.path, query, body)
+        self.send_json(status, payload)
+
+    def do_GET(self) -> None:
+        self.handle_any("GET")
+
+    def do_PUT(self) -> None:
+        self.handle_any("PUT")
+
+    def do_PATCH(self) -> None:
+        self.handle_any("PATCH")
+
+    def do_POST(self) -> None:
+        self.handle_any("POST")
+
+    def do_DELETE(self) -> None:
+        self.handle_any("DELETE")
+
+
+def route(state: StubState, method: str, path: str, query: dict, body) -> tuple[int, object]:
+    cfg = state.config
+    if method == "GET":
+        if path == "/rest/system/ping":
+            return HTTPStatus.OK, {"ping": "pong"}
+        if path == "/rest/system/version":
+            return HTTPStatus.OK, {"version": "v1.27.0-stub", "os": "linux", "arch": "amd64"}
+        if path == "/rest/system/status":
+            return HTTPStatus.OK, {"myID": STUB_LOCAL_ID, "uptime": int(state._elapsed())}
+        if path == "/rest/system/connections":
+            return HTTPStatus.OK, state.connections()
+        if path == "/rest/db/status":
+            status = state.db_status(query.get("folder", ""))
+            return (HTTPStatus.OK, status) if status else (HTTPStatus.NOT_FOUND, {"error": "no such folder"})
+        if path == "/rest/stats/folder":
+            return HTTPStatus.OK, state.stats_folder()
+        if path == "/rest/events":
+            types = set(filter(None, query.get("events", "").split(",")))
+            return HTTPStatus.OK, state.events_since(int(query.get("since", 0)), types or None)
+        if path == "/rest/config/insync":
+            return HTTPStatus.OK, {"configInSync": True}
+
+    rest = path[len("/rest/config") :] if path.startswith("/rest/config") else None
+    if rest is None:
+        return HTTPStatus.NOT_FOUND, {"error": f"stub: unknown {method} {path}"}
+    if rest in ("", "/"):
+        if method == "GET":
+            return HTTPStatus.OK, cfg
+        if method == "PUT":
+            state.config = body
+            for section in ("devices", "folders"):
+                for item in body.get(section) or []:
+                    state.track(section, item)
+            state.config_change()
+            return HTTPStatus.OK, None
+    segments = rest.strip("/").split("/")
+    section = segments[0]
+    key = "id" if section == "folders" else "deviceID"
+    if section == "options" or (section in ("gui", "defaults") and len(segments) == 1):
+        if method == "GET":
+            return HTTPStatus.OK, cfg[section]
+        if method in ("PUT", "PATCH"):
+            cfg[section] = body if method == "PUT" else {**cfg[section], **body}
+            state.config_change()
+            return HTTPStatus.OK, None
+    if section == "defaults" and len(segments) == 2 and segments[1] in ("folder", "device"):
+        if method == "GET":
+            return HTTPStatus.OK, cfg["defaults"].get(segments[1]) or {}
+        if method in ("PUT", "PATCH"):
+            current = cfg["defaults"].get(segments[1]) or {}
+            cfg["defaults"][segments[1]] = body if method == "PUT" else {**current, **body}
+            state.config_change()
+            return HTTPStatus.OK, None
+    if section in ("folders", "devices"):
+        if len(segments) == 1:
+            if method == "GET":
+                return HTTPStatus.OK, cfg[section]
+            if method == "PUT":
+                cfg[section] = body
+                for item in body:
+                    state.track(section, item)
+                state.config_change()
+                return HTTPStatus.OK, None
+        else:
+            item = state._find(section, key, segments[1])
+            if method == "GET":
+                return (HTTPStatus.OK, item) if item else (HTTPStatus.NOT_FOUND, {"error": "not found"})
+            if method == "PUT":
+                if item is None:
+                    cfg[section].append(body)
+                    state.track(section, body)
+                else:
+                    cfg[section][cfg[section].index(item)] = body
+                state.config_change()
+                return HTTPStatus.OK, None
+            if method == "PATCH" and item is not None:
+                item.update(copy.deepcopy(body))
+                state.config_change()
+                return HTTPStatus.OK, None
+            if method == "DELETE" and item is not None:
+                cfg[section].remove(item)
+                state.config_change()
+                return HTTPStatus.OK, None
+            return HTTPStatus.NOT_FOUND, {"error": "not found"}
+    return HTTPStatus.NOT_FOUND, {"error": f"stub: unknown {method} {path}"}
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: tuple[str, int], state: StubState, api_key: str) -> None:
+        handler = type("BoundStubHandler", (StubHandler,), {"state": state})
+        super().__init__(address, handler)
+        self.state = state
+        self.api_key = api_key
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_stub(state: StubState | None = None, *, port: int = 0, api_key: str = STUB_API_KEY) -> StubServer:
+    # Запуск в фоновом потоке (port=0 — любой свободный); остановка: server.shutdown().
+    server = StubServer(("127.0.0.1", port), state or StubState(), api_key)
+    threading.Thread(target=server.serve_forever, name="st-stub", daemon=True).start()
+    return server
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Заглушка Syncthing REST API для локальной проверки инструментов.")
+    parser.add_argument("--port", type=int, default=8399)
+    parser.add_argument("--api-key", default=STUB_API_KEY)
+    args = parser.parse_args()
+
+    server = StubServer(("127.0.0.1", args.port), StubState(), args.api_key)
+    print(f"[stub] Syncthing API stub on {server.base_url} (X-API-Key: {args.api_key})", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from config_patch import folder_type_for, node_role
+from install_stignore import PROJECT_ROOT, load_config
+from shards import expand_shards, node_root
+from st_api import API_UNAVAILABLE, SyncthingAPI, default_config_xml, read_gui_settings
+from st_ignore import CANARY_DIR
+
+# Канарейка задержки синхронизации: реальное время доставки изменения между нодами по каждой папке.
+# - Каждая нода раз в --interval секунд пишет в корень папки `.stcanary/<node>.json` с временем отправки
+#   (кроме receive-only — её изменения никуда не уходят).
+# - Каждая нода ловит пробы других нод по событиям ItemFinished REST API (--poll — по mtime файлов, без API)
+#   и записывает задержку в гистограмму пути `<src> -> <dst>` папки. Путь — от ноды-автора до ноды-получателя
+#   (wsl_a -> wsl_b считается целиком, через amvera или напрямую).
+# - Гистограммы — в JSON (--out, по умолчанию `.canary.json` рядом с config.xml); st_exporter.py отдаёт их
+#   как syncthing_canary_latency_seconds. --report печатает сводку по нескольким таким файлам.
+# Задержка считается по часам двух машин — нужен NTP; отрицательная (часы отправителя спешат) пишется как 0.
+
+BUCKETS = (0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+RECENT = 256
+STATE_NAME = ".canary.json"
+
+
+def utc_now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class Histogram:
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.last: float | None = None
+        self.last_at: float | None = None
+        # Последние значения — для точных p50/p95 в отчёте (бакеты — для Prometheus).
+        self.recent: list[float] = []
+
+    def observe(self, value: float, at: float) -> None:
+        idx = next((i for i, le in enumerate(BUCKETS) if value <= le), len(BUCKETS))
+        self.counts[idx] += 1
+        self.sum += value
+        self.count += 1
+        self.last, self.last_at = round(value, 3), round(at, 3)
+        self.recent = [*self.recent[-(RECENT - 1) :], round(value, 3)]
+
+    def quantile(self, pct: float) -> float:
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+    def to_json(self) -> dict:
+        return {
+            "counts": self.counts,
+            "sum": round(self.sum, 3),
+            "count": self.count,
+            "last_s": self.last,
+            "last_at": self.last_at,
+            "recent": self.recent,
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> Histogram:
+        hist = cls()
+        counts = data.get("counts") or []
+        if len(counts) == len(hist.counts):
+            hist.counts = [int(c) for c in counts]
+            hist.sum = float(data.get("sum") or 0)
+            hist.count = int(data.get("count") or 0)
+            hist.last = data.get("last_s")
+            hist.last_at = data.get("last_at")
+            hist.recent = [float(v) for v in data.get("recent") or []][-RECENT:]
+        return hist
+
+
+def read_probe(path: Path) -> dict | None:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        # Файл ещё не докачан/переименовывается — следующее событие его покажет.
+        return None
+    if not isinstance(data, dict) or not data.get("node") or not isinstance(data.get("sent_at"), (int, float)):
+        return None
+    return data
+
+
+def write_probe(root: Path, node: str) -> None:
+    canary = root / CANARY_DIR
+    canary.mkdir(exist_ok=True)
+    # Временный файл с префиксом .syncthing. Syncthing не сканирует — уйдёт только готовый JSON.
+    tmp = canary / f".syncthing.{node}.json.tmp"
+    tmp.write_text(json.dumps({"node": node, "sent_at": time.time()}), encoding="utf-8")
+    os.replace(tmp, canary / f"{node}.json")
+
+
+class Receiver:
+    def __init__(self, node: str, roots: dict[str, Path], out: Path) -> None:
+        self.node = node
+        self.roots = roots
+        self.out = out
+        self.lock = threading.Lock()
+        self.paths: dict[tuple[str, str], Histogram] = {}
+        self.seen: dict[tuple[str, str], float] = {}
+        self.skewed: set[str] = set()
+        self._load()
+        # Пробы, лежащие с прошлого запуска, — уже не новость.
+        for folder_id, root in roots.items():
+            for path in sorted((root / CANARY_DIR).glob("*.json")):
+                probe = read_probe(path)
+                if probe:
+                    self.seen[(folder_id, str(probe["node"]))] = float(probe["sent_at"])
+
+    def _load(self) -> None:
+        try:
+            data = json.loads(self.out.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return
+        if not isinstance(data, dict):
+            return
+        for entry in data.get("paths") or []:
+            if entry.get("dst") == self.node and entry.get("folder") in self.roots:
+                self.paths[(entry["folder"], entry["src"])] = Histogram.from_json(entry)
+
+    def check(self, folder_id: str, rel: str) -> str | None:
+        # -> строка лога, если пришла новая проба другой ноды.
+        root = self.roots.get(folder_id)
+        if root is None or not rel.startswith(f"{CANARY_DIR}/") or not rel.endswith(".json"):
+            return None
+        now = time.time()
+        probe = read_probe(root / rel)
+        if probe is None or probe["node"] == self.node:
+            return None
+        src = str(probe["node"])
+        sent_at = float(probe["sent_at"])
+        with self.lock:
+            if sent_at <= self.seen.get((folder_id, src), 0.0):
+                return None
+            self.seen[(folder_id, src)] = sent_at
+            latency = now - sent_at
+            if latency < 0 and src not in self.skewed:
+                self.skewed.add(src)
+                print(
+                    f"[canary] WARN: часы {src} спешат относительно {self.node} на {-latency:.1f}s (NTP?)",
+                    file=sys.stderr,
+                )
+            self.paths.setdefault((folder_id, src), Histogram()).observe(max(0.0, latency), now)
+        return f"{folder_id}: {src} -> {self.node} {max(0.0, latency):.1f}s"
+
+    def scan(self) -> list[str]:
+        lines = []
+        for folder_id, root in self.roots.items():
+            for path in (root / CANARY_DIR).glob("*.json"):
+                line = self.check(folder_id, f"{CANARY_DIR}/{path.name}")
+                if line:
+                    lines.append(line)
+        return lines
+
+    def to_json(self) -> dict:
+        with self.lock:
+            paths = [
+                {"folder": folder_id, "src": src, "dst": self.node, **hist.to_json()}
+                for (folder_id, src), hist in sorted(self.paths.items())
+            ]
+        return {"node": self.node, "updated_at": utc_now(), "buckets": list(BUCKETS), "paths": paths}
+
+    def save(self) -> None:
+        tmp = self.out.with_name(f".{self.out.name}.tmp-{os.getpid()}")
+        tmp.write_text(json.dumps(self.to_json(), indent=2), encoding="utf-8")
+        os.replace(tmp, self.out)
+
+
+def canary_roots(cfg: dict, node: str) -> dict[str, tuple[Path, bool]]:
+    # folder id -> (корень папки на ноде, пишет ли нода пробы).
+    nodes = cfg.get("nodes") or {}
+    if not isinstance(nodes.get(node), dict):
+        raise ValueError(f"нет nodes.{node}")
+    role = node_role(node, nodes[node])
+    roots: dict[str, tuple[Path, bool]] = {}
+    for item in expand_shards(cfg).get("folders") or []:
+        if not isinstance(item, dict) or not item.get("id"):
+            continue
+        raw = node_root(item, node)
+        if raw:
+            writable = folder_type_for(item, role) != "receiveonly"
+            roots[str(item["id"])] = (Path(os.path.expanduser(raw)), writable)
+    return roots
+
+
+def writer_loop(roots: dict[str, Path], node: str, interval: float, stop: threading.Event) -> None:
+    while not stop.is_set():
+        for folder_id, root in roots.items():
+            try:
+                write_probe(root, node)
+            except OSError as e:
+                print(f"[canary] WARN: {folder_id}: {e}", file=sys.stderr)
+        stop.wait(interval)
+
+
+def receive_events(api: SyncthingAPI, receiver: Receiver, deadline: float | None) -> None:
+    since: int | None = None
+    while deadline is None or time.monotonic() < deadline:
+        wait = 30 if deadline is None else max(1, min(30, int(deadline - time.monotonic())))
+        try:
+            if since is None:
+                # Точка отсчёта — последнее событие: старые ItemFinished не интересны.
+                last = api.get("/rest/events", since=0, limit=1, timeout=0) or []
+                since = max((e.get("id", 0) for e in last), default=0)
+            events = api.request(
+                "GET",
+                "/rest/events",
+                params={"events": "ItemFinished", "since": since, "timeout": wait},
+                timeout=wait + 10,
+            ) or []
+        except API_UNAVAILABLE as e:
+            # Syncthing перезапускается: id событий начнутся заново.
+            print(f"[canary] WARN: {e}", file=sys.stderr)
+            api.close()
+            since = None
+            time.sleep(5)
+            continue
+        changed = False
+        for event in events:
+            since = max(since, int(event.get("id", 0)))
+            data = event.get("data") or {}
+            if data.get("error") or data.get("action") != "update":
+                continue
+            line = receiver.check(str(data.get("folder") or ""), str(data.get("item") or "").replace("\\", "/"))
+            if line:
+                print(f"[canary] {line}")
+                changed = True
+        if changed:
+            receiver.save()
+
+
+def receive_poll(receiver: Receiver, interval: float, deadline: float | None) -> None:
+    while deadline is None or time.monotonic() < deadline:
+        lines = receiver.scan()
+        for line in lines:
+            print(f"[canary] {line}")
+        if lines:
+            receiver.save()
+        time.sleep(interval)
+
+
+def print_report(files: list[Path]) -> int:
+    rows = []
+    for path in files:
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            print(f"[canary] WARN: {path}: {e}", file=sys.stderr)
+            continue
+        for entry in data.get("paths") or []:
+            hist = Histogram.from_json(entry)
+            rows.append((entry.get("folder"), f"{entry.get('src')} -> {entry.get('dst')}", hist))
+    if not rows:
+        print("[canary] проб ещё не было")
+        return 1
+    for folder_id, route, hist in sorted(rows, key=lambda r: (r[0], r[1])):
+        print(
+            f"[canary] {folder_id}: {route}  n={hist.count} p50={hist.quantile(50):.1f}s "
+            f"p95={hist.quantile(95):.1f}s max={max(hist.recent, default=0):.1f}s last={hist.last or 0:.1f}s"
+        )
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="End-to-end sync latency canary: probe files + per-path histograms.")
+    parser.add_argument("--config", default=str(PROJECT_ROOT / "sync-folders.yaml"), help="Путь до sync-folders.yaml")
+    parser.add_argument("--node", help="Имя этой ноды в nodes.*")
+    parser.add_argument(
+        "--folder",
+        action="append",
+        default=[],
+        metavar="ID=PATH",
+        help="Папка и её корень вместо sync-folders.yaml (можно несколько раз; локальный тест)",
+    )
+    parser.add_argument(
+        "--config-xml",
+        default=str(default_config_xml()),
+        help="config.xml Syncthing (адрес GUI и API key)",
+    )
+    parser.add_argument("--out", help=f"JSON с гистограммами (по умолчанию {STATE_NAME} рядом с config.xml)")
+    parser.add_argument("--interval", type=float, default=60.0, help="Период записи проб, сек")
+    parser.add_argument("--no-write", action="store_true", help="Только принимать пробы других нод")
+    parser.add_argument("--poll", type=float, default=0.0, help="Принимать по mtime раз в N сек вместо событий REST API")
+    parser.add_argument("--duration", type=float, default=0.0, help="Остановиться через N сек и напечатать сводку")
+    parser.add_argument("--report", nargs="+", metavar="JSON", help="Только сводка по JSON-файлам канареек")
+    args = parser.parse_args()
+
+    if args.report:
+        return print_report([Path(p) for p in args.report])
+    if not args.node:
+        parser.error("нужен --node")
+
+    roots: dict[str, tuple[Path, bool]] = {}
+    try:
+        if args.folder:
+            for raw in args.folder:
+                folder_id, sep, path = raw.partition("=")
+                if not sep or not folder_id or not path:
+                    raise ValueError(f"--folder {raw!r}: ожидается ID=PATH")
+                roots[folder_id] = (Path(os.path.expanduser(path)), True)
+        else:
+            cfg = load_config(Path(args.config))
+            roots = canary_roots(cfg, args.node)
+    except ValueError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 2
+    if not roots:
+        print(f"[canary] у {args.node} нет папок — нечего делать", file=sys.stderr)
+        return 0
+
+    config_xml = Path(args.config_xml)
+    out = Path(args.out) if args.out else config_xml.with_name(STATE_NAME)
+    receiver = Receiver(args.node, {f: root for f, (root, _) in roots.items()}, out)
+    writable = {f: root for f, (root, w) in roots.items() if w and not args.no_write}
+    stop = threading.Event()
+    if writable:
+        threading.Thread(target=writer_loop, args=(writable, args.node, args.interval, stop), daemon=True).start()
+    print(
+        f"[canary] {args.node}: пишет {','.join(writable) or '-'} каждые {args.interval:g}s, "
+        f"принимает {','.join(receiver.roots)} ({f'poll {args.poll:g}s' if args.poll else 'REST events'})",
+        file=sys.stderr,
+    )
+
+    deadline = time.monotonic() + args.duration if args.duration > 0 else None
+    try:
+        if args.poll > 0:
+            receive_poll(receiver, args.poll, deadline)
+        else:
+            try:
+                base_url, api_key = read_gui_settings(config_xml)
+            except (OSError, ValueError) as e:
+                print(f"ERROR: {e}", file=sys.stderr)
+                return 2
+            api = SyncthingAPI(base_url, api_key)
+            try:
+                receive_events(api, receiver, deadline)
+            finally:
+                api.close()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+    receiver.save()
+    if args.duration > 0:
+        return print_report([out])
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())